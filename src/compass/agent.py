@@ -1,94 +1,422 @@
 """
 Strands Agent実装
 """
-from typing import Dict, Any, List
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Dict, Any, List, Optional
 from strands import Agent
+from strands.agent.conversation_manager import SlidingWindowConversationManager
 from strands.models.gemini import GeminiModel
-from strands.tools.mcp.mcp_client import MCPClient
 
-from config import CLIENT_ID, CLIENT_SECRET, TOKEN_URL, GATEWAY_URL, GEMINI_API_KEY, SYSTEM_PROMPT
-from utils import fetch_access_token, create_streamable_http_transport, get_full_tools_list
+from config import (
+    CLIENT_ID, CLIENT_SECRET, TOKEN_URL, GATEWAY_URL, GEMINI_API_KEY, GEMINI_MODEL_ID, SYSTEM_PROMPT,
+    TOKEN_REFRESH_MARGIN, MCP_HEALTHCHECK_INTERVAL, TOOL_CATALOG_SNAPSHOT, TOOL_CATALOG_TTL,
+    SESSION_POOL_MAX_SESSIONS, SESSION_IDLE_TTL, SESSION_MEMORY_BUDGET_MB, SESSION_HISTORY_WINDOW,
+    AGENT_INIT_TIMEOUT, RESPONSE_CACHE_ENABLED, RESPONSE_CACHE_MAX_ENTRIES, RESPONSE_CACHE_TTL,
+    RESPONSE_CACHE_TOOL_RULES, TOOL_RESULT_CACHE_TTLS, TOOL_RESULT_CACHE_STALE_SECONDS, TOOL_RESULT_CACHE_MAX_ENTRIES,
+    TOOL_PRESELECT_ENABLED, TOOL_PRESELECT_TOP_K, TOOL_PRESELECT_MIN_SCORE, TOOL_PRESELECT_PINNED
+)
+from mcp_session import PersistentMCPSession
+from response_cache import ResponseCache
+from session_pool import SessionPool
+from telemetry import TelemetryHooks, phase, record_token_usage
+from tool_cache import CachedMCPTool, ToolResultCache
+from tool_catalog import CatalogDiff, ToolCatalogCache
+from tool_index import ToolIndex, ToolSearchExpansionHooks
+from utils import (
+    TokenManager, create_streamable_http_transport, get_full_tools_list,
+    tool_definitions, tools_from_definitions
+)
 
 
 class ChatAgent:
     """Strands Agent実装（MCPクライアント版）"""
     
-    def __init__(self):
-        self.agent = None
+    def __init__(self, wait: bool = False):
+        self.sessions = None
         self.model = None
         self.mcp_client = None
+        self.mcp_session = None
+        self.token_manager = None
+        self.tool_catalog = ToolCatalogCache(TOOL_CATALOG_SNAPSHOT, ttl=TOOL_CATALOG_TTL)
         self.tools = []
-        self._initialize()
+        self.tool_index = None
+        self.response_cache = ResponseCache(
+            max_entries=RESPONSE_CACHE_MAX_ENTRIES,
+            ttl=RESPONSE_CACHE_TTL,
+            tool_rules=RESPONSE_CACHE_TOOL_RULES
+        ) if RESPONSE_CACHE_ENABLED else None
+        self.tool_result_cache = ToolResultCache(
+            TOOL_RESULT_CACHE_TTLS,
+            stale_seconds=TOOL_RESULT_CACHE_STALE_SECONDS,
+            max_entries=TOOL_RESULT_CACHE_MAX_ENTRIES
+        )
+        # 初期化状態: initializing / ready / degraded（ツールなし） / failed
+        self.state = "initializing"
+        self.init_error = None
+        self.ready = threading.Event()
+        
+        # 初期化はバックグラウンドで開始し、最初のリクエストを待たない
+        self._init_thread = threading.Thread(target=self._initialize, name="agent-init", daemon=True)
+        self._init_thread.start()
+        if wait:
+            self.wait_until_ready()
+    
+    def wait_until_ready(self, timeout: float = None) -> bool:
+        """初期化の完了を待つ（失敗・デグレードでも完了とみなす）"""
+        return self.ready.wait(timeout)
+    
+    @property
+    def is_ready(self) -> bool:
+        return self.ready.is_set() and self.state in ("ready", "degraded")
     
     def _initialize(self):
-        """エージェントを初期化"""
+        """エージェントを初期化（モデル作成とツール取得は並行して実行）"""
         try:
-            # Geminiモデルの設定
-            if not GEMINI_API_KEY:
-                raise ValueError("GEMINI_API_KEYが設定されていません")
-            
-            self.model = GeminiModel(
-                client_args={"api_key": GEMINI_API_KEY},
-                model_id="gemini-2.5-flash-lite",
-                params={
-                    "temperature": 0.7,
-                    "max_output_tokens": 2048,
-                    "top_p": 0.9,
-                    "top_k": 40
-                }
-            )
+            with ThreadPoolExecutor(max_workers=2, thread_name_prefix="agent-init") as executor:
+                model_future = executor.submit(self._create_model)
+                tools_future = executor.submit(self._load_tools)
+                
+                self.model = model_future.result()
+                try:
+                    self.tools = tools_future.result()
+                except Exception as e:
+                    # ゲートウェイが利用できなくてもツールなしで応答できるようにする
+                    print(f"⚠️ MCPツールを取得できませんでした（ツールなしで起動）: {str(e)}")
+                    self.init_error = str(e)
+                    self.tools = []
             
-            # アクセストークンを取得
-            access_token = fetch_access_token(CLIENT_ID, CLIENT_SECRET, TOKEN_URL)
-            print(f"✅ アクセストークン取得完了")
+            self._rebuild_tool_index()
+            print(f"✅ 発見されたツール: {len(self.tools)}個")
+            for tool in self.tools:
+                tool_name = getattr(tool, 'tool_name', 'Unknown')
+                tool_desc = getattr(tool, 'description', 'No description available')
+                print(f"  - {tool_name}: {tool_desc}")
             
-            # MCPクライアントを作成
-            self.mcp_client = MCPClient(lambda: create_streamable_http_transport(GATEWAY_URL, access_token))
-            
-            # MCPクライアントからツール一覧を取得
-            with self.mcp_client:
-                self.tools = get_full_tools_list(self.mcp_client)
-                print(f"✅ 発見されたツール: {len(self.tools)}個")
-                for tool in self.tools:
-                    tool_name = getattr(tool, 'tool_name', 'Unknown')
-                    tool_desc = getattr(tool, 'description', 'No description available')
-                    print(f"  - {tool_name}: {tool_desc}")
-            
-            # Strands Agentの作成
-            self.agent = Agent(
-                model=self.model,
-                system_prompt=SYSTEM_PROMPT,
-                tools=self.tools
+            # セッションごとのStrands Agentを管理するプール
+            # モデル・ツール・MCP接続は全セッションで共有する
+            self.sessions = SessionPool(
+                self._create_session_agent,
+                max_sessions=SESSION_POOL_MAX_SESSIONS,
+                idle_ttl=SESSION_IDLE_TTL,
+                memory_budget_bytes=SESSION_MEMORY_BUDGET_MB * 1024 * 1024
             )
             
-            print("✅ Strands Agent初期化完了")
+            self.state = "ready" if self.tools else "degraded"
+            print(f"✅ Strands Agent初期化完了（状態: {self.state}）")
             tool_names = [getattr(tool, 'tool_name', 'Unknown') for tool in self.tools]
             print(f"🔧 利用可能なツール: {tool_names}")
             
+            # スナップショット由来・取得失敗時のカタログは裏で再検証（成功すればツールが追加される）
+            if self.mcp_session and not self.tool_catalog.is_fresh():
+                self._revalidate_tool_catalog()
+            
         except Exception as e:
+            self.state = "failed"
+            self.init_error = str(e)
             print(f"❌ Strands Agent初期化エラー: {str(e)}")
-            raise
+        finally:
+            self.ready.set()
+    
+    def _create_model(self) -> GeminiModel:
+        """Geminiモデルを作成"""
+        if not GEMINI_API_KEY:
+            raise ValueError("GEMINI_API_KEYが設定されていません")
+        
+        return GeminiModel(
+            client_args={"api_key": GEMINI_API_KEY},
+            model_id=GEMINI_MODEL_ID,
+            params={
+                "temperature": 0.7,
+                "max_output_tokens": 2048,
+                "top_p": 0.9,
+                "top_k": 40
+            }
+        )
+    
+    def _load_tools(self) -> List[Any]:
+        """アクセストークン取得・MCPセッション確立・ツール一覧取得を行う"""
+        # 常駐MCPセッションを作成（再接続のたびに最新のトークンを使用）
+        # トークンとセッションは失敗しても後から再検証で再利用できるよう先に用意する
+        self.token_manager = TokenManager(CLIENT_ID, CLIENT_SECRET, TOKEN_URL, refresh_margin=TOKEN_REFRESH_MARGIN)
+        self.mcp_session = PersistentMCPSession(
+            lambda: create_streamable_http_transport(GATEWAY_URL, self.token_manager.get_token()),
+            healthcheck_interval=MCP_HEALTHCHECK_INTERVAL
+        )
+        self.mcp_client = self.mcp_session.client
+        
+        # スナップショットがあれば即座に使う（再検証は初期化完了後）
+        if self.tool_catalog.load_snapshot():
+            return self._wrap_tools(tools_from_definitions(self.tool_catalog.definitions, self.mcp_client))
+        
+        # アクセストークンを取得（以降は有効期限前にバックグラウンドで更新）
+        self.token_manager.get_token()
+        print(f"✅ アクセストークン取得完了")
+        
+        # MCPクライアントからツール一覧を取得
+        tools = self.mcp_session.run(lambda: get_full_tools_list(self.mcp_client))
+        self.tool_catalog.update(tool_definitions(tools))
+        return self._wrap_tools(tools)
+    
+    def _wrap_tools(self, tools: List[Any]) -> List[Any]:
+        """MCPツールに結果キャッシュ層をかぶせる"""
+        return [CachedMCPTool(tool, self.tool_result_cache) for tool in tools]
+    
+    def _create_session_agent(self, session_id: str) -> Agent:
+        """
+        セッション用のStrands Agentを作成（会話履歴・会話管理・状態を保持する）
+        ツールはターンごとに選ぶため、実行は_turn_agentで作るエージェントで行う
+        """
+        return Agent(
+            model=self.model,
+            system_prompt=SYSTEM_PROMPT,
+            conversation_manager=SlidingWindowConversationManager(window_size=SESSION_HISTORY_WINDOW)
+        )
+    
+    def _turn_agent(self, state, message: str) -> Agent:
+        """
+        このターンを実行するエージェントを作成
+        会話履歴（同じリスト）・会話管理・状態はセッションのエージェントと共有し、ツールだけ事前選択したものを渡す
+        （プールしたエージェントのツールレジストリは書き換えない）
+        """
+        session_agent = state.agent
+        return Agent(
+            model=self.model,
+            system_prompt=SYSTEM_PROMPT,
+            tools=self._select_tools(session_agent, message),
+            messages=session_agent.messages,
+            conversation_manager=session_agent.conversation_manager,
+            state=session_agent.state,
+            hooks=[TelemetryHooks(state.session_id, GEMINI_MODEL_ID), ToolSearchExpansionHooks(self._tools_mentioned_in)]
+        )
+    
+    def _rebuild_tool_index(self):
+        """カタログの内容でツール事前選択インデックスを作り直す"""
+        if TOOL_PRESELECT_ENABLED and self.tool_catalog.definitions:
+            self.tool_index = ToolIndex(self.tool_catalog.definitions)
+            unknown = self.tool_index.unknown_names(TOOL_PRESELECT_PINNED)
+            if unknown:
+                print(f"⚠️ TOOL_PRESELECT_PINNEDに一致するツールがありません: {unknown}")
+        else:
+            self.tool_index = None
+    
+    def _tools_mentioned_in(self, text: str) -> List[Any]:
+        """検索ツールの結果に含まれるツール"""
+        if self.tool_index is None:
+            return []
+        names = set(self.tool_index.find_mentioned(text))
+        return [tool for tool in self.tools if tool.tool_name in names]
+    
+    @staticmethod
+    def _recent_tool_names(agent: Agent, turns: int = 1) -> List[str]:
+        """直近のターンで呼び出したツール名（続きの質問で同じツールを使えるようにする）"""
+        names = []
+        for message in reversed(agent.messages):
+            if message.get("role") == "user" and any("text" in content for content in message.get("content", [])):
+                turns -= 1
+                if turns <= 0:
+                    break
+            for content in message.get("content", []):
+                tool_use = content.get("toolUse")
+                if tool_use:
+                    names.append(tool_use.get("name"))
+        return names
+    
+    def _select_tools(self, agent: Agent, message: str) -> List[Any]:
+        """プロンプトに関連するツールを選ぶ（事前選択が無効なら全ツール）"""
+        if self.tool_index is None:
+            return list(self.tools)
+        with phase("tool_selection"):
+            selection = self.tool_index.select(
+                message,
+                top_k=TOOL_PRESELECT_TOP_K,
+                pinned=TOOL_PRESELECT_PINNED + self._recent_tool_names(agent),
+                min_score=TOOL_PRESELECT_MIN_SCORE
+            )
+        names = set(selection.names)
+        return [tool for tool in self.tools if tool.tool_name in names]
+    
+    def _fetch_tool_definitions(self):
+        """ゲートウェイからツール定義一覧を取得"""
+        return tool_definitions(self.mcp_session.run(lambda: get_full_tools_list(self.mcp_client)))
+    
+    def _revalidate_tool_catalog(self):
+        """TTL切れ・起動直後のカタログをバックグラウンドで再検証"""
+        self.tool_catalog.revalidate_in_background(self._fetch_tool_definitions, self._apply_catalog_diff)
+    
+    def _apply_catalog_diff(self, diff: CatalogDiff):
+        """カタログの差分のみをツール一覧とエージェントに反映"""
+        definitions = {d.get("name"): d for d in self.tool_catalog.definitions}
+        updated = diff.added + diff.changed
+        new_tools = {
+            tool.tool_name: tool
+            for tool in self._wrap_tools(
+                tools_from_definitions([definitions[name] for name in updated], self.mcp_client)
+            )
+        }
+        tools = [
+            new_tools.pop(tool.tool_name, tool)
+            for tool in self.tools
+            if tool.tool_name not in diff.removed
+        ]
+        self.tools = tools + list(new_tools.values())
+        # 各セッションには次のターンから新しいツール一覧で作ったエージェントを使う
+        self._rebuild_tool_index()
+        if self.state == "degraded" and self.tools:
+            self.state = "ready"
+            print("✅ MCPツールが利用可能になりました")
+    
+    def _check_ready(self):
+        """リクエスト処理前の状態確認（問題があればエラーメッセージを返す）"""
+        if not self.ready.is_set():
+            return "エラー: エージェントの初期化が完了していません。しばらくしてから再度お試しください。"
+        if not self.sessions:
+            return f"エラー: エージェントが初期化されていません。{self.init_error or ''}"
+        if self.mcp_session and not self.tool_catalog.is_fresh():
+            self._revalidate_tool_catalog()
+        return None
+    
+    def _run_with_tools(self, func):
+        """ツールがあれば常駐MCPセッション上で、なければそのまま実行"""
+        if self.tools:
+            return self.mcp_session.run(func)
+        return func()
+    
+    def _response_cache_key(self, message: str, agent: Agent) -> Optional[str]:
+        """応答キャッシュのキー（会話履歴に依存しない最初のターンのみ対象）"""
+        if self.response_cache is None or agent.messages:
+            return None
+        return ResponseCache.make_key(message, SYSTEM_PROMPT, GEMINI_MODEL_ID, self.tool_catalog.version)
+    
+    @staticmethod
+    def _append_cached_turn(agent: Agent, message: str, response_text: str):
+        """キャッシュから返した応答も以降のターンの文脈として履歴に残す"""
+        agent.messages.append({"role": "user", "content": [{"text": message}]})
+        agent.messages.append({"role": "assistant", "content": [{"text": response_text}]})
+    
+    @staticmethod
+    def _used_tool_names(result) -> List[str]:
+        """ターン内で呼び出されたツール名"""
+        metrics = getattr(result, "metrics", None)
+        return list(getattr(metrics, "tool_metrics", None) or {})
     
     def chat(self, message: str, session_id: str = "default") -> str:
         """チャットメッセージを処理"""
         try:
-            if not self.agent:
-                return "エラー: エージェントが初期化されていません。"
+            self.wait_until_ready(AGENT_INIT_TIMEOUT)
+            error = self._check_ready()
+            if error:
+                return error
             
-            # MCPクライアントのコンテキスト内でエージェントを実行
-            with self.mcp_client:
-                result = self.agent(message)
-                response_text = str(result)
+            with self.sessions.session(session_id) as state:
+                agent = state.agent
+                
+                cache_key = self._response_cache_key(message, agent)
+                if cache_key:
+                    cached = self.response_cache.get(cache_key)
+                    if cached is not None:
+                        self._append_cached_turn(agent, message, cached)
+                        return cached
+                
+                turn_agent = self._turn_agent(state, message)
+                
+                # 常駐MCPセッション上でエージェントを実行
+                # 再接続して再試行する場合は、失敗したターンの履歴を巻き戻してから実行する
+                history_length = len(agent.messages)
+                
+                def run_turn():
+                    del agent.messages[history_length:]
+                    return turn_agent(message)
+                
+                with phase("turn", **{"session.id": session_id}) as span:
+                    result = self._run_with_tools(run_turn)
+                    record_token_usage(span, getattr(result.metrics, "accumulated_usage", None))
+                with phase("response_serialization", **{"session.id": session_id}):
+                    response_text = str(result)
+                if cache_key:
+                    self.response_cache.put(cache_key, response_text, self._used_tool_names(result))
                 return response_text
             
         except Exception as e:
             return f"チャット処理中にエラーが発生しました: {str(e)}"
     
+    async def stream(self, message: str, session_id: str = "default") -> AsyncIterator[Dict[str, Any]]:
+        """チャットメッセージを処理し、トークンとツール実行状況を逐次返す"""
+        await asyncio.to_thread(self.wait_until_ready, AGENT_INIT_TIMEOUT)
+        error = self._check_ready()
+        if error:
+            yield {"type": "error", "error": error}
+            return
+        
+        session_acquired = False
+        try:
+            async with self.sessions.asession(session_id) as state:
+                # 出力済みのトークンは取り消せないため、再接続は開始前の確認のみ行う
+                # ターンの間はMCPセッションを利用中にして、ほかの会話のエラーで再接続されないようにする
+                # （chatと同じく会話のロックを取ってから利用中にする）
+                if self.tools:
+                    await asyncio.to_thread(self.mcp_session.acquire)
+                    session_acquired = True
+                
+                cache_key = self._response_cache_key(message, state.agent)
+                if cache_key:
+                    cached = self.response_cache.get(cache_key)
+                    if cached is not None:
+                        self._append_cached_turn(state.agent, message, cached)
+                        yield {"type": "text", "data": cached}
+                        yield {"type": "done", "result": cached, "cached": True}
+                        return
+                
+                turn_agent = self._turn_agent(state, message)
+                started_tools = {}
+                # ターン全体を現在のスパンにして、モデル・ツール呼び出しのスパンをその子にする
+                # （失敗・中断したターンもエラーとして記録される）
+                with phase("turn", stream=True, **{"session.id": session_id}) as span:
+                    async for event in turn_agent.stream_async(message):
+                        if "data" in event:
+                            yield {"type": "text", "data": event["data"]}
+                        elif "current_tool_use" in event:
+                            tool_use = event["current_tool_use"]
+                            tool_use_id = tool_use.get("toolUseId")
+                            if tool_use_id and tool_use_id not in started_tools:
+                                started_tools[tool_use_id] = tool_use.get("name")
+                                yield {"type": "tool_start", "tool": tool_use.get("name")}
+                        elif "message" in event and event["message"].get("role") == "user":
+                            # ツール実行結果はuserロールのメッセージとして届く
+                            for content in event["message"].get("content", []):
+                                tool_result = content.get("toolResult")
+                                if tool_result:
+                                    yield {
+                                        "type": "tool_end",
+                                        "tool": started_tools.get(tool_result.get("toolUseId")),
+                                        "status": tool_result.get("status")
+                                    }
+                        elif "result" in event:
+                            record_token_usage(span, getattr(event["result"].metrics, "accumulated_usage", None))
+                            response_text = str(event["result"])
+                            if cache_key:
+                                self.response_cache.put(cache_key, response_text, started_tools.values())
+                            yield {"type": "done", "result": response_text}
+        
+        except Exception as e:
+            yield {"type": "error", "error": f"チャット処理中にエラーが発生しました: {str(e)}"}
+        finally:
+            if session_acquired:
+                self.mcp_session.release()
+    
     def get_status(self) -> Dict[str, Any]:
         """エージェント状態を取得"""
         return {
+            "state": self.state,
+            "init_error": self.init_error,
             "gateway_url": GATEWAY_URL,
             "client_configured": bool(CLIENT_ID and CLIENT_SECRET),
             "mcp_client_configured": self.mcp_client is not None,
-            "available_tools": [getattr(tool, 'tool_name', 'Unknown') for tool in self.tools]
+            "mcp_session": self.mcp_session.get_status() if self.mcp_session else None,
+            "available_tools": [getattr(tool, 'tool_name', 'Unknown') for tool in self.tools],
+            "tool_catalog_version": self.tool_catalog.version,
+            "sessions": self.sessions.get_status() if self.sessions else None,
+            "response_cache": self.response_cache.get_stats() if self.response_cache else None,
+            "tool_result_cache": self.tool_result_cache.get_stats()
         }
@@ -1,6 +1,7 @@
 """
 設定ファイル
 """
+import json
 import os
 
 # AWS AgentCore Gateway設定
@@ -8,9 +9,55 @@ CLIENT_ID = os.getenv("CLIENT_ID")
 CLIENT_SECRET = os.getenv("CLIENT_SECRET")
 TOKEN_URL = os.getenv("TOKEN_URL")
 GATEWAY_URL = os.getenv("GATEWAY_URL")
+# 有効期限の何秒前にアクセストークンを更新するか
+TOKEN_REFRESH_MARGIN = int(os.getenv("TOKEN_REFRESH_MARGIN", "300"))
+# この秒数以上使われていないMCPセッションは利用前に死活確認する
+MCP_HEALTHCHECK_INTERVAL = int(os.getenv("MCP_HEALTHCHECK_INTERVAL", "60"))
+
+# ツールカタログのキャッシュ設定（スナップショットはイメージに同梱したファイルも指定可能）
+TOOL_CATALOG_SNAPSHOT = os.getenv("TOOL_CATALOG_SNAPSHOT", "/tmp/compass_tool_catalog.json")
+TOOL_CATALOG_TTL = int(os.getenv("TOOL_CATALOG_TTL", "600"))
+
+# 初期化完了を待つ最大秒数（超えた場合はエラーを返す）
+AGENT_INIT_TIMEOUT = int(os.getenv("AGENT_INIT_TIMEOUT", "60"))
+
+# セッションプール設定
+SESSION_POOL_MAX_SESSIONS = int(os.getenv("SESSION_POOL_MAX_SESSIONS", "100"))
+SESSION_IDLE_TTL = int(os.getenv("SESSION_IDLE_TTL", "1800"))
+SESSION_MEMORY_BUDGET_MB = int(os.getenv("SESSION_MEMORY_BUDGET_MB", "256"))
+# 1セッションで保持する会話履歴のメッセージ数
+SESSION_HISTORY_WINDOW = int(os.getenv("SESSION_HISTORY_WINDOW", "40"))
+
+# 応答キャッシュ設定（既定は無効）
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "false").lower() == "true"
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "256"))
+RESPONSE_CACHE_TTL = int(os.getenv("RESPONSE_CACHE_TTL", "300"))
+# ツールごとのキャッシュ可否（"*"は未指定ツールの既定値）。個人に依存する結果を返すツールはfalseにする
+RESPONSE_CACHE_TOOL_RULES = json.loads(os.getenv(
+    "RESPONSE_CACHE_TOOL_RULES",
+    '{"*": false, "x_amz_bedrock_agentcore_search": true, "get_bigquery": true}'
+))
+
+# ツール結果キャッシュ設定（ツール名 -> TTL秒。記載のないツールはキャッシュしない）
+TOOL_RESULT_CACHE_TTLS = json.loads(os.getenv("TOOL_RESULT_CACHE_TTLS", '{"get_bigquery": 3600}'))
+# TTL切れ後もこの秒数までは古い結果を返しつつバックグラウンドで更新する
+TOOL_RESULT_CACHE_STALE_SECONDS = int(os.getenv("TOOL_RESULT_CACHE_STALE_SECONDS", "600"))
+TOOL_RESULT_CACHE_MAX_ENTRIES = int(os.getenv("TOOL_RESULT_CACHE_MAX_ENTRIES", "512"))
+
+# ツール事前選択設定（プロンプトに関連する上位のツールのみをモデルに渡す）
+TOOL_PRESELECT_ENABLED = os.getenv("TOOL_PRESELECT_ENABLED", "true").lower() == "true"
+TOOL_PRESELECT_TOP_K = int(os.getenv("TOOL_PRESELECT_TOP_K", "5"))
+# 最上位のスコアがこの値未満なら検索ツール（x_amz_bedrock_agentcore_search）に任せる
+TOOL_PRESELECT_MIN_SCORE = float(os.getenv("TOOL_PRESELECT_MIN_SCORE", "0.5"))
+# 常にモデルに渡すツール名（ゲートウェイの接頭辞xxx___は省略可）
+TOOL_PRESELECT_PINNED = json.loads(os.getenv("TOOL_PRESELECT_PINNED", "[]"))
+
+# テレメトリをJSON Linesで追記するファイル（オフライン分析用。未設定なら出力しない）
+TELEMETRY_LOCAL_EXPORT = os.getenv("TELEMETRY_LOCAL_EXPORT")
 
 # Gemini API設定
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+GEMINI_MODEL_ID = os.getenv("GEMINI_MODEL_ID", "gemini-2.5-flash-lite")
 
 # システムプロンプト
 SYSTEM_PROMPT = """あなたは日本語で対応するチャットアシスタントです。
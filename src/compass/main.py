@@ -1,7 +1,10 @@
 """
 Bedrock AgentCore Starter Toolkit用のエージェント
 """
+import threading
+
 from bedrock_agentcore import BedrockAgentCoreApp
+from bedrock_agentcore.runtime.models import PingStatus
 from agent import ChatAgent
 
 # Bedrock AgentCore アプリケーション
@@ -9,16 +12,25 @@ app = BedrockAgentCoreApp()
 
 # グローバルエージェントインスタンス
 _agent_instance = None
+_agent_lock = threading.Lock()
 
 def get_agent() -> ChatAgent:
-    """エージェントインスタンスを取得"""
+    """エージェントインスタンスを取得（初期化はバックグラウンドで進む）"""
     global _agent_instance
-    if _agent_instance is None:
-        _agent_instance = ChatAgent()
+    with _agent_lock:
+        if _agent_instance is None:
+            _agent_instance = ChatAgent()
     return _agent_instance
 
+@app.ping
+def ping():
+    """ヘルスチェック（初期化が終わるまではビジーとして扱う）"""
+    if _agent_instance is not None and _agent_instance.is_ready:
+        return PingStatus.HEALTHY
+    return PingStatus.HEALTHY_BUSY
+
 @app.entrypoint
-def invoke(payload):
+def invoke(payload, context):
     """Bedrock AgentCore用のエントリーポイント"""
     try:
         # エージェントを取得
@@ -27,8 +39,15 @@ def invoke(payload):
         # プロンプトを取得
         user_message = payload.get("prompt", "Hello! How can I help you today?")
         
+        # ランタイムセッションIDごとに会話状態を分ける
+        session_id = getattr(context, "session_id", None) or payload.get("session_id", "default")
+        
+        # ストリーミング指定時は非同期ジェネレータを返す（SSEとして逐次送信される）
+        if payload.get("stream"):
+            return agent.stream(user_message, session_id=session_id)
+        
         # エージェントに送信
-        result = agent.chat(user_message)
+        result = agent.chat(user_message, session_id=session_id)
         
         return {"result": result}
         
@@ -42,6 +61,7 @@ def main():
     
     # エージェント初期化
     agent = get_agent()
+    agent.wait_until_ready()
     
     # エージェント状態確認
     status = agent.get_status()
@@ -78,4 +98,6 @@ def main():
             input()
 
 if __name__ == "__main__":
+    # コンテナ起動時に初期化を開始し、最初のリクエストを待たずにウォームアップする
+    get_agent()
     app.run()
@@ -0,0 +1,180 @@
+"""
+MCPセッション管理
+"""
+import atexit
+import threading
+import time
+
+import anyio
+import httpx
+from strands.tools.mcp.mcp_client import MCPClient
+from strands.types.exceptions import MCPClientInitializationError
+
+from telemetry import phase
+
+# 再接続で回復が見込めるトランスポート系の例外
+TRANSPORT_ERRORS = (
+    MCPClientInitializationError,
+    httpx.TransportError,
+    anyio.ClosedResourceError,
+    anyio.BrokenResourceError,
+    ConnectionError,
+    TimeoutError,
+)
+
+
+class PersistentMCPSession:
+    """
+    MCPClientのセッションをプロセス内で常駐させ、切断時に再接続する
+
+    MCPClientはセッションプール内の全会話で共有するため、利用中のターン数と接続の世代を管理し、
+    再接続はほかのターンが使い終わってから行う（1つのターンのエラーで他のターンを巻き込まない）。
+    """
+
+    def __init__(self, transport_factory, healthcheck_interval: int = 60, reconnect_wait: float = 30.0):
+        self.client = MCPClient(transport_factory)
+        self.healthcheck_interval = healthcheck_interval
+        self.reconnect_wait = reconnect_wait
+        self._lock = threading.RLock()
+        self._idle = threading.Condition(self._lock)
+        self._active = False
+        self._last_used = 0.0
+        self._reconnects = 0
+        # 利用中のターン数と接続の世代（再接続のたびに増える）
+        self._in_use = 0
+        self._generation = 0
+        self._reconnecting = False
+        atexit.register(self.close)
+
+    @property
+    def active(self) -> bool:
+        return self._active
+
+    def start(self):
+        """セッションを開始（initializeハンドシェイクはここで1回だけ行う）"""
+        with self._lock:
+            if self._active:
+                return
+            with phase("mcp_handshake", reconnect=self._reconnects > 0):
+                self.client.start()
+            self._active = True
+            self._last_used = time.monotonic()
+            print("🔌 MCPセッションを開始しました")
+
+    def restart(self):
+        """セッションを張り直す（ツールは同じMCPClientを参照し続ける）"""
+        with self._lock:
+            self._stop_locked()
+            self._reconnects += 1
+            self._generation += 1
+            print(f"🔄 MCPセッションを再接続します（{self._reconnects}回目）")
+            self.start()
+
+    def ensure(self):
+        """セッションが利用可能な状態であることを保証する"""
+        with self._lock:
+            if not self._active:
+                self.start()
+                return
+            # 利用中のターンがあれば接続は使われているため死活確認は不要（再接続で巻き込まない）
+            if self._in_use:
+                return
+            # しばらく使われていなければ軽量な呼び出しで死活確認
+            if time.monotonic() - self._last_used < self.healthcheck_interval:
+                return
+            try:
+                self.client.list_tools_sync()
+                self._last_used = time.monotonic()
+            except Exception as e:
+                print(f"⚠️ MCPセッションのヘルスチェックに失敗: {str(e)}")
+                self.restart()
+
+    def acquire(self) -> int:
+        """
+        ターンの開始時に呼び、セッションを利用中にする（終了時にrelease()を呼ぶ）
+
+        Returns:
+            int: 利用を開始した接続の世代
+        """
+        with self._idle:
+            # 再接続の待機中は新しいターンを開始させない
+            while self._reconnecting:
+                self._idle.wait()
+            self.ensure()
+            self._in_use += 1
+            return self._generation
+
+    def release(self):
+        """acquire()したターンの終了"""
+        with self._idle:
+            self._in_use -= 1
+            self._last_used = time.monotonic()
+            self._idle.notify_all()
+
+    def _reconnect_after(self, generation: int) -> bool:
+        """
+        generation世代の接続で起きたトランスポートエラーから回復する
+
+        ほかのターンがすでに再接続していればそのまま使い、そうでなければ
+        利用中のターンが終わるのを待ってから再接続します。
+
+        Returns:
+            bool: 再試行できる状態になったか（待ち時間内に他のターンが終わらなければFalse）
+        """
+        with self._idle:
+            while self._reconnecting:
+                self._idle.wait()
+            if self._generation != generation:
+                return True
+            self._reconnecting = True
+            try:
+                if not self._idle.wait_for(lambda: self._in_use == 0, timeout=self.reconnect_wait):
+                    print("⚠️ ほかの会話がMCPセッションを利用中のため再接続を見送りました")
+                    return False
+                self.restart()
+                return True
+            finally:
+                self._reconnecting = False
+                self._idle.notify_all()
+
+    def run(self, func):
+        """セッション上で処理を実行し、トランスポートエラー時は再接続して1回だけ再試行"""
+        generation = self.acquire()
+        try:
+            return func()
+        except TRANSPORT_ERRORS as e:
+            print(f"⚠️ MCPトランスポートエラー: {str(e)}")
+            error = e
+        finally:
+            self.release()
+
+        if not self._reconnect_after(generation):
+            raise error
+        self.acquire()
+        try:
+            return func()
+        finally:
+            self.release()
+
+    def close(self):
+        """セッションを終了（プロセス終了時にも呼ばれる）"""
+        with self._lock:
+            self._stop_locked()
+
+    def _stop_locked(self):
+        if not self._active:
+            return
+        self._active = False
+        try:
+            self.client.stop(None, None, None)
+            print("🔌 MCPセッションを終了しました")
+        except Exception as e:
+            print(f"⚠️ MCPセッション終了時のエラー: {str(e)}")
+
+    def get_status(self):
+        return {
+            "active": self._active,
+            "reconnects": self._reconnects,
+            "in_use": self._in_use,
+            "generation": self._generation,
+        }
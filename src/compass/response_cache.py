@@ -0,0 +1,93 @@
+"""
+繰り返し質問への応答キャッシュ
+"""
+import hashlib
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional
+
+_WHITESPACE = re.compile(r"\s+")
+_TRAILING_PUNCTUATION = re.compile(r"[?!.。！？、]+$")
+
+
+def normalize_prompt(prompt: str) -> str:
+    """表記ゆれ（全角半角・大文字小文字・空白・末尾の記号）を吸収"""
+    text = unicodedata.normalize("NFKC", prompt).lower()
+    text = _WHITESPACE.sub(" ", text).strip()
+    return _TRAILING_PUNCTUATION.sub("", text)
+
+
+def tool_rule_name(tool_name: str) -> str:
+    """ゲートウェイのターゲット接頭辞（xxx___）を除いたツール名"""
+    return tool_name.split("___", 1)[-1]
+
+
+class ResponseCache:
+    """TTLと件数上限つきの応答キャッシュ（LRUで破棄）"""
+
+    def __init__(self, max_entries: int = 256, ttl: int = 300, tool_rules: Optional[Dict[str, bool]] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        # ツール名 -> キャッシュ可否（"*" は未指定ツールの既定値）
+        self.tool_rules = tool_rules or {}
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.skips = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(prompt: str, system_prompt: str, model_id: str, catalog_version: Optional[str]) -> str:
+        material = "\x1f".join([normalize_prompt(prompt), system_prompt, model_id, catalog_version or ""])
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def is_cacheable(self, tool_names: Iterable[str]) -> bool:
+        """ターン内で使われた全ツールがキャッシュ可能か判定"""
+        default = self.tool_rules.get("*", False)
+        for name in tool_names:
+            rule = self.tool_rules.get(name, self.tool_rules.get(tool_rule_name(name), default))
+            if not rule:
+                return False
+        return True
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.monotonic() > entry[1]:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: str, response: str, tool_names: Iterable[str] = ()) -> bool:
+        """キャッシュ可能な応答のみ保存"""
+        if not self.is_cacheable(tool_names):
+            self.skips += 1
+            return False
+        with self._lock:
+            self._entries[key] = (response, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            self.stores += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return True
+
+    def get_stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "stores": self.stores,
+                "skips": self.skips,
+                "evictions": self.evictions,
+            }
@@ -0,0 +1,144 @@
+"""
+セッションごとの会話状態プール
+"""
+import asyncio
+import json
+import threading
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager, contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict
+
+
+@dataclass
+class SessionState:
+    """1セッション分の会話状態"""
+    session_id: str
+    agent: Any
+    last_used: float = field(default_factory=time.monotonic)
+    size_bytes: int = 0
+    lock: threading.Lock = field(default_factory=threading.Lock)
+    # 取得してから解放するまでの利用数（0より大きい間は破棄しない）
+    in_use: int = 0
+
+
+def estimate_history_size(agent) -> int:
+    """エージェントの会話履歴のおおよそのサイズ（バイト）"""
+    try:
+        return len(json.dumps(agent.messages, ensure_ascii=False, default=str).encode("utf-8"))
+    except Exception:
+        return 0
+
+
+class SessionPool:
+    """ランタイムセッションIDごとのエージェントをLRU・アイドル時間・メモリ上限で管理する"""
+
+    def __init__(self, factory: Callable[[str], Any], max_sessions: int = 100,
+                 idle_ttl: int = 1800, memory_budget_bytes: int = 256 * 1024 * 1024):
+        self._factory = factory
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.memory_budget_bytes = memory_budget_bytes
+        self._sessions: "OrderedDict[str, SessionState]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._evictions = 0
+
+    def _pin_locked(self, state: SessionState) -> SessionState:
+        state.in_use += 1
+        state.last_used = time.monotonic()
+        self._sessions.move_to_end(state.session_id)
+        return state
+
+    def _get_or_create(self, session_id: str) -> SessionState:
+        """セッションを取得して利用中にする（ロック待ちの間に破棄されないようにする）"""
+        with self._lock:
+            state = self._sessions.get(session_id)
+            if state is not None:
+                return self._pin_locked(state)
+        # エージェントの作成中に他のセッションを止めないよう、プールのロックの外で作成する
+        agent = self._factory(session_id)
+        with self._lock:
+            # 同じIDで先に作成された場合はそちらを使う（同一セッションを1つのエージェントで直列化する）
+            state = self._sessions.get(session_id)
+            if state is None:
+                state = SessionState(session_id=session_id, agent=agent)
+                self._sessions[session_id] = state
+            return self._pin_locked(state)
+
+    def _unpin(self, state: SessionState):
+        with self._lock:
+            state.in_use -= 1
+            state.last_used = time.monotonic()
+            self._evict_locked(keep=state.session_id)
+
+    def _release(self, state: SessionState):
+        state.size_bytes = estimate_history_size(state.agent)
+        state.lock.release()
+        self._unpin(state)
+
+    @contextmanager
+    def session(self, session_id: str):
+        """セッションを取得し、利用中は同一セッションへの同時実行を直列化する"""
+        state = self._get_or_create(session_id)
+        try:
+            state.lock.acquire()
+        except BaseException:
+            self._unpin(state)
+            raise
+        try:
+            yield state
+        finally:
+            self._release(state)
+
+    @asynccontextmanager
+    async def asession(self, session_id: str):
+        """session()の非同期版（ロック待ちでイベントループを止めない）"""
+        state = self._get_or_create(session_id)
+        acquiring = asyncio.ensure_future(asyncio.to_thread(state.lock.acquire))
+        try:
+            await asyncio.shield(acquiring)
+        except asyncio.CancelledError:
+            # ロック待ちのスレッドは止められないため、取得した時点で解放する
+            acquiring.add_done_callback(lambda _: self._release(state))
+            raise
+        try:
+            yield state
+        finally:
+            self._release(state)
+
+    def _evict_locked(self, keep: str):
+        """アイドル時間・件数・メモリ上限を超えたセッションを古い順に破棄"""
+        now = time.monotonic()
+        for session_id, state in list(self._sessions.items()):
+            if session_id != keep and not state.in_use and now - state.last_used > self.idle_ttl:
+                self._drop_locked(session_id, "アイドル")
+
+        total = sum(state.size_bytes for state in self._sessions.values())
+        for session_id, state in list(self._sessions.items()):
+            if len(self._sessions) <= self.max_sessions and total <= self.memory_budget_bytes:
+                break
+            if session_id == keep or state.in_use:
+                continue
+            total -= state.size_bytes
+            self._drop_locked(session_id, "LRU")
+
+    def _drop_locked(self, session_id: str, reason: str):
+        self._sessions.pop(session_id, None)
+        self._evictions += 1
+        print(f"🧹 セッションを破棄しました（{reason}）: {session_id[:8]}...")
+
+    def for_each_agent(self, func: Callable[[Any], None]):
+        """プール内の全エージェントに処理を適用（ツール更新など）"""
+        with self._lock:
+            states = list(self._sessions.values())
+        for state in states:
+            func(state.agent)
+
+    def get_status(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "history_bytes": sum(state.size_bytes for state in self._sessions.values()),
+                "evictions": self._evictions,
+            }
@@ -0,0 +1,187 @@
+"""
+エージェント処理のフェーズ別スパン・メトリクス
+"""
+import json
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+
+from opentelemetry import metrics, trace
+from opentelemetry.trace import Status, StatusCode
+from strands.hooks import (
+    AfterModelCallEvent, AfterToolCallEvent, BeforeModelCallEvent, BeforeToolCallEvent,
+    HookProvider, HookRegistry
+)
+
+from config import TELEMETRY_LOCAL_EXPORT
+
+_tracer = trace.get_tracer("compass")
+_meter = metrics.get_meter("compass")
+_phase_duration = _meter.create_histogram(
+    "compass.phase.duration",
+    unit="ms",
+    description="エージェント処理のフェーズ別所要時間"
+)
+_token_usage = _meter.create_histogram(
+    "compass.llm.tokens",
+    unit="{token}",
+    description="1ターンあたりのトークン数"
+)
+_export_lock = threading.Lock()
+
+
+def _clean(attributes: Dict[str, Any]) -> Dict[str, Any]:
+    """OpenTelemetryの属性として渡せない値（None）を除外"""
+    return {key: value for key, value in attributes.items() if value is not None}
+
+
+def _metric_attributes(name: str, attributes: Dict[str, Any], error: bool) -> Dict[str, Any]:
+    """
+    ヒストグラムに付ける属性（値の種類が限られるものだけ）
+    session.idなどを付けるとセッションごとに系列が増え続けるため、スパンにだけ付ける
+    """
+    metric_attributes = {"phase": name, "error": error}
+    if "tool.name" in attributes:
+        metric_attributes["tool.name"] = attributes["tool.name"]
+    return metric_attributes
+
+
+def _export_local(name: str, start_ns: int, end_ns: int, attributes: Dict[str, Any], error: Optional[str]):
+    """ローカルエクスポートモード: JSON Linesとしてファイルに追記"""
+    if not TELEMETRY_LOCAL_EXPORT:
+        return
+    record = {
+        "phase": name,
+        "start_ns": start_ns,
+        "duration_ms": (end_ns - start_ns) / 1e6,
+        "attributes": attributes,
+        "error": error,
+    }
+    try:
+        with _export_lock, open(TELEMETRY_LOCAL_EXPORT, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+    except Exception as e:
+        print(f"⚠️ テレメトリのローカル出力に失敗: {str(e)}")
+
+
+def record_phase(name: str, start_ns: int, end_ns: int, error: BaseException = None, **attributes):
+    """開始・終了時刻が分かっているフェーズをスパンとヒストグラムに記録"""
+    attributes = _clean(attributes)
+    span = _tracer.start_span(f"compass.{name}", start_time=start_ns, attributes=attributes)
+    if error is not None:
+        span.record_exception(error)
+        span.set_status(Status(StatusCode.ERROR, str(error)))
+    span.end(end_time=end_ns)
+    _phase_duration.record((end_ns - start_ns) / 1e6, _metric_attributes(name, attributes, error is not None))
+    _export_local(name, start_ns, end_ns, attributes, str(error) if error is not None else None)
+
+
+@contextmanager
+def phase(name: str, **attributes):
+    """with文で囲んだ処理を1フェーズとして計測（スパンは現在のコンテキストの子になる）"""
+    attributes = _clean(attributes)
+    start_ns = time.time_ns()
+    error = None
+    with _tracer.start_as_current_span(f"compass.{name}", attributes=attributes) as span:
+        try:
+            yield span
+        except BaseException as e:
+            error = e
+            span.set_status(Status(StatusCode.ERROR, str(e)))
+            raise
+        finally:
+            end_ns = time.time_ns()
+            _phase_duration.record((end_ns - start_ns) / 1e6, _metric_attributes(name, attributes, error is not None))
+            _export_local(name, start_ns, end_ns, attributes, str(error) if error is not None else None)
+
+
+def record_token_usage(span, usage: Optional[Dict[str, int]]):
+    """ターンのトークン使用量をスパン属性とヒストグラムに記録（ヒストグラムの属性はトークンの種類のみ）"""
+    if not usage:
+        return
+    for key, kind in (("inputTokens", "input"), ("outputTokens", "output")):
+        if key in usage:
+            span.set_attribute(f"gen_ai.usage.{kind}_tokens", usage[key])
+            _token_usage.record(usage[key], {"token_type": kind})
+
+
+class TelemetryHooks(HookProvider):
+    """Strands Agentのモデル呼び出し・ツール呼び出しごとにスパンを記録する"""
+
+    def __init__(self, session_id: str, model_id: str):
+        self.session_id = session_id
+        self.model_id = model_id
+        self._model_start_ns = None
+        self._tool_start_ns: Dict[str, int] = {}
+
+    def register_hooks(self, registry: HookRegistry, **kwargs):
+        registry.add_callback(BeforeModelCallEvent, self._before_model_call)
+        registry.add_callback(AfterModelCallEvent, self._after_model_call)
+        registry.add_callback(BeforeToolCallEvent, self._before_tool_call)
+        registry.add_callback(AfterToolCallEvent, self._after_tool_call)
+
+    def _before_model_call(self, event: BeforeModelCallEvent):
+        self._model_start_ns = time.time_ns()
+
+    def _after_model_call(self, event: AfterModelCallEvent):
+        if self._model_start_ns is None:
+            return
+        stop_response = getattr(event, "stop_response", None)
+        record_phase(
+            "llm_call",
+            self._model_start_ns,
+            time.time_ns(),
+            error=getattr(event, "exception", None),
+            **{
+                "session.id": self.session_id,
+                "gen_ai.request.model": self.model_id,
+                "gen_ai.response.finish_reason": str(stop_response.stop_reason) if stop_response else None,
+            }
+        )
+        self._model_start_ns = None
+
+    def _before_tool_call(self, event: BeforeToolCallEvent):
+        self._tool_start_ns[event.tool_use["toolUseId"]] = time.time_ns()
+
+    def _after_tool_call(self, event: AfterToolCallEvent):
+        start_ns = self._tool_start_ns.pop(event.tool_use["toolUseId"], None)
+        if start_ns is None:
+            return
+        result = event.result or {}
+        record_phase(
+            "tool_call",
+            start_ns,
+            time.time_ns(),
+            error=getattr(event, "exception", None),
+            **{
+                "session.id": self.session_id,
+                "tool.name": event.tool_use.get("name"),
+                "tool.status": result.get("status"),
+            }
+        )
+
+
+def summarize(path: str):
+    """ローカル出力したJSON Linesからフェーズ別の所要時間を集計して表示"""
+    durations: Dict[str, list] = {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            record = json.loads(line)
+            key = record["phase"]
+            tool_name = record.get("attributes", {}).get("tool.name")
+            if tool_name:
+                key = f"{key}:{tool_name}"
+            durations.setdefault(key, []).append(record["duration_ms"])
+
+    print(f"{'phase':<48}{'count':>7}{'p50(ms)':>10}{'p95(ms)':>10}{'max(ms)':>10}")
+    for key, values in sorted(durations.items()):
+        values.sort()
+        p50 = values[int(len(values) * 0.5)]
+        p95 = values[min(int(len(values) * 0.95), len(values) - 1)]
+        print(f"{key:<48}{len(values):>7}{p50:>10.1f}{p95:>10.1f}{values[-1]:>10.1f}")
+
+
+if __name__ == "__main__":
+    summarize(sys.argv[1] if len(sys.argv) > 1 else TELEMETRY_LOCAL_EXPORT)
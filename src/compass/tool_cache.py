@@ -0,0 +1,225 @@
+"""
+MCPツール呼び出し結果のキャッシュ
+"""
+import asyncio
+import copy
+import json
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Dict, Optional, Tuple
+
+from strands.types.tools import AgentTool
+
+try:
+    from strands.types._events import ToolResultEvent
+except ImportError:
+    # 古いstrandsではツール結果をそのままyieldする
+    ToolResultEvent = None
+
+
+def _extract_result(event) -> Optional[Dict[str, Any]]:
+    """ツールのストリームイベントから最終結果（ToolResult）を取り出す"""
+    if ToolResultEvent is not None and isinstance(event, ToolResultEvent):
+        return event.tool_result
+    if isinstance(event, dict) and "toolUseId" in event and "status" in event:
+        return event
+    return None
+
+
+def _payload_has_error(payload: Any) -> bool:
+    """Lambdaの応答（statusCodeが2xx以外、またはerrorフィールドを含む）かどうか"""
+    if isinstance(payload, str):
+        try:
+            payload = json.loads(payload)
+        except ValueError:
+            return False
+    if not isinstance(payload, dict):
+        return False
+    status_code = payload.get("statusCode")
+    if isinstance(status_code, int) and not 200 <= status_code < 300:
+        return True
+    if payload.get("error"):
+        return True
+    return "body" in payload and _payload_has_error(payload["body"])
+
+
+def _is_cacheable(result: Optional[Dict[str, Any]]) -> bool:
+    """成功した結果のみキャッシュする（ツール自体は成功でも、本文がエラー応答なら除く）"""
+    if result is None or result.get("status") != "success":
+        return False
+    for content in result.get("content") or []:
+        if _payload_has_error(content.get("json", content.get("text"))):
+            return False
+    return not _payload_has_error(result.get("structuredContent"))
+
+
+def _result_event(result: Dict[str, Any]):
+    return ToolResultEvent(result) if ToolResultEvent is not None else result
+
+
+class ToolResultCache:
+    """ツール名＋正規化した引数をキーに、ツールごとのTTLで結果を保持する"""
+
+    def __init__(self, ttls: Dict[str, int], stale_seconds: int = 600, max_entries: int = 512):
+        # ツール名（ターゲット接頭辞xxx___を除いた名前でも可） -> TTL秒
+        self.ttls = ttls
+        self.stale_seconds = stale_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[Dict[str, Any], float]]" = OrderedDict()
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "stale_hits": 0, "misses": 0, "shared": 0, "revalidations": 0}
+
+    def ttl_for(self, tool_name: str) -> Optional[int]:
+        if tool_name in self.ttls:
+            return self.ttls[tool_name]
+        return self.ttls.get(tool_name.split("___", 1)[-1])
+
+    @staticmethod
+    def make_key(tool_name: str, arguments: Any) -> str:
+        return tool_name + ":" + json.dumps(arguments or {}, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+
+    def lookup(self, key: str) -> Tuple[Optional[Dict[str, Any]], bool]:
+        """(結果, 新鮮かどうか) を返す。期限切れでも猶予期間内なら古い結果を返す"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None, False
+            result, expires_at = entry
+            now = time.monotonic()
+            if now <= expires_at:
+                self._entries.move_to_end(key)
+                return result, True
+            if now <= expires_at + self.stale_seconds:
+                return result, False
+            del self._entries[key]
+            return None, False
+
+    def begin(self, key: str) -> Tuple[Future, bool]:
+        """同一キーの実行を1つにまとめる。(Future, 自分が実行担当か) を返す"""
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                return future, False
+            future = Future()
+            self._inflight[key] = future
+            return future, True
+
+    def finish(self, key: str, result: Optional[Dict[str, Any]], ttl: int, error: BaseException = None):
+        """実行結果を記録し、待っている呼び出し元に共有する"""
+        with self._lock:
+            future = self._inflight.pop(key, None)
+            if error is None and _is_cacheable(result):
+                self._entries[key] = (result, time.monotonic() + ttl)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        if future is not None:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+    def count(self, name: str):
+        with self._lock:
+            self.stats[name] += 1
+
+    def get_stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self.stats, entries=len(self._entries), inflight=len(self._inflight))
+
+
+class CachedMCPTool(AgentTool):
+    """MCPAgentToolをラップし、設定されたツールの結果をキャッシュする"""
+
+    def __init__(self, inner, cache: ToolResultCache):
+        super().__init__()
+        self.inner = inner
+        self.cache = cache
+
+    @property
+    def tool_name(self) -> str:
+        return self.inner.tool_name
+
+    @property
+    def tool_spec(self):
+        return self.inner.tool_spec
+
+    @property
+    def tool_type(self) -> str:
+        return self.inner.tool_type
+
+    @property
+    def mcp_tool(self):
+        return self.inner.mcp_tool
+
+    async def _call(self, tool_use, invocation_state, **kwargs):
+        """元のツールを実行し、(途中イベント一覧, 最終結果) を返す"""
+        events, result = [], None
+        async for event in self.inner.stream(tool_use, invocation_state, **kwargs):
+            extracted = _extract_result(event)
+            if extracted is not None:
+                result = extracted
+            else:
+                events.append(event)
+        return events, result
+
+    def _revalidate(self, key: str, tool_use, ttl: int):
+        """古い結果を返した後、バックグラウンドで最新の結果に更新"""
+        future, leader = self.cache.begin(key)
+        if not leader:
+            return
+        self.cache.count("revalidations")
+
+        def worker():
+            try:
+                _, result = asyncio.run(self._call(tool_use, {}))
+                self.cache.finish(key, result, ttl)
+            except Exception as e:
+                print(f"⚠️ ツール結果の再検証に失敗: {self.tool_name}: {str(e)}")
+                self.cache.finish(key, None, ttl, error=e)
+
+        threading.Thread(target=worker, name="tool-cache-revalidate", daemon=True).start()
+
+    async def stream(self, tool_use, invocation_state, **kwargs):
+        ttl = self.cache.ttl_for(self.tool_name)
+        if ttl is None:
+            async for event in self.inner.stream(tool_use, invocation_state, **kwargs):
+                yield event
+            return
+
+        key = ToolResultCache.make_key(self.tool_name, tool_use.get("input"))
+        cached, fresh = self.cache.lookup(key)
+        if cached is not None:
+            self.cache.count("hits" if fresh else "stale_hits")
+            if not fresh:
+                self._revalidate(key, copy.deepcopy(tool_use), ttl)
+            yield _result_event({**cached, "toolUseId": tool_use["toolUseId"]})
+            return
+
+        future, leader = self.cache.begin(key)
+        if not leader:
+            # 同じ引数の呼び出しが実行中なら、その結果を共有する
+            self.cache.count("shared")
+            result = await asyncio.wrap_future(future)
+            if result is not None:
+                yield _result_event({**result, "toolUseId": tool_use["toolUseId"]})
+                return
+            # 共有元が結果を返さなかった場合は自分で実行する
+            async for event in self.inner.stream(tool_use, invocation_state, **kwargs):
+                yield event
+            return
+
+        self.cache.count("misses")
+        try:
+            events, result = await self._call(tool_use, invocation_state, **kwargs)
+        except BaseException as e:
+            self.cache.finish(key, None, ttl, error=e)
+            raise
+        self.cache.finish(key, result, ttl)
+        for event in events:
+            yield event
+        if result is not None:
+            yield _result_event(result)
@@ -0,0 +1,121 @@
+"""
+ツールカタログのキャッシュ
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+
+@dataclass
+class CatalogDiff:
+    """カタログの差分"""
+    version: str
+    added: List[str] = field(default_factory=list)
+    removed: List[str] = field(default_factory=list)
+    changed: List[str] = field(default_factory=list)
+
+
+def compute_catalog_version(definitions: List[Dict[str, Any]]) -> str:
+    """ツール定義一覧の内容ハッシュを計算"""
+    canonical = json.dumps(
+        sorted(definitions, key=lambda d: d.get("name", "")),
+        sort_keys=True,
+        ensure_ascii=False,
+        separators=(",", ":")
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:16]
+
+
+class ToolCatalogCache:
+    """TTLと内容ハッシュでツール定義一覧を管理し、ローカルにスナップショットを保存する"""
+
+    def __init__(self, snapshot_path: Optional[str], ttl: int = 600):
+        self.snapshot_path = snapshot_path
+        self.ttl = ttl
+        self.definitions: List[Dict[str, Any]] = []
+        self.version: Optional[str] = None
+        self.fetched_at = 0.0
+        self._lock = threading.Lock()
+        self._revalidating = False
+
+    def load_snapshot(self) -> bool:
+        """スナップショットを読み込む（存在しない・壊れている場合はFalse）"""
+        if not self.snapshot_path or not os.path.exists(self.snapshot_path):
+            return False
+        try:
+            with open(self.snapshot_path, encoding="utf-8") as f:
+                snapshot = json.load(f)
+            definitions = snapshot["tools"]
+            with self._lock:
+                self.definitions = definitions
+                self.version = compute_catalog_version(definitions)
+                self.fetched_at = float(snapshot.get("fetched_at", 0))
+            print(f"📦 ツールカタログのスナップショットを読み込みました: {len(definitions)}個 (version={self.version})")
+            return True
+        except Exception as e:
+            print(f"⚠️ ツールカタログのスナップショット読み込みに失敗: {str(e)}")
+            return False
+
+    def is_fresh(self) -> bool:
+        return self.version is not None and time.time() - self.fetched_at < self.ttl
+
+    def update(self, definitions: List[Dict[str, Any]]) -> Optional[CatalogDiff]:
+        """取得したツール定義で更新し、内容が変わった場合のみ差分を返す"""
+        version = compute_catalog_version(definitions)
+        with self._lock:
+            previous = {d.get("name"): d for d in self.definitions}
+            unchanged = version == self.version
+            self.definitions = definitions
+            self.version = version
+            self.fetched_at = time.time()
+        self._save_snapshot(definitions)
+        if unchanged:
+            return None
+
+        current = {d.get("name"): d for d in definitions}
+        return CatalogDiff(
+            version=version,
+            added=[name for name in current if name not in previous],
+            removed=[name for name in previous if name not in current],
+            changed=[name for name in current if name in previous and current[name] != previous[name]],
+        )
+
+    def revalidate_in_background(self, fetch: Callable[[], List[Dict[str, Any]]],
+                                 on_change: Callable[[CatalogDiff], None]) -> bool:
+        """バックグラウンドで再取得し、変更があればon_changeを呼ぶ（実行中なら何もしない）"""
+        with self._lock:
+            if self._revalidating:
+                return False
+            self._revalidating = True
+
+        def worker():
+            try:
+                diff = self.update(fetch())
+                if diff is None:
+                    print(f"✅ ツールカタログに変更はありません (version={self.version})")
+                    return
+                print(f"🔄 ツールカタログが更新されました: 追加{len(diff.added)} 削除{len(diff.removed)} 変更{len(diff.changed)}")
+                on_change(diff)
+            except Exception as e:
+                print(f"⚠️ ツールカタログの再検証に失敗: {str(e)}")
+            finally:
+                self._revalidating = False
+
+        threading.Thread(target=worker, name="tool-catalog-revalidate", daemon=True).start()
+        return True
+
+    def _save_snapshot(self, definitions: List[Dict[str, Any]]):
+        """スナップショットを書き出す（失敗しても処理は継続）"""
+        if not self.snapshot_path:
+            return
+        try:
+            tmp_path = f"{self.snapshot_path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"fetched_at": self.fetched_at, "tools": definitions}, f, ensure_ascii=False)
+            os.replace(tmp_path, self.snapshot_path)
+        except Exception as e:
+            print(f"⚠️ ツールカタログのスナップショット保存に失敗: {str(e)}")
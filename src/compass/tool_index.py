@@ -0,0 +1,165 @@
+"""
+ツール事前選択インデックス（ツール名・説明に対するBM25）
+"""
+import math
+import re
+import unicodedata
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, List
+
+from strands.hooks import AfterToolCallEvent, HookProvider, HookRegistry
+
+# 関連ツールが見つからない場合に使うゲートウェイのセマンティック検索ツール
+SEARCH_TOOL_NAME = "x_amz_bedrock_agentcore_search"
+
+_WORD_PATTERN = re.compile(r"[a-z0-9]+")
+# ひらがな・カタカナ・漢字（分かち書きしないため文字バイグラムで索引する）
+_CJK_PATTERN = re.compile(r"[\u3040-\u30ff\u3400-\u9fff\uff66-\uff9f]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """英数字は単語（snake_caseは分割）、日本語は文字バイグラムに分割"""
+    text = unicodedata.normalize("NFKC", text or "").lower()
+    tokens = _WORD_PATTERN.findall(text)
+    for run in _CJK_PATTERN.findall(text):
+        if len(run) == 1:
+            tokens.append(run)
+        else:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+def base_tool_name(name: str) -> str:
+    """ゲートウェイのターゲット接頭辞（xxx___）を除いたツール名"""
+    return name.split("___", 1)[-1]
+
+
+def _document_tokens(definition: Dict[str, Any]) -> List[str]:
+    """ツール定義から索引対象のトークンを作成（ツール名は重みを上げるため2回入れる）"""
+    name = definition.get("name", "")
+    parts = [name, base_tool_name(name), definition.get("description", "")]
+    properties = (definition.get("inputSchema") or {}).get("properties") or {}
+    for prop_name, prop in properties.items():
+        parts.append(prop_name)
+        if isinstance(prop, dict):
+            parts.append(prop.get("description", ""))
+    return tokenize(" ".join(parts))
+
+
+@dataclass
+class ToolSelection:
+    """ツールの選択結果"""
+    names: List[str] = field(default_factory=list)
+    confident: bool = True
+    top_score: float = 0.0
+
+
+class ToolIndex:
+    """カタログ読み込み時に作成し、プロンプトごとに関連の高いツールを選ぶ"""
+
+    def __init__(self, definitions: List[Dict[str, Any]], k1: float = 1.5, b: float = 0.75):
+        self.names = [d.get("name") for d in definitions if d.get("name")]
+        self.k1 = k1
+        self.b = b
+        self._term_freqs: Dict[str, Counter] = {}
+        self._lengths: Dict[str, int] = {}
+        document_freq: Counter = Counter()
+        for definition in definitions:
+            name = definition.get("name")
+            if not name:
+                continue
+            tokens = _document_tokens(definition)
+            self._term_freqs[name] = Counter(tokens)
+            self._lengths[name] = len(tokens)
+            document_freq.update(set(tokens))
+        # 接頭辞なしの名前（xxx___を除いたもの）からツール名を引けるようにする
+        self._base_names: Dict[str, List[str]] = {}
+        for name in self._term_freqs:
+            self._base_names.setdefault(base_tool_name(name), []).append(name)
+        count = len(self._term_freqs)
+        self._avg_length = (sum(self._lengths.values()) / count) if count else 0.0
+        self._idf = {
+            term: math.log(1 + (count - freq + 0.5) / (freq + 0.5))
+            for term, freq in document_freq.items()
+        }
+
+    def score(self, query: str) -> Dict[str, float]:
+        """クエリに対する各ツールのBM25スコア（0より大きいもののみ）"""
+        scores: Dict[str, float] = {}
+        terms = set(tokenize(query))
+        for name, term_freqs in self._term_freqs.items():
+            norm = self.k1 * (1 - self.b + self.b * self._lengths[name] / (self._avg_length or 1))
+            total = 0.0
+            for term in terms:
+                tf = term_freqs.get(term)
+                if tf:
+                    total += self._idf[term] * tf * (self.k1 + 1) / (tf + norm)
+            if total > 0:
+                scores[name] = total
+        return scores
+
+    def resolve_names(self, names: Iterable[str]) -> List[str]:
+        """ツール名（接頭辞xxx___は省略可）をインデックス内のツール名に解決（一致しないものは除く）"""
+        resolved: List[str] = []
+        for name in names:
+            matches = [name] if name in self._term_freqs else self._base_names.get(name, [])
+            resolved.extend(match for match in matches if match not in resolved)
+        return resolved
+
+    def unknown_names(self, names: Iterable[str]) -> List[str]:
+        """インデックス内のどのツールにも一致しない名前"""
+        return [name for name in names if not self.resolve_names([name])]
+
+    def select(
+        self,
+        query: str,
+        top_k: int = 5,
+        pinned: Iterable[str] = (),
+        min_score: float = 0.5
+    ) -> ToolSelection:
+        """上位top_k件と固定ツールを選ぶ（確信度が低ければ検索ツールに任せる）"""
+        pinned = self.resolve_names(pinned)
+        if len(self.names) <= top_k + len(pinned):
+            return ToolSelection(names=list(self.names))
+
+        scores = self.score(query)
+        ranked = sorted(scores, key=lambda name: scores[name], reverse=True)[:top_k]
+        top_score = scores[ranked[0]] if ranked else 0.0
+        selected = set(pinned) | set(ranked)
+        confident = top_score >= min_score
+        if not confident:
+            if SEARCH_TOOL_NAME not in self._term_freqs:
+                # 検索ツールがなければ絞り込まない
+                return ToolSelection(names=list(self.names), confident=False, top_score=top_score)
+            selected.add(SEARCH_TOOL_NAME)
+        # カタログの順序を保つ（プロンプトの先頭部分を安定させる）
+        return ToolSelection(
+            names=[name for name in self.names if name in selected],
+            confident=confident,
+            top_score=top_score
+        )
+
+    def find_mentioned(self, text: str) -> List[str]:
+        """テキスト（検索ツールの結果など）に含まれるツール名"""
+        return [name for name in self.names if name != SEARCH_TOOL_NAME and name in (text or "")]
+
+
+class ToolSearchExpansionHooks(HookProvider):
+    """検索ツールの結果に含まれるツールを、同じターンのうちにエージェントへ追加する"""
+
+    def __init__(self, resolve: Callable[[str], List[Any]]):
+        self.resolve = resolve
+
+    def register_hooks(self, registry: HookRegistry, **kwargs):
+        registry.add_callback(AfterToolCallEvent, self._after_tool_call)
+
+    def _after_tool_call(self, event: AfterToolCallEvent):
+        if event.tool_use.get("name") != SEARCH_TOOL_NAME or not event.result:
+            return
+        text = "\n".join(content.get("text", "") for content in event.result.get("content", []))
+        registered = set(event.agent.tool_names)
+        for tool in self.resolve(text):
+            if tool.tool_name not in registered:
+                event.agent.tool_registry.register_tool(tool)
+                registered.add(tool.tool_name)
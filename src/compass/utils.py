@@ -1,19 +1,110 @@
 """
 ユーティリティ関数
 """
+import threading
+import time
+from typing import Optional
+
 import requests
+from requests.adapters import HTTPAdapter
+from strands.tools.mcp.mcp_agent_tool import MCPAgentTool
 from strands.tools.mcp.mcp_client import MCPClient
 from mcp.client.streamable_http import streamablehttp_client
+from mcp.types import Tool as MCPTool
 
+from telemetry import phase
 
-def fetch_access_token(client_id: str, client_secret: str, token_url: str) -> str:
-    """OAuth2アクセストークンを取得"""
-    response = requests.post(
+
+def _request_token(session, client_id: str, client_secret: str, token_url: str) -> dict:
+    """トークンエンドポイントを呼び出してレスポンス全体を返す"""
+    response = session.post(
         token_url,
         data=f"grant_type=client_credentials&client_id={client_id}&client_secret={client_secret}",
-        headers={'Content-Type': 'application/x-www-form-urlencoded'}
+        headers={'Content-Type': 'application/x-www-form-urlencoded'},
+        timeout=30
     )
-    return response.json()['access_token']
+    if response.status_code != 200:
+        raise RuntimeError(f"トークン取得失敗: HTTP {response.status_code} - {response.text}")
+    body = response.json()
+    if 'access_token' not in body:
+        raise RuntimeError(f"トークンレスポンスにaccess_tokenが含まれていません: {body}")
+    return body
+
+
+def fetch_access_token(client_id: str, client_secret: str, token_url: str) -> str:
+    """OAuth2アクセストークンを取得"""
+    return _request_token(requests, client_id, client_secret, token_url)['access_token']
+
+
+class TokenManager:
+    """有効期限を考慮してOAuth2アクセストークンをキャッシュ・事前更新する"""
+
+    def __init__(self, client_id: str, client_secret: str, token_url: str,
+                 refresh_margin: int = 300, retry_interval: int = 30):
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.token_url = token_url
+        self.refresh_margin = refresh_margin
+        self.retry_interval = retry_interval
+
+        # コネクションを再利用するためのセッション
+        self._session = requests.Session()
+        self._session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=4))
+
+        self._lock = threading.Lock()
+        self._token: Optional[str] = None
+        self._refresh_at = 0.0
+        self._stop_event = threading.Event()
+        self._refresher: Optional[threading.Thread] = None
+
+    def get_token(self) -> str:
+        """有効なアクセストークンを返す（期限切れ間近なら更新）"""
+        token = self._token
+        if token and time.monotonic() < self._refresh_at:
+            return token
+
+        # 同時に呼ばれた場合も更新は1回だけ行う
+        with self._lock:
+            if self._token and time.monotonic() < self._refresh_at:
+                return self._token
+            self._refresh_locked()
+            self._start_refresher()
+            return self._token
+
+    def _refresh_locked(self):
+        """トークンを取得してキャッシュを更新（ロック保持中に呼び出す）"""
+        with phase("token_fetch"):
+            body = _request_token(self._session, self.client_id, self.client_secret, self.token_url)
+        expires_in = int(body.get('expires_in', 3600))
+        self._token = body['access_token']
+        # 有効期限が短い場合でも期限の半分までは使い回す
+        self._refresh_at = time.monotonic() + max(expires_in - self.refresh_margin, expires_in / 2)
+        print(f"🔑 アクセストークン更新完了（有効期限: {expires_in}秒）")
+
+    def _start_refresher(self):
+        """バックグラウンド更新スレッドを開始"""
+        if self._refresher is not None and self._refresher.is_alive():
+            return
+        self._refresher = threading.Thread(target=self._refresh_loop, name="token-refresher", daemon=True)
+        self._refresher.start()
+
+    def _refresh_loop(self):
+        """有効期限の手前でトークンを更新し続ける"""
+        wait = max(self._refresh_at - time.monotonic(), 0)
+        while not self._stop_event.wait(wait):
+            try:
+                with self._lock:
+                    self._refresh_locked()
+                wait = max(self._refresh_at - time.monotonic(), self.retry_interval)
+            except Exception as e:
+                # 失敗時は一定間隔で再試行（期限内であればキャッシュ済みトークンを使い続ける）
+                print(f"⚠️ アクセストークンのバックグラウンド更新に失敗: {str(e)}")
+                wait = self.retry_interval
+
+    def close(self):
+        """バックグラウンド更新を停止してセッションを閉じる"""
+        self._stop_event.set()
+        self._session.close()
 
 
 def create_streamable_http_transport(mcp_url: str, access_token: str):
@@ -27,14 +118,26 @@ def get_full_tools_list(client):
     tools = []
     pagination_token = None
     
-    while more_tools:
-        tmp_tools = client.list_tools_sync(pagination_token=pagination_token)
-        tools.extend(tmp_tools)
-        
-        if tmp_tools.pagination_token is None:
-            more_tools = False
-        else:
-            more_tools = True
-            pagination_token = tmp_tools.pagination_token
+    with phase("tool_listing") as span:
+        while more_tools:
+            tmp_tools = client.list_tools_sync(pagination_token=pagination_token)
+            tools.extend(tmp_tools)
+            
+            if tmp_tools.pagination_token is None:
+                more_tools = False
+            else:
+                more_tools = True
+                pagination_token = tmp_tools.pagination_token
+        span.set_attribute("tool.count", len(tools))
     
     return tools
+
+
+def tool_definitions(tools) -> list:
+    """MCPAgentTool一覧をJSONに保存可能なMCPツール定義に変換"""
+    return [tool.mcp_tool.model_dump(mode="json", exclude_none=True) for tool in tools]
+
+
+def tools_from_definitions(definitions, client) -> list:
+    """MCPツール定義からMCPClientに紐づくMCPAgentToolを作成"""
+    return [MCPAgentTool(MCPTool.model_validate(definition), client) for definition in definitions]
@@ -5,6 +5,8 @@ import uuid
 import os
 from datetime import datetime
 
+from history import ChatHistory, render_history
+
 # ページ設定
 st.set_page_config(
     page_title="Compass Chat UI",
@@ -13,8 +15,9 @@ st.set_page_config(
 )
 
 # セッション状態の初期化
-if "messages" not in st.session_state:
-    st.session_state.messages = []
+# 履歴は直近分のみメモリに保持し、古いメッセージはディスクへ退避する
+if "history" not in st.session_state:
+    st.session_state.history = ChatHistory()
 if "session_id" not in st.session_state:
     st.session_state.session_id = str(uuid.uuid4())
 
@@ -23,18 +26,32 @@ if "session_id" not in st.session_state:
 def get_bedrock_client():
     return boto3.client('bedrock-agentcore', region_name='ap-northeast-1')
 
-# エージェント呼び出し関数
-def invoke_agent(prompt):
-    """AWS Agent Coreエージェントを呼び出し"""
+def extract_message(response_data):
+    """レスポンスJSONからメッセージを抽出"""
+    if 'result' in response_data:
+        return response_data['result']
+    elif 'completion' in response_data:
+        return response_data['completion']
+    elif 'message' in response_data:
+        return response_data['message']
+    elif 'error' in response_data:
+        return response_data['error']
+    else:
+        return str(response_data)
+
+# ストリーミング呼び出し関数
+def invoke_agent_stream(prompt, status_placeholder):
+    """AWS Agent Coreエージェントをストリーミングモードで呼び出し、テキストを逐次返す"""
     try:
-        # 環境変数からagentRuntimeArnを取得
         agent_runtime_arn = os.getenv('AGENT_RUNTIME_ARN')
         if not agent_runtime_arn:
-            return "エラー: AGENT_RUNTIME_ARN環境変数が設定されていません"
+            yield "エラー: AGENT_RUNTIME_ARN環境変数が設定されていません"
+            return
         
         client = get_bedrock_client()
         payload = json.dumps({
-            "prompt": prompt
+            "prompt": prompt,
+            "stream": True
         })
         
         response = client.invoke_agent_runtime(
@@ -44,21 +61,34 @@ def invoke_agent(prompt):
             qualifier="DEFAULT"
         )
         
-        response_body = response['response'].read()
-        response_data = json.loads(response_body)
+        # ストリーミング非対応のエージェントからはJSONがそのまま返る
+        if "text/event-stream" not in response.get('contentType', ''):
+            yield extract_message(json.loads(response['response'].read()))
+            return
+        
+        # SSE（data: {...}）を1行ずつ処理
+        for line in response['response'].iter_lines(chunk_size=64):
+            if not line or not line.startswith(b"data: "):
+                continue
+            event = json.loads(line[len(b"data: "):].decode("utf-8"))
+            if not isinstance(event, dict):
+                yield str(event)
+                continue
+            
+            event_type = event.get("type")
+            if event_type == "text":
+                yield event["data"]
+            elif event_type == "tool_start":
+                status_placeholder.caption(f"🔧 ツール実行中: {event.get('tool')}")
+            elif event_type == "tool_end":
+                status_placeholder.caption(f"✅ ツール実行完了: {event.get('tool')}")
+            elif event_type == "error":
+                yield f"\n\nエラーが発生しました: {event.get('error')}"
         
-        # レスポンスからメッセージを抽出
-        if 'result' in response_data:
-            return response_data['result']
-        elif 'completion' in response_data:
-            return response_data['completion']
-        elif 'message' in response_data:
-            return response_data['message']
-        else:
-            return str(response_data)
+        status_placeholder.empty()
             
     except Exception as e:
-        return f"エラーが発生しました: {str(e)}"
+        yield f"エラーが発生しました: {str(e)}"
 
 # メインUI
 st.title("🤖 Compass Chat UI")
@@ -70,32 +100,32 @@ with st.sidebar:
     st.write(f"セッションID: {st.session_state.session_id[:8]}...")
     
     if st.button("チャット履歴をクリア"):
-        st.session_state.messages = []
+        st.session_state.history.clear()
         st.session_state.session_id = str(uuid.uuid4())
         st.rerun()
 
-# チャット履歴の表示
-for message in st.session_state.messages:
-    with st.chat_message(message["role"]):
-        st.markdown(message["content"])
+# チャット履歴の表示（直近のメッセージのみ描画）
+render_history(st.session_state.history)
 
 # チャット入力
 if prompt := st.chat_input("メッセージを入力してください..."):
     # ユーザーメッセージを履歴に追加
-    st.session_state.messages.append({"role": "user", "content": prompt})
+    st.session_state.history.append("user", prompt)
     
     # ユーザーメッセージを表示
     with st.chat_message("user"):
         st.markdown(prompt)
     
-    # エージェントの応答を取得
+    # エージェントの応答を取得（生成されたトークンから順に表示）
     with st.chat_message("assistant"):
-        with st.spinner("エージェントが応答を生成中..."):
-            response = invoke_agent(prompt)
-            st.markdown(response)
+        status_placeholder = st.empty()
+        response = st.write_stream(invoke_agent_stream(prompt, status_placeholder))
     
-    # エージェントの応答を履歴に追加
-    st.session_state.messages.append({"role": "assistant", "content": response})
+    # エージェントの応答を履歴に追加（文字列以外を含む場合はst.write_streamがリストを返す）
+    st.session_state.history.append(
+        "assistant",
+        response if isinstance(response, str) else "".join(map(str, response))
+    )
 
 # フッター
 st.markdown("---")
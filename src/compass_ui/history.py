@@ -0,0 +1,141 @@
+"""
+チャット履歴の保持と表示（直近のみ描画し、古いメッセージはディスクへ退避）
+
+compass_uiは単体でデプロイするため、demo（src/demo/chat/history.py）と同じ実装をそれぞれに置いている。
+変更する場合は両方を揃えること（tests/test_history.pyで一致を確認している）。
+"""
+import glob
+import itertools
+import json
+import os
+import tempfile
+import time
+import uuid
+import weakref
+from typing import Dict, List
+
+import streamlit as st
+
+# 毎回描画する直近のメッセージ数
+HISTORY_WINDOW = int(os.getenv("CHAT_HISTORY_WINDOW", "20"))
+# 以前のメッセージを表示する際の1ページあたりの件数
+HISTORY_PAGE_SIZE = int(os.getenv("CHAT_HISTORY_PAGE_SIZE", "50"))
+# メモリに保持するメッセージ数の上限（超えた分はディスクへ退避）
+HISTORY_MAX_IN_MEMORY = int(os.getenv("CHAT_HISTORY_MAX_IN_MEMORY", "200"))
+HISTORY_SPILL_DIR = os.getenv("CHAT_HISTORY_SPILL_DIR", tempfile.gettempdir())
+# 退避ファイルを残しておく秒数（プロセスが異常終了して削除されなかったファイルを掃除する）
+HISTORY_SPILL_TTL = int(os.getenv("CHAT_HISTORY_SPILL_TTL", str(24 * 3600)))
+_SWEEP_INTERVAL = 600
+_last_sweep = 0.0
+
+
+def _remove_spill_file(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _sweep_spill_files(spill_dir: str, ttl: int = HISTORY_SPILL_TTL):
+    """最終更新からttl秒を過ぎた退避ファイルを削除（_SWEEP_INTERVAL秒に1回まで）"""
+    global _last_sweep
+    now = time.time()
+    if now - _last_sweep < _SWEEP_INTERVAL:
+        return
+    _last_sweep = now
+    for path in glob.glob(os.path.join(spill_dir, "chat_history_*.jsonl")):
+        try:
+            if os.path.getmtime(path) < now - ttl:
+                os.remove(path)
+        except OSError:
+            pass
+
+
+class ChatHistory:
+    """直近のメッセージのみメモリに保持し、古いメッセージはJSON Linesファイルへ退避する"""
+
+    def __init__(self, max_in_memory: int = HISTORY_MAX_IN_MEMORY, spill_dir: str = HISTORY_SPILL_DIR):
+        self.max_in_memory = max(max_in_memory, HISTORY_WINDOW)
+        self.spill_dir = spill_dir
+        self._reset()
+
+    def _reset(self):
+        _sweep_spill_files(self.spill_dir)
+        # クリアのたびに別のIDにして、描画キャッシュを使い回さない
+        self.key = uuid.uuid4().hex
+        self.path = os.path.join(self.spill_dir, f"chat_history_{self.key}.jsonl")
+        # ブラウザセッションが終わって履歴が破棄されたら（プロセス終了時も）退避ファイルを削除する
+        self._remove_spill = weakref.finalize(self, _remove_spill_file, self.path)
+        self.messages: List[Dict[str, str]] = []
+        self.spilled = 0
+
+    def __len__(self) -> int:
+        return self.spilled + len(self.messages)
+
+    def append(self, role: str, content: str):
+        """メッセージを追加（上限を超えたら古い分をまとめて退避）"""
+        self.messages.append({"role": role, "content": content})
+        if len(self.messages) > self.max_in_memory:
+            # 1件ずつではなく半分ずつ退避して、ファイル書き込みの回数を抑える
+            keep = max(self.max_in_memory // 2, HISTORY_WINDOW)
+            spill, self.messages = self.messages[:-keep], self.messages[-keep:]
+            with open(self.path, "a", encoding="utf-8") as f:
+                for message in spill:
+                    f.write(json.dumps(message, ensure_ascii=False) + "\n")
+            self.spilled += len(spill)
+
+    def recent(self, count: int) -> List[Dict[str, str]]:
+        """直近count件のメッセージ"""
+        return self.messages[-count:] if count > 0 else []
+
+    def get_range(self, start: int, end: int) -> List[Dict[str, str]]:
+        """履歴全体でのstart〜end件目（退避済みの分はファイルから読む）"""
+        result = []
+        if start < self.spilled and os.path.exists(self.path):
+            with open(self.path, encoding="utf-8") as f:
+                for line in itertools.islice(f, start, min(end, self.spilled)):
+                    result.append(json.loads(line))
+        in_memory_start = max(start - self.spilled, 0)
+        in_memory_end = max(end - self.spilled, 0)
+        result.extend(self.messages[in_memory_start:in_memory_end])
+        return result
+
+    def clear(self):
+        """履歴と退避ファイルを削除"""
+        self._remove_spill()
+        self._reset()
+
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def _page_markdown(history_key: str, start: int, end: int, _history: ChatHistory) -> str:
+    """以前のメッセージ1ページ分のMarkdown（追加済みのメッセージは変わらないため範囲でキャッシュ）"""
+    labels = {"user": "🧑 ユーザー", "assistant": "🤖 アシスタント"}
+    return "\n\n---\n\n".join(
+        f"**{labels.get(message['role'], message['role'])}**\n\n{message['content']}"
+        for message in _history.get_range(start, end)
+    )
+
+
+def render_history(history: ChatHistory, window: int = HISTORY_WINDOW, page_size: int = HISTORY_PAGE_SIZE):
+    """直近window件のみチャット形式で描画し、それより古いメッセージはページ単位で表示する"""
+    older = len(history) - min(window, len(history))
+    if older > 0:
+        with st.expander(f"以前のメッセージ（{older}件）"):
+            # 開いたときだけ読み込んで描画する
+            if st.toggle("表示する", key=f"show_older_{history.key}"):
+                pages = (older + page_size - 1) // page_size
+                page = st.number_input(
+                    f"ページ（1が最新、全{pages}ページ）",
+                    min_value=1,
+                    max_value=pages,
+                    value=1,
+                    key=f"older_page_{history.key}"
+                ) if pages > 1 else 1
+                # ページの境界を先頭から固定し、埋まったページのキャッシュが使い回されるようにする
+                start = (pages - page) * page_size
+                end = min(start + page_size, older)
+                st.markdown(_page_markdown(history.key, start, end, history))
+
+    for message in history.recent(window):
+        with st.chat_message(message["role"]):
+            st.markdown(message["content"])
@@ -8,7 +8,11 @@ Streamlitアプリケーション
 
 import streamlit as st
 import os
-from chat.agent import create_my_agent
+import uuid
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+from chat.agent import create_model, create_my_agent
+from chat.checkpoint import BoundedSqliteSaver
+from chat.history import ChatHistory, render_history
 from chat.session import ChatSession
 from chat.mcp_tools import MCPToolManager
 
@@ -20,21 +24,80 @@ st.set_page_config(
     layout="wide"                     # ワイドレイアウト
 )
 
+# プロセス全体で共有するリソース
+# モデル・MCPツールマネージャー・エージェントは全ブラウザセッションで1つだけ作成する
+@st.cache_resource
+def get_shared_model():
+    """共有のチャットモデルを取得"""
+    return create_model()
+
+@st.cache_resource
+def get_shared_checkpointer():
+    """
+    共有のチェックポイント（エージェントを作り直しても会話履歴を保持する）
+    
+    ローカルのSQLiteファイルに保存し、スレッドごとの保持数に上限を設ける
+    """
+    return BoundedSqliteSaver.from_env()
+
+def clear_shared_agents():
+    """共有エージェントを破棄して、次のアクセスで作り直す"""
+    get_shared_agent.clear()
+    get_shared_streaming_agent.clear()
+
+@st.cache_resource
+def get_shared_mcp_manager() -> MCPToolManager:
+    """共有のMCPツールマネージャーを取得（トークン取得・ツール一覧取得は1回だけ）"""
+    mcp_manager = MCPToolManager()
+    mcp_manager.initialize()
+    # ツールカタログが変わった場合は、次のアクセスでエージェントを作り直す
+    mcp_manager.add_catalog_listener(lambda diff: clear_shared_agents())
+    return mcp_manager
+
+@st.cache_resource
+def get_shared_agent():
+    """共有のLangChainエージェントを取得（会話状態はthread_idで分離される）"""
+    return create_my_agent(
+        get_shared_mcp_manager(),
+        model=get_shared_model(),
+        checkpointer=get_shared_checkpointer()
+    )
+
+@st.cache_resource
+def get_shared_streaming_agent():
+    """共有のストリーミング用エージェントを取得（応答をトークン単位で返す）"""
+    return create_my_agent(
+        get_shared_mcp_manager(),
+        model=get_shared_model(),
+        checkpointer=get_shared_checkpointer(),
+        structured=False
+    )
+
+def get_streamlit_session_id() -> str:
+    """
+    現在のStreamlitセッションIDを取得（会話スレッドの識別子に使う）
+    
+    Streamlitの外（bare実行など）ではランダムなIDを返す
+    """
+    ctx = get_script_run_ctx()
+    return ctx.session_id if ctx is not None else str(uuid.uuid4())
+
 # セッション状態の初期化
-# Streamlitのセッション状態を管理し、アプリケーションの状態を保持
-if "agent" not in st.session_state:
-    st.session_state.agent = None  # LangChainエージェント
+# ブラウザセッションごとに持つのは軽量な状態のみ
+if "session_id" not in st.session_state:
+    st.session_state.session_id = get_streamlit_session_id()  # 会話スレッドの識別子
 if "chat_session" not in st.session_state:
     st.session_state.chat_session = None  # チャットセッション
-if "messages" not in st.session_state:
-    st.session_state.messages = []  # チャット履歴
-if "mcp_manager" not in st.session_state:
-    st.session_state.mcp_manager = MCPToolManager()  # MCPツールマネージャー
+if "history" not in st.session_state:
+    st.session_state.history = ChatHistory()  # チャット履歴（古いメッセージはディスクへ退避）
 
-def initialize_system():
+def initialize_system(retry_mcp: bool = False):
     """
     システムの初期化（エージェント + MCPツール）
     
+    Args:
+        retry_mcp (bool): 共有MCPツールの接続に失敗していた場合に再試行するか
+    
     Returns:
         bool: 初期化の成功/失敗
         
@@ -60,17 +123,23 @@ def initialize_system():
         
         # 初期化
         with st.spinner("初期化中..."):
-            # 1. MCPツールを初期化
-            mcp_success = st.session_state.mcp_manager.initialize()
-            
-            # 2. エージェントを作成（MCPツール統合済み）
-            st.session_state.agent = create_my_agent()
-            st.session_state.chat_session = ChatSession(st.session_state.agent)
+            # 1. 共有のMCPツールを取得（前回の接続に失敗していれば再試行）
+            mcp_manager = get_shared_mcp_manager()
+            if retry_mcp and not mcp_manager.initialized:
+                if mcp_manager.initialize():
+                    clear_shared_agents()
+            mcp_success = mcp_manager.initialized
             
+            # 2. 共有エージェントを使うチャットセッションを作成
+            st.session_state.chat_session = ChatSession(
+                get_shared_agent(),
+                user_id=st.session_state.session_id,
+                streaming_agent=get_shared_streaming_agent()
+            )
             
             # 3. 結果を表示（統合版）
             if mcp_success:
-                mcp_tool_count = len(st.session_state.mcp_manager.get_tool_names())
+                mcp_tool_count = len(mcp_manager.get_tool_names())
                 st.success(f"✅ 初期化完了！MCPツール {mcp_tool_count}個利用可能")
             else:
                 st.success("✅ 初期化完了！基本機能のみ利用可能")
@@ -102,22 +171,28 @@ def main():
         # 初期化ボタン（統合版）
         # システム全体の初期化を実行
         if st.button("🚀 初期化", type="primary"):
-            if initialize_system():
+            if initialize_system(retry_mcp=True):
                 st.rerun()
         
         # チャット履歴クリア
         # 会話履歴をリセット
         if st.button("🗑️ チャット履歴をクリア"):
-            st.session_state.messages = []
+            st.session_state.history.clear()
+            # 保存済みの会話状態も削除する
+            if st.session_state.chat_session is not None:
+                get_shared_checkpointer().delete_thread(
+                    st.session_state.chat_session.config["configurable"]["thread_id"]
+                )
             st.rerun()
         
         st.markdown("---")
         
         # システムステータス（統合表示）
         # 接続状態とツール可用性を表示
-        if st.session_state.agent is not None:
-            mcp_info = st.session_state.mcp_manager.get_server_info()
-            has_tools = st.session_state.mcp_manager.has_available_tools()
+        if st.session_state.chat_session is not None:
+            mcp_manager = get_shared_mcp_manager()
+            mcp_info = mcp_manager.get_server_info()
+            has_tools = mcp_manager.has_available_tools()
             
             if mcp_info["status"] == "接続済み" and has_tools:
                 st.success("✅ MCPツール利用可能")
@@ -126,6 +201,18 @@ def main():
                 st.markdown("### 🔗 MCPツール情報")
                 st.markdown(f"**ツール数**: {mcp_info['tools_count']}個")
                 
+                # ゲートウェイ呼び出しの状況（再試行・レート制限・サーキットブレーカー）
+                resilience = (mcp_info.get("pool") or {}).get("resilience")
+                if resilience:
+                    open_targets = [
+                        name for name, breaker in resilience["breakers"].items()
+                        if breaker["state"] != "closed"
+                    ]
+                    if open_targets:
+                        st.warning(f"⚠️ 一時停止中のターゲット: {', '.join(open_targets)}")
+                    with st.expander("📈 ゲートウェイ呼び出し状況"):
+                        st.json(resilience)
+                
                 # 利用可能なツール一覧
                 if mcp_info['tools']:
                     st.markdown("### 🛠️ 利用可能なMCPツール")
@@ -142,7 +229,7 @@ def main():
         st.markdown("---")
         
         # メッセージ数の表示
-        st.markdown(f"💬 メッセージ数: {len(st.session_state.messages)}")
+        st.markdown(f"💬 メッセージ数: {len(st.session_state.history)}")
         
     
     # メインコンテンツエリア（チャット履歴）
@@ -151,10 +238,8 @@ def main():
     
     with chat_container:
         # チャット履歴の表示
-        # 保存されたメッセージを時系列で表示
-        for message in st.session_state.messages:
-            with st.chat_message(message["role"]):
-                st.markdown(message["content"])
+        # 直近のメッセージのみ描画し、古いメッセージは折りたたんで表示
+        render_history(st.session_state.history)
     
     # 固定された入力エリア（下部）
     # ユーザー入力とアシスタント応答の境界線
@@ -164,40 +249,52 @@ def main():
     # チャット入力フィールドからのメッセージを処理
     if prompt := st.chat_input("メッセージを入力してください...", key="chat_input"):
         # ユーザーメッセージを履歴に追加
-        st.session_state.messages.append({"role": "user", "content": prompt})
+        st.session_state.history.append("user", prompt)
         
         # 初期化されていない場合は初期化
         # システムが初期化されていない場合の自動初期化
-        if st.session_state.agent is None:
+        if st.session_state.chat_session is None:
             if not initialize_system():
                 st.error("初期化に失敗しました。")
                 return
         
+        # ツールカタログの更新でエージェントが作り直されていれば追従
+        st.session_state.chat_session.agent = get_shared_agent()
+        st.session_state.chat_session.streaming_agent = get_shared_streaming_agent()
+        
         # アシスタント応答の生成と表示
         with st.chat_message("assistant"):
-            with st.spinner("処理中..."):
-                try:
-                    # エージェントにメッセージを送信して応答を取得
-                    response = st.session_state.chat_session.send_message(prompt)
-                    
-                    # エージェントの応答を表示
-                    st.markdown(response.response)
-                    
-                    # メッセージ履歴に追加
-                    # 会話履歴を更新
-                    st.session_state.messages.append({
-                        "role": "assistant", 
-                        "content": response.response,
-                    })
-                    
-                except Exception as e:
-                    # エラーハンドリング
-                    error_msg = str(e)
-                    st.error(f"エラーが発生しました: {error_msg}")
-                    st.session_state.messages.append({
-                        "role": "assistant", 
-                        "content": f"申し訳ございませんが、エラーが発生しました: {error_msg}",
-                    })
+            # ツールの実行状況を表示する領域
+            status_placeholder = st.empty()
+            
+            def show_tool_event(event: str, tool_name: str):
+                if event == "tool_start":
+                    status_placeholder.caption(f"🔧 ツール実行中: {tool_name}")
+                else:
+                    status_placeholder.caption(f"✅ ツール実行完了: {tool_name}")
+            
+            try:
+                # エージェントの応答をトークン単位で表示
+                response = st.write_stream(
+                    st.session_state.chat_session.stream_message(prompt, on_tool_event=show_tool_event)
+                )
+                status_placeholder.empty()
+                
+                # メッセージ履歴に追加
+                # 会話履歴を更新
+                st.session_state.history.append(
+                    "assistant",
+                    response if isinstance(response, str) else "".join(map(str, response))
+                )
+                
+            except Exception as e:
+                # エラーハンドリング
+                error_msg = str(e)
+                st.error(f"エラーが発生しました: {error_msg}")
+                st.session_state.history.append(
+                    "assistant",
+                    f"申し訳ございませんが、エラーが発生しました: {error_msg}"
+                )
                              
         # ページを自動でスクロール
         # UIの更新を反映
@@ -7,13 +7,18 @@
 
 import os
 from dataclasses import dataclass
+from typing import Optional
 
 from langchain.agents import create_agent
+from langchain.agents.middleware import AgentMiddleware, AgentState, before_model
 from langchain.chat_models import init_chat_model
-from langgraph.checkpoint.memory import InMemorySaver
+from langchain_core.messages import RemoveMessage
+from langgraph.graph.message import REMOVE_ALL_MESSAGES
 
+from .checkpoint import BoundedSqliteSaver
 from .context import Context
 from .mcp_tools import MCPToolManager
+from .tool_index import SEARCH_TOOL_NAME
 
 # システムプロンプトの定義
 # LLMがツール使用の判断を行うための指示を含む
@@ -47,21 +52,16 @@ class ResponseFormat:
     # A response (always required)
     response: str
 
-def create_my_agent():
+def create_model():
     """
-    MCPツールを統合したLangChainエージェントを作成・設定する
+    Azure OpenAIのチャットモデルを作成する
     
     Returns:
-        Agent: 設定済みのLangChainエージェント
-        
-    Note:
-        - MCPツールが利用可能な場合は統合
-        - 利用できない場合はツールなしでエージェントを作成
-        - LLMがツールの有無を自動的に判断して動作
+        BaseChatModel: 環境変数の設定値で初期化したモデル
     """
     # Azure OpenAIモデルの設定
     # 環境変数から設定値を取得してモデルを初期化
-    model = init_chat_model(
+    return init_chat_model(
         "azure_openai:gpt-4o-mini",
         temperature=0.5,  # 創造性と一貫性のバランス
         azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
@@ -70,14 +70,125 @@ def create_my_agent():
         api_version=os.getenv("AZURE_OPENAI_API_VERSION", "2024-02-15-preview")
     )
 
+# 1スレッドで保持するメッセージ数の上限
+# 会話が長くなってもターンごとに読み込む状態のサイズを一定に保つ
+MAX_HISTORY_MESSAGES = int(os.getenv("CHAT_HISTORY_MAX_MESSAGES", "40"))
+
+@before_model
+def trim_history(state: AgentState, runtime) -> Optional[dict]:
+    """
+    モデル呼び出し前に古いメッセージを会話状態から削除する
+    
+    ツール呼び出しと結果の組を分断しないよう、
+    ユーザーメッセージの位置で区切って新しい側を残します。
+    """
+    messages = state["messages"]
+    if len(messages) <= MAX_HISTORY_MESSAGES:
+        return None
+    
+    start = len(messages) - MAX_HISTORY_MESSAGES
+    while start < len(messages) and messages[start].type != "human":
+        start += 1
+    if start >= len(messages):
+        return None
+    
+    return {"messages": [RemoveMessage(id=REMOVE_ALL_MESSAGES), *messages[start:]]}
+
+class ToolPreselectionMiddleware(AgentMiddleware):
+    """
+    モデル呼び出しごとに、プロンプトに関連するツールだけをモデルに渡すミドルウェア
+    
+    ToolNodeには全ツールが登録されたままなので、
+    検索ツールの結果に含まれるツールは同じターンのうちに呼び出せます。
+    """
+    
+    def __init__(self, mcp_tool_manager: MCPToolManager):
+        """
+        ミドルウェアを初期化
+        
+        Args:
+            mcp_tool_manager (MCPToolManager): ツールインデックスを持つツールマネージャー
+        """
+        super().__init__()
+        self.mcp_tool_manager = mcp_tool_manager
+    
+    def _filter_tools(self, request):
+        """リクエストのツール一覧を事前選択の結果で絞り込む"""
+        # 現在のターン（最後のユーザーメッセージ以降）を取り出す
+        messages = request.messages
+        start = len(messages) - 1
+        while start >= 0 and messages[start].type != "human":
+            start -= 1
+        if start < 0:
+            return request
+        turn = messages[start:]
+        
+        # 直前のターンで使ったツールと、検索ツールの結果に含まれるツールは残す
+        index = self.mcp_tool_manager.get_tool_index()
+        if index is None:
+            return request
+        extra_tools = []
+        previous = start - 1
+        while previous >= 0 and messages[previous].type != "human":
+            extra_tools.extend(call["name"] for call in getattr(messages[previous], "tool_calls", None) or [])
+            previous -= 1
+        for message in turn:
+            if message.type == "tool" and message.name == SEARCH_TOOL_NAME:
+                extra_tools.extend(index.find_mentioned(str(message.content)))
+        
+        query = turn[0].content if isinstance(turn[0].content, str) else str(turn[0].content)
+        selection = self.mcp_tool_manager.select_tools(query, extra_tools)
+        if selection is None:
+            return request
+        names = set(selection.names)
+        return request.override(tools=[
+            tool for tool in request.tools
+            if isinstance(tool, dict) or tool.name in names
+        ])
+    
+    def wrap_model_call(self, request, handler):
+        return handler(self._filter_tools(request))
+    
+    async def awrap_model_call(self, request, handler):
+        return await handler(self._filter_tools(request))
+
+def create_my_agent(mcp_tool_manager: Optional[MCPToolManager] = None, model=None, checkpointer=None,
+                    structured: bool = True):
+    """
+    MCPツールを統合したLangChainエージェントを作成・設定する
+    
+    Args:
+        mcp_tool_manager (Optional[MCPToolManager]): 初期化済みのツールマネージャー。
+            省略時はここで作成して初期化する
+        model: 使用するチャットモデル。省略時はcreate_model()で作成する
+        checkpointer: 会話状態の保存先。省略時は環境変数の設定でBoundedSqliteSaverを作成する
+        structured (bool): 応答をResponseFormatで返すか。
+            ストリーミング用にはFalseを指定し、最終応答をトークン単位で受け取る
+    
+    Returns:
+        Agent: 設定済みのLangChainエージェント
+        
+    Note:
+        - MCPツールが利用可能な場合は統合
+        - 利用できない場合はツールなしでエージェントを作成
+        - LLMがツールの有無を自動的に判断して動作
+        - 会話状態はthread_idごとにチェックポイントへ保存されるため、
+          1つのエージェントを複数セッションで共有できる
+        - 保持するメッセージ数とチェックポイント数には上限がある
+    """
+    if model is None:
+        model = create_model()
+
     # メモリ管理の設定
     # 会話履歴を保持するためのチェックポイント機能
-    checkpointer = InMemorySaver()
+    if checkpointer is None:
+        checkpointer = BoundedSqliteSaver.from_env()
     
     # MCPツールの初期化と動的取得
     # ツールの可用性に応じてエージェントの設定を決定
-    mcp_tool_manager = MCPToolManager()
-    mcp_tool_manager.initialize()  # MCPゲートウェイへの接続を試行
+    if mcp_tool_manager is None:
+        mcp_tool_manager = MCPToolManager()
+        mcp_tool_manager.initialize()  # MCPゲートウェイへの接続を試行
     
     # 利用可能なツールを動的に取得
     # ツールが利用できない場合は空のリストが返される
@@ -96,7 +207,8 @@ def create_my_agent():
         system_prompt=SYSTEM_PROMPT,    # システムプロンプト
         tools=all_tools,               # 利用可能なツールリスト（空でも可）
         context_schema=Context,        # コンテキストスキーマ
-        response_format=ResponseFormat, # 応答フォーマット
+        response_format=ResponseFormat if structured else None, # 応答フォーマット
+        middleware=[trim_history, ToolPreselectionMiddleware(mcp_tool_manager)], # 会話履歴の上限・ツール事前選択
         checkpointer=checkpointer      # メモリ管理
     )
     
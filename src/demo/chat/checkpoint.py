@@ -0,0 +1,336 @@
+"""
+会話チェックポイント保存モジュール
+
+このモジュールは、会話状態をローカルのSQLiteファイルに保存する
+チェックポイントを提供します。
+スレッドごとに保持するチェックポイント数と、保持するスレッド数を制限し、古いものは削除・圧縮します。
+書き込みはまとめてコミットし、1ターンごとのディスク同期回数を抑えます。
+"""
+
+import asyncio
+import atexit
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, AsyncIterator, Iterator, Optional, Sequence
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import ChannelVersions, Checkpoint, CheckpointMetadata, CheckpointTuple
+from langgraph.checkpoint.sqlite import SqliteSaver
+
+
+class BoundedSqliteSaver(SqliteSaver):
+    """
+    保持数に上限のあるSQLiteチェックポイント
+
+    SqliteSaverに以下を追加します。
+    - スレッド（名前空間）ごとに最新max_checkpoints件だけを保持
+    - 最後の書き込みからthread_ttl秒経ったスレッドと、新しい順にmax_threads件を超えたスレッドを削除
+    - 書き込みをcommit_every件またはcommit_interval秒ごとにまとめてコミット
+      （それ以降に書き込みがなくても、commit_interval秒後にタイマーでコミット）
+    - 削除が一定件数たまったらVACUUMでファイルを圧縮
+    - 非同期API（ainvoke用）は同期APIをスレッドで実行して提供
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_checkpoints: int = 10,
+        commit_every: int = 20,
+        commit_interval: float = 2.0,
+        compact_after: int = 1000,
+        max_threads: int = 1000,
+        thread_ttl: float = 7 * 24 * 3600,
+        evict_interval: float = 60.0
+    ):
+        """
+        チェックポイントを初期化
+
+        Args:
+            path (str): SQLiteファイルのパス
+            max_checkpoints (int): スレッドごとに保持するチェックポイント数
+            commit_every (int): まとめてコミットする書き込み数
+            commit_interval (float): 未コミットの書き込みを保持する最大秒数
+            compact_after (int): VACUUMを実行するまでの削除行数
+            max_threads (int): 保持するスレッド数（0以下で無制限）
+            thread_ttl (float): 最後の書き込みからスレッドを保持する秒数（0以下で無期限）
+            evict_interval (float): 古いスレッドを削除する間隔（秒）
+        """
+        # ロックで排他制御するため、複数スレッドから同じ接続を使う
+        conn = sqlite3.connect(path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        super().__init__(conn)
+        self.path = path
+        self.max_checkpoints = max_checkpoints
+        self.commit_every = commit_every
+        self.commit_interval = commit_interval
+        self.compact_after = compact_after
+        self.max_threads = max_threads
+        self.thread_ttl = thread_ttl
+        self.evict_interval = evict_interval
+        self._pending_writes = 0
+        self._last_commit = time.monotonic()
+        self._flush_timer: Optional[threading.Timer] = None
+        self._deleted_since_compact = 0
+        # 起動直後の最初の書き込みで、前回までに残ったスレッドを整理する
+        self._last_evict = float("-inf")
+        atexit.register(self.close)
+
+    @classmethod
+    def from_env(cls) -> "BoundedSqliteSaver":
+        """
+        環境変数の設定でチェックポイントを作成
+
+        Returns:
+            BoundedSqliteSaver: CHECKPOINT_DB_PATH等の設定で初期化したチェックポイント
+        """
+        return cls(
+            os.getenv("CHECKPOINT_DB_PATH", os.path.join(tempfile.gettempdir(), "demo_checkpoints.sqlite")),
+            max_checkpoints=int(os.getenv("CHECKPOINT_MAX_PER_THREAD", "10")),
+            commit_every=int(os.getenv("CHECKPOINT_COMMIT_EVERY", "20")),
+            commit_interval=float(os.getenv("CHECKPOINT_COMMIT_INTERVAL", "2")),
+            compact_after=int(os.getenv("CHECKPOINT_COMPACT_AFTER", "1000")),
+            max_threads=int(os.getenv("CHECKPOINT_MAX_THREADS", "1000")),
+            thread_ttl=float(os.getenv("CHECKPOINT_THREAD_TTL", str(7 * 24 * 3600)))
+        )
+
+    def setup(self) -> None:
+        """テーブルを作成（スレッドごとの最終書き込み時刻を記録するテーブルを追加）"""
+        if self.is_setup:
+            return
+        super().setup()
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS thread_activity (thread_id TEXT PRIMARY KEY, updated_at REAL NOT NULL)"
+        )
+        self.conn.commit()
+
+    @contextmanager
+    def cursor(self, transaction: bool = True) -> Iterator[sqlite3.Cursor]:
+        """
+        カーソルを取得（書き込みはまとめてコミット）
+
+        同じ接続からは未コミットの書き込みも読めるため、
+        コミットを遅らせても会話状態の読み込みには影響しません。
+        """
+        with self.lock:
+            self.setup()
+            cur = self.conn.cursor()
+            try:
+                yield cur
+            finally:
+                if transaction:
+                    self._pending_writes += 1
+                    if (self._pending_writes >= self.commit_every
+                            or time.monotonic() - self._last_commit >= self.commit_interval):
+                        self._commit()
+                    elif self._flush_timer is None:
+                        # 次の書き込みが来なくても（会話が止まっても）commit_interval秒後にコミットする
+                        self._flush_timer = threading.Timer(self.commit_interval, self._flush_on_timer)
+                        self._flush_timer.daemon = True
+                        self._flush_timer.start()
+                cur.close()
+
+    def _commit(self):
+        """未コミットの書き込みをコミット（ロック取得済みで呼び出す）"""
+        self.conn.commit()
+        self._pending_writes = 0
+        self._last_commit = time.monotonic()
+
+    def _flush_on_timer(self):
+        with self.lock:
+            self._flush_timer = None
+            try:
+                if self.conn.in_transaction:
+                    self._commit()
+            except sqlite3.ProgrammingError:
+                # 既に閉じている場合
+                pass
+
+    def flush(self):
+        """未コミットの書き込みをすべてコミット"""
+        with self.lock:
+            if self.conn.in_transaction:
+                self._commit()
+
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        """チェックポイントを保存し、保持数を超えた古いものを削除"""
+        next_config = super().put(config, checkpoint, metadata, new_versions)
+        thread_id = str(next_config["configurable"]["thread_id"])
+        self._prune(thread_id, next_config["configurable"]["checkpoint_ns"])
+        with self.cursor() as cur:
+            cur.execute(
+                "INSERT OR REPLACE INTO thread_activity (thread_id, updated_at) VALUES (?, ?)",
+                (thread_id, time.time())
+            )
+        if time.monotonic() - self._last_evict >= self.evict_interval:
+            self.evict_threads()
+        return next_config
+
+    def _prune(self, thread_id: str, checkpoint_ns: str):
+        """
+        スレッドの古いチェックポイントと中間書き込みを削除
+
+        チェックポイントIDは時刻順に並ぶため、新しい順にmax_checkpoints件を残します。
+        """
+        with self.cursor() as cur:
+            cur.execute(
+                """
+                DELETE FROM checkpoints
+                WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id NOT IN (
+                    SELECT checkpoint_id FROM checkpoints
+                    WHERE thread_id = ? AND checkpoint_ns = ?
+                    ORDER BY checkpoint_id DESC LIMIT ?
+                )
+                """,
+                (thread_id, checkpoint_ns, thread_id, checkpoint_ns, self.max_checkpoints)
+            )
+            deleted = cur.rowcount
+            if deleted <= 0:
+                return
+            cur.execute(
+                """
+                DELETE FROM writes
+                WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id NOT IN (
+                    SELECT checkpoint_id FROM checkpoints
+                    WHERE thread_id = ? AND checkpoint_ns = ?
+                )
+                """,
+                (thread_id, checkpoint_ns, thread_id, checkpoint_ns)
+            )
+            deleted += cur.rowcount
+        self._deleted_since_compact += deleted
+        if self._deleted_since_compact >= self.compact_after:
+            self.compact()
+
+    def evict_threads(self) -> int:
+        """
+        期限切れのスレッドと、保持数を超えた古いスレッドを削除
+
+        Returns:
+            int: 削除したスレッド数
+        """
+        self._last_evict = time.monotonic()
+        with self.cursor() as cur:
+            expired = set()
+            if self.thread_ttl > 0:
+                cur.execute(
+                    "SELECT thread_id FROM thread_activity WHERE updated_at < ?",
+                    (time.time() - self.thread_ttl,)
+                )
+                expired.update(row[0] for row in cur.fetchall())
+            if self.max_threads > 0:
+                cur.execute(
+                    "SELECT thread_id FROM thread_activity ORDER BY updated_at DESC LIMIT -1 OFFSET ?",
+                    (self.max_threads,)
+                )
+                expired.update(row[0] for row in cur.fetchall())
+            deleted = 0
+            for thread_id in expired:
+                for table in ("checkpoints", "writes", "thread_activity"):
+                    cur.execute(f"DELETE FROM {table} WHERE thread_id = ?", (thread_id,))
+                    deleted += cur.rowcount
+        if expired:
+            print(f"🧹 古い会話スレッドを削除しました: {len(expired)}件")
+            self._deleted_since_compact += deleted
+            if self._deleted_since_compact >= self.compact_after:
+                self.compact()
+        return len(expired)
+
+    def delete_thread(self, thread_id: str) -> None:
+        """スレッドのチェックポイント・中間書き込み・最終書き込み時刻を削除"""
+        super().delete_thread(thread_id)
+        with self.cursor() as cur:
+            cur.execute("DELETE FROM thread_activity WHERE thread_id = ?", (str(thread_id),))
+
+    def compact(self):
+        """
+        削除済み領域を解放してファイルを圧縮
+
+        VACUUMはトランザクション外でしか実行できないため、先にコミットします。
+        """
+        with self.lock:
+            self.setup()
+            self._commit()
+            self.conn.execute("VACUUM")
+            self.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            self._deleted_since_compact = 0
+        print(f"🧹 チェックポイントを圧縮しました: {self.path}")
+
+    def get_stats(self) -> dict:
+        """
+        保存状況を取得
+
+        Returns:
+            dict: スレッド数・チェックポイント数・ファイルサイズ・未コミット数
+        """
+        with self.cursor(transaction=False) as cur:
+            cur.execute("SELECT COUNT(DISTINCT thread_id), COUNT(*) FROM checkpoints")
+            threads, checkpoints = cur.fetchone()
+        return {
+            "path": self.path,
+            "threads": threads,
+            "checkpoints": checkpoints,
+            "size_bytes": os.path.getsize(self.path) if os.path.exists(self.path) else 0,
+            "pending_writes": self._pending_writes
+        }
+
+    def close(self):
+        """未コミットの書き込みをコミットして接続を閉じる"""
+        if self._flush_timer is not None:
+            self._flush_timer.cancel()
+        try:
+            self.flush()
+            self.conn.close()
+        except sqlite3.ProgrammingError:
+            # 既に閉じている場合
+            pass
+
+    # 非同期API
+    # SQLiteへのアクセスは短時間で終わるため、同期APIをスレッドで実行する
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> AsyncIterator[CheckpointTuple]:
+        items = await asyncio.to_thread(
+            lambda: list(self.list(config, filter=filter, before=before, limit=limit))
+        )
+        for item in items:
+            yield item
+
+    async def aput(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        await asyncio.to_thread(self.delete_thread, thread_id)
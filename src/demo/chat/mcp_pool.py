@@ -0,0 +1,304 @@
+"""
+MCPセッションプールモジュール
+
+このモジュールは、バックグラウンドのイベントループ上で
+初期化済みのMCPセッションを保持し、ツール呼び出しで使い回します。
+トークン更新時の張り替えや、切断時の再接続を含みます。
+"""
+
+import asyncio
+import atexit
+import concurrent.futures
+import threading
+from contextlib import asynccontextmanager
+from typing import Any, Dict, List, Optional
+
+import anyio
+import httpx
+from mcp import ClientSession
+from mcp.client.streamable_http import streamablehttp_client
+
+from .resilience import GatewayResilience
+
+# セッションを張り直せば回復が見込めるトランスポート系の例外
+TRANSPORT_ERRORS = (
+    httpx.TransportError,
+    anyio.ClosedResourceError,
+    anyio.BrokenResourceError,
+    anyio.EndOfStream,
+    ConnectionError,
+)
+
+
+def is_retryable_error(error: BaseException) -> bool:
+    """再試行で回復が見込める例外か（通信エラー・スロットリング・一時的なサーバーエラー）"""
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code in (429, 502, 503, 504)
+    return isinstance(error, TRANSPORT_ERRORS)
+
+
+class _PooledSession:
+    """プール内の1セッション（接続を保持するタスクと組で管理）"""
+    
+    def __init__(self, session: ClientSession, token: str, stop_event: asyncio.Event, task: asyncio.Task):
+        self.session = session
+        self.token = token
+        self.stop_event = stop_event
+        self.task = task
+    
+    @property
+    def broken(self) -> bool:
+        """接続を保持するタスクが終了していれば切断済み"""
+        return self.task.done()
+
+
+class MCPSessionPool:
+    """
+    初期化済みのMCPセッションを使い回すプール
+    
+    専用スレッドで動くイベントループ上でセッションを保持するため、
+    同期・非同期どちらの呼び出し元からも利用できます。
+    ツール呼び出しごとの接続確立とinitializeハンドシェイクを省き、
+    1回のリクエスト/レスポンスで結果を得られるようにします。
+    """
+    
+    def __init__(self, gateway_url: str, token_manager, size: int = 4, call_timeout: float = 60,
+                 resilience: Optional[GatewayResilience] = None):
+        """
+        MCPセッションプールを初期化
+        
+        Args:
+            gateway_url (str): MCPゲートウェイのURL
+            token_manager (TokenManager): 認証用アクセストークンの管理
+            size (int): 同時に保持するセッション数の上限
+            call_timeout (float): ツール呼び出しの既定タイムアウト（秒）。再試行を含めた上限
+            resilience (Optional[GatewayResilience]): 再試行・レート制限・サーキットブレーカーの設定
+        """
+        self.gateway_url = gateway_url
+        self.token_manager = token_manager
+        self.size = size
+        self.call_timeout = call_timeout
+        self.resilience = resilience or GatewayResilience()
+        
+        self._idle: List[_PooledSession] = []
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._closed = False
+        self.stats = {"opened": 0, "reused": 0, "reconnects": 0}
+        
+        # 全セッションが共有するバックグラウンドのイベントループ
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="mcp-session-pool", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+    
+    # ---- バックグラウンドループ上で動く処理 ----
+    
+    async def _open(self) -> _PooledSession:
+        """セッションを確立して初期化する"""
+        token = await asyncio.to_thread(self.token_manager.get_token)
+        ready = self._loop.create_future()
+        stop_event = asyncio.Event()
+        
+        async def hold_connection():
+            # streamablehttp_clientは開始したタスク内で終了させる必要があるため、
+            # 接続ごとに専用タスクを立てて停止指示まで保持する
+            try:
+                async with streamablehttp_client(
+                    url=self.gateway_url,
+                    headers={"Authorization": f"Bearer {token}"},
+                ) as (read_stream, write_stream, _):
+                    async with ClientSession(read_stream, write_stream) as session:
+                        await session.initialize()
+                        ready.set_result(session)
+                        await stop_event.wait()
+            except BaseException as e:
+                if not ready.done():
+                    ready.set_exception(e)
+        
+        task = self._loop.create_task(hold_connection())
+        session = await ready
+        self.stats["opened"] += 1
+        print(f"MCPセッションを確立しました（累計: {self.stats['opened']}）")
+        return _PooledSession(session, token, stop_event, task)
+    
+    async def _close_session(self, pooled: _PooledSession):
+        """セッションを終了する"""
+        pooled.stop_event.set()
+        try:
+            await asyncio.wait_for(pooled.task, timeout=5)
+        except Exception:
+            pooled.task.cancel()
+    
+    @asynccontextmanager
+    async def _acquire(self):
+        """プールからセッションを借りる（トークンが更新済み・切断済みなら張り直す）"""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.size)
+        
+        async with self._semaphore:
+            pooled = self._idle.pop() if self._idle else None
+            if pooled is not None:
+                current_token = await asyncio.to_thread(self.token_manager.get_token)
+                if pooled.broken or pooled.token != current_token:
+                    await self._close_session(pooled)
+                    pooled = None
+                else:
+                    self.stats["reused"] += 1
+            if pooled is None:
+                pooled = await self._open()
+            
+            reusable = True
+            try:
+                yield pooled
+            except TRANSPORT_ERRORS:
+                reusable = False
+                raise
+            finally:
+                if reusable and not pooled.broken and not self._closed:
+                    self._idle.append(pooled)
+                else:
+                    await self._close_session(pooled)
+    
+    async def _call_tool(self, name: str, arguments: Dict[str, Any], timeout: float):
+        """
+        ツールを呼び出す（レート制限・サーキットブレーカー・再試行を適用）
+        
+        冪等なツールのみ、一時的なエラーをジッター付きの待ち時間をおいて再試行します。
+        再試行を含めた全体の所要時間はtimeout秒以内に収めます。
+        """
+        resilience = self.resilience
+        breaker = resilience.breaker_for(name)
+        breaker.before_call()
+        
+        deadline = self._loop.time() + timeout
+        attempts = resilience.attempts_for(name)
+        for attempt in range(attempts):
+            try:
+                await resilience.rate_limiter.acquire()
+                result = await self._call_tool_once(name, arguments, max(deadline - self._loop.time(), 0.001))
+            except asyncio.CancelledError:
+                # 呼び出し元のタイムアウトなどで中断された場合
+                breaker.release()
+                raise
+            except Exception as e:
+                retryable = is_retryable_error(e)
+                if retryable or isinstance(e, asyncio.TimeoutError):
+                    breaker.record_failure()
+                else:
+                    # レート制限などターゲットの異常ではないエラーは失敗に数えない
+                    breaker.release()
+                if not retryable or attempt + 1 >= attempts or breaker.state == "open":
+                    raise
+                delay = resilience.backoff(attempt)
+                if self._loop.time() + delay >= deadline:
+                    raise
+                print(f"ツール '{name}' を再試行します（{attempt + 1}/{attempts - 1}回目、{delay:.2f}秒後）: {str(e)}")
+                # 期限内に再試行できる場合のみ数える
+                resilience.stats["retries"] += 1
+                await asyncio.sleep(delay)
+                continue
+            
+            # ツール側のエラー（isError）もターゲットの異常として数える
+            if getattr(result, "isError", False):
+                breaker.record_failure()
+            else:
+                breaker.record_success()
+            return result
+    
+    async def _call_tool_once(self, name: str, arguments: Dict[str, Any], timeout: float):
+        """ツールを1回呼び出す（切断されていた場合は1回だけ張り直して再実行）"""
+        for attempt in range(2):
+            try:
+                async with self._acquire() as pooled:
+                    return await asyncio.wait_for(
+                        pooled.session.call_tool(name=name, arguments=arguments),
+                        timeout=timeout
+                    )
+            except TRANSPORT_ERRORS as e:
+                if attempt > 0:
+                    raise
+                self.stats["reconnects"] += 1
+                print(f"MCPセッションが切断されていたため再接続します: {str(e)}")
+    
+    async def _list_tools(self):
+        """ツール一覧を全ページ取得する"""
+        async with self._acquire() as pooled:
+            tools = []
+            cursor = None
+            while True:
+                print(f"ツール一覧取得中... (cursor: {cursor})")
+                list_tools_response = await pooled.session.list_tools(cursor)
+                tools.extend(list_tools_response.tools)
+                print(f"取得したツール数: {len(list_tools_response.tools)}")
+                cursor = list_tools_response.nextCursor
+                if not cursor:
+                    return tools
+    
+    async def _shutdown(self):
+        while self._idle:
+            await self._close_session(self._idle.pop())
+    
+    # ---- 呼び出し元スレッドから使う処理 ----
+    
+    def _submit(self, coro):
+        if self._closed:
+            coro.close()
+            raise RuntimeError("MCPセッションプールは終了しています")
+        return asyncio.run_coroutine_threadsafe(coro, self._loop)
+    
+    def call_tool_sync(self, name: str, arguments: Dict[str, Any], timeout: float = None):
+        """
+        ツールを同期的に呼び出す
+        
+        Args:
+            name (str): MCPツール名
+            arguments (Dict[str, Any]): ツールに渡す引数
+            timeout (float): タイムアウト（秒）。省略時はプールの既定値
+            
+        Returns:
+            CallToolResult: MCPのツール実行結果
+        """
+        timeout = timeout or self.call_timeout
+        # プールの空き待ち・レート制限待ちも含めて、呼び出し全体をtimeout秒で打ち切る
+        future = self._submit(self._call_tool(name, arguments, timeout))
+        try:
+            return future.result(timeout=timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise asyncio.TimeoutError()
+    
+    async def call_tool(self, name: str, arguments: Dict[str, Any], timeout: float = None):
+        """
+        ツールを非同期に呼び出す（呼び出し元のイベントループは問わない）
+        
+        Args:
+            name (str): MCPツール名
+            arguments (Dict[str, Any]): ツールに渡す引数
+            timeout (float): タイムアウト（秒）。省略時はプールの既定値
+            
+        Returns:
+            CallToolResult: MCPのツール実行結果
+        """
+        timeout = timeout or self.call_timeout
+        return await asyncio.wrap_future(self._submit(self._call_tool(name, arguments, timeout)))
+    
+    async def list_tools(self):
+        """ツール一覧を非同期に取得"""
+        return await asyncio.wrap_future(self._submit(self._list_tools()))
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """プールの利用状況と、再試行・レート制限・サーキットブレーカーの状況を取得"""
+        return dict(self.stats, idle=len(self._idle), size=self.size, resilience=self.resilience.get_stats())
+    
+    def close(self):
+        """全セッションを終了してイベントループを停止"""
+        if self._closed:
+            return
+        self._closed = True
+        # 再初期化で作り直した場合に、終了済みのプールをatexitに残さない
+        atexit.unregister(self.close)
+        try:
+            asyncio.run_coroutine_threadsafe(self._shutdown(), self._loop).result(timeout=10)
+        except Exception as e:
+            print(f"MCPセッションプール終了時のエラー: {str(e)}")
+        self._loop.call_soon_threadsafe(self._loop.stop)
@@ -7,12 +7,54 @@ OAuth2認証、ツール呼び出し、エラーハンドリングを含みま
 """
 
 import asyncio
+import json
 import os
+import tempfile
+import threading
+import time
 import requests
-from typing import List, Dict, Any, Optional
+from requests.adapters import HTTPAdapter
+from typing import Callable, List, Dict, Any, Optional, Type
 from langchain.tools import BaseTool
-from mcp import ClientSession
-from mcp.client.streamable_http import streamablehttp_client
+from mcp.types import Tool
+from pydantic import BaseModel
+
+from .mcp_pool import MCPSessionPool
+from .resilience import GatewayResilience
+from .tool_catalog import CatalogDiff, ToolCatalogCache
+from .tool_index import ToolIndex, ToolSelection
+from .tool_schema import args_model_for_tool, format_validation_error
+
+def _request_token(session, client_id: str, client_secret: str, token_url: str) -> Dict[str, Any]:
+    """
+    トークンエンドポイントを呼び出し、レスポンス全体を返す
+    
+    Args:
+        session: requestsモジュールまたはrequests.Session
+        client_id (str): OAuth2クライアントID
+        client_secret (str): OAuth2クライアントシークレット
+        token_url (str): トークン取得エンドポイントURL
+        
+    Returns:
+        Dict[str, Any]: access_token、expires_inなどを含むレスポンス
+        
+    Raises:
+        Exception: トークン取得に失敗した場合
+    """
+    response = session.post(
+        token_url,
+        data=f"grant_type=client_credentials&client_id={client_id}&client_secret={client_secret}",
+        headers={'Content-Type': 'application/x-www-form-urlencoded'},
+        timeout=30
+    )
+    
+    if response.status_code != 200:
+        raise Exception(f"トークン取得失敗: HTTP {response.status_code} - {response.text}")
+    
+    token_data = response.json()
+    if 'access_token' not in token_data:
+        raise Exception(f"トークンレスポンスにaccess_tokenが含まれていません: {token_data}")
+    return token_data
 
 def fetch_access_token(client_id: str, client_secret: str, token_url: str) -> str:
     """
@@ -31,20 +73,7 @@ def fetch_access_token(client_id: str, client_secret: str, token_url: str) -> st
     """
     try:
         print(f"OAuth2トークン取得中: {token_url}")
-        response = requests.post(
-            token_url,
-            data=f"grant_type=client_credentials&client_id={client_id}&client_secret={client_secret}",
-            headers={'Content-Type': 'application/x-www-form-urlencoded'},
-            timeout=30
-        )
-        
-        if response.status_code != 200:
-            raise Exception(f"トークン取得失敗: HTTP {response.status_code} - {response.text}")
-        
-        token_data = response.json()
-        if 'access_token' not in token_data:
-            raise Exception(f"トークンレスポンスにaccess_tokenが含まれていません: {token_data}")
-        
+        token_data = _request_token(requests, client_id, client_secret, token_url)
         print("OAuth2トークン取得成功")
         return token_data['access_token']
         
@@ -52,6 +81,97 @@ def fetch_access_token(client_id: str, client_secret: str, token_url: str) -> st
         print(f"OAuth2トークン取得エラー: {str(e)}")
         raise
 
+class TokenManager:
+    """
+    OAuth2アクセストークンをキャッシュし、有効期限前に自動更新するクラス
+    
+    コネクションプール付きのrequests.Sessionを再利用し、
+    同時に複数の呼び出し元から要求された場合も更新は1回だけ行います。
+    有効期限の手前ではバックグラウンドスレッドが先回りして更新します。
+    """
+    
+    def __init__(self, client_id: str, client_secret: str, token_url: str,
+                 refresh_margin: int = 300, retry_interval: int = 30):
+        """
+        トークンマネージャーを初期化
+        
+        Args:
+            client_id (str): OAuth2クライアントID
+            client_secret (str): OAuth2クライアントシークレット
+            token_url (str): トークン取得エンドポイントURL
+            refresh_margin (int): 有効期限の何秒前に更新するか
+            retry_interval (int): バックグラウンド更新失敗時の再試行間隔（秒）
+        """
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.token_url = token_url
+        self.refresh_margin = refresh_margin
+        self.retry_interval = retry_interval
+        
+        # コネクションを再利用するためのセッション
+        self._session = requests.Session()
+        self._session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=4))
+        
+        self._lock = threading.Lock()
+        self._token: Optional[str] = None
+        self._refresh_at = 0.0
+        self._stop_event = threading.Event()
+        self._refresher: Optional[threading.Thread] = None
+    
+    def get_token(self) -> str:
+        """
+        有効なアクセストークンを返す
+        
+        Returns:
+            str: アクセストークン（期限切れ間近の場合は更新後のもの）
+        """
+        token = self._token
+        if token and time.monotonic() < self._refresh_at:
+            return token
+        
+        # 同時に呼ばれた場合も更新は1回だけ行う
+        with self._lock:
+            if self._token and time.monotonic() < self._refresh_at:
+                return self._token
+            self._refresh_locked()
+            self._start_refresher()
+            return self._token
+    
+    def _refresh_locked(self):
+        """トークンを取得してキャッシュを更新（ロック保持中に呼び出す）"""
+        print(f"OAuth2トークン取得中: {self.token_url}")
+        token_data = _request_token(self._session, self.client_id, self.client_secret, self.token_url)
+        expires_in = int(token_data.get('expires_in', 3600))
+        self._token = token_data['access_token']
+        # 有効期限が短い場合でも期限の半分までは使い回す
+        self._refresh_at = time.monotonic() + max(expires_in - self.refresh_margin, expires_in / 2)
+        print(f"OAuth2トークン取得成功（有効期限: {expires_in}秒）")
+    
+    def _start_refresher(self):
+        """バックグラウンド更新スレッドを開始"""
+        if self._refresher is not None and self._refresher.is_alive():
+            return
+        self._refresher = threading.Thread(target=self._refresh_loop, name="token-refresher", daemon=True)
+        self._refresher.start()
+    
+    def _refresh_loop(self):
+        """有効期限の手前でトークンを更新し続ける"""
+        wait = max(self._refresh_at - time.monotonic(), 0)
+        while not self._stop_event.wait(wait):
+            try:
+                with self._lock:
+                    self._refresh_locked()
+                wait = max(self._refresh_at - time.monotonic(), self.retry_interval)
+            except Exception as e:
+                # 失敗時は一定間隔で再試行
+                print(f"OAuth2トークンのバックグラウンド更新エラー: {str(e)}")
+                wait = self.retry_interval
+    
+    def close(self):
+        """バックグラウンド更新を停止してセッションを閉じる"""
+        self._stop_event.set()
+        self._session.close()
+
 class MCPToolWrapper(BaseTool):
     """
     MCPツールをLangChainツールとしてラップするクラス
@@ -59,41 +179,90 @@ class MCPToolWrapper(BaseTool):
     このクラスは、MCPプロトコルで提供されるツールを
     LangChainのBaseToolインターフェースに適合させます。
     同期・非同期両方の実行をサポートします。
+    ツール呼び出しは共有のMCPセッションプール上で行います。
     """
     
     # 必須フィールドをOptionalに変更
     # LangChainのBaseToolとの互換性のため
     mcp_tool_name: Optional[str] = None
-    gateway_url: Optional[str] = None
-    access_token: Optional[str] = None
+    pool: Optional[Any] = None
+    timeout: Optional[float] = None
     
-    def __init__(self, mcp_tool_name: str, description: str, gateway_url: str, access_token: str):
+    def __init__(self, mcp_tool_name: str, description: str, pool: MCPSessionPool, timeout: Optional[float] = None,
+                 args_schema: Optional[Type[BaseModel]] = None):
         """
         MCPツールラッパーを初期化
         
         Args:
             mcp_tool_name (str): MCPツールの名前
             description (str): ツールの説明
-            gateway_url (str): MCPゲートウェイのURL
-            access_token (str): 認証用アクセストークン
+            pool (MCPSessionPool): 共有のMCPセッションプール
+            timeout (Optional[float]): このツールのタイムアウト（秒）。省略時はプールの既定値
+            args_schema (Optional[Type[BaseModel]]): inputSchemaから生成した引数モデル。
+                指定した場合、呼び出し前にローカルで引数を検証する
         """
         # 親クラスの初期化を適切に行う
+        # 引数の検証エラーはゲートウェイを呼ばずにツール結果としてモデルへ返す
+        extra = {"args_schema": args_schema} if args_schema is not None else {}
         super().__init__(
             name=mcp_tool_name,
-            description=description
+            description=description,
+            handle_validation_error=format_validation_error,
+            **extra
         )
         # インスタンス変数として設定
         self.mcp_tool_name = mcp_tool_name
-        self.gateway_url = gateway_url
-        self.access_token = access_token
-
+        self.pool = pool
+        self.timeout = timeout
+    
+    def _validate(self, kwargs: Dict[str, Any]) -> Optional[str]:
+        """
+        ツール呼び出し前の検証
+        
+        Returns:
+            Optional[str]: 問題がある場合はエラーメッセージ
+        """
+        # 設定の検証
+        # 引数はargs_schemaで検証済み（ツール呼び出し前にLangChainが検証する）
+        if not self.pool:
+            return "MCPツールの設定が不完全です"
+        return None
+    
+    @staticmethod
+    def _to_arguments(kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        """検証済みの引数をMCPに送るJSON互換の値に変換（ネストしたモデルを辞書にする）"""
+        return {
+            key: value.model_dump(exclude_none=True) if isinstance(value, BaseModel) else value
+            for key, value in kwargs.items()
+        }
+    
+    def _format_result(self, result) -> str:
+        """MCPのツール実行結果を文字列に変換"""
+        print(f"✅ ツール呼び出し成功: {self.mcp_tool_name}")
+        
+        # 複数の結果形式に対応
+        if hasattr(result, 'content') and result.content:
+            return str(result.content)
+        elif hasattr(result, 'text') and result.text:
+            return str(result.text)
+        else:
+            return f"ツール '{self.mcp_tool_name}' の実行が完了しましたが、結果が空です。"
+    
+    def _format_error(self, e: Exception) -> str:
+        """エラーをツール結果として返すメッセージに変換"""
+        if isinstance(e, asyncio.TimeoutError):
+            error_msg = f"タイムアウトしました（{self.timeout or self.pool.call_timeout}秒）"
+        else:
+            error_msg = str(e)
+        print(f"MCPツール '{self.mcp_tool_name}' エラー詳細: {error_msg}")
+        return f"ツール '{self.mcp_tool_name}' の実行中にエラーが発生しました: {error_msg}"
     
     def _run(self, **kwargs) -> str:
         """
         MCPツールを実行（同期版）
         
-        LangChainの同期インターフェースに合わせて、
-        非同期のMCPツール呼び出しを同期処理で実行します。
+        共有プールのバックグラウンドイベントループ上で実行し、
+        結果を待ち合わせます。
         
         Args:
             **kwargs: ツールに渡すパラメータ
@@ -101,28 +270,28 @@ class MCPToolWrapper(BaseTool):
         Returns:
             str: ツール実行結果またはエラーメッセージ
         """
+        error = self._validate(kwargs)
+        if error:
+            return error
+        
         try:
-            # run_agent.pyの方式に合わせて同期処理
-            # 新しいイベントループを作成して非同期処理を実行
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            try:
-                result = loop.run_until_complete(self._arun(**kwargs))
-                return result
-            finally:
-                loop.close()
+            print(f"🔧 MCPツール呼び出し開始: {self.mcp_tool_name}")
+            print(f"📝 引数: {kwargs}")
+            result = self.pool.call_tool_sync(self.mcp_tool_name, self._to_arguments(kwargs), timeout=self.timeout)
+            return self._format_result(result)
         except Exception as e:
-            # エラーが発生した場合の処理
-            error_msg = f"MCPツール '{self.mcp_tool_name}' の実行中にエラーが発生しました: {str(e)}"
-            print(error_msg)
-            return error_msg
+            return self._format_error(e)
     
     async def _arun(self, **kwargs) -> str:
         """
         MCPツールを実行（非同期版）
         
-        MCPプロトコルを使用してツールを非同期で実行します。
-        パラメータ検証、認証、エラーハンドリングを含みます。
+        共有プールの初期化済みセッションを使い、
+        call_toolの1往復だけで結果を取得します。
+        1ステップで複数のツール呼び出しがあった場合は並行して実行され、
+        同時実行数はプールのセッション数で制限されます。
+        失敗しても例外は送出せず、他の呼び出しを止めないよう
+        エラーメッセージを結果として返します。
         
         Args:
             **kwargs: ツールに渡すパラメータ
@@ -130,66 +299,22 @@ class MCPToolWrapper(BaseTool):
         Returns:
             str: ツール実行結果またはエラーメッセージ
         """
-        # 設定の検証
-        if not self.gateway_url or not self.access_token:
-            return "MCPツールの設定が不完全です"
-        
-        # パラメータ検証を追加
-        # 特定のツールで必須パラメータをチェック
-        if self.mcp_tool_name == "x_amz_bedrock_agentcore_search":
-            if not kwargs.get("query"):
-                return "検索ツールには必須の'query'パラメータが必要です。検索クエリを指定してください。"
+        error = self._validate(kwargs)
+        if error:
+            return error
         
         try:
-            # 認証ヘッダーの設定
-            headers = {
-                "Authorization": f"Bearer {self.access_token}"
-            }
-            
-            # デバッグ情報の出力
             print(f"🔧 MCPツール呼び出し開始: {self.mcp_tool_name}")
             print(f"📝 引数: {kwargs}")
-            print(f"🌐 ゲートウェイURL: {self.gateway_url}")
-            print(f"🔑 アクセストークン: {'設定済み' if self.access_token else '未設定'}")
-            
-            # MCPクライアントを使用してツールを実行
-            async with streamablehttp_client(
-                url=self.gateway_url,
-                headers=headers,
-            ) as (read_stream, write_stream, callA):
-                async with ClientSession(read_stream, write_stream) as session:
-                    # セッションの初期化
-                    print(f"🔄 セッション初期化中: {self.mcp_tool_name}")
-                    await session.initialize()
-                    print(f"✅ セッション初期化完了: {self.mcp_tool_name}")
-                    
-                    # ツールの実行
-                    print(f"🚀 ツール実行中: {self.mcp_tool_name}")
-                    result = await session.call_tool(
-                        name=self.mcp_tool_name,
-                        arguments=kwargs
-                    )
-                    
-                    print(f"✅ ツール呼び出し成功: {self.mcp_tool_name}")
-                    
-                    # 結果の処理を改善
-                    # 複数の結果形式に対応
-                    if hasattr(result, 'content') and result.content:
-                        return str(result.content)
-                    elif hasattr(result, 'text') and result.text:
-                        return str(result.text)
-                    else:
-                        return f"ツール '{self.mcp_tool_name}' の実行が完了しましたが、結果が空です。"
-                    
+            # プールの空き待ちも含めてタイムアウトを適用する
+            timeout = self.timeout or self.pool.call_timeout
+            result = await asyncio.wait_for(
+                self.pool.call_tool(self.mcp_tool_name, self._to_arguments(kwargs), timeout=timeout),
+                timeout=timeout
+            )
+            return self._format_result(result)
         except Exception as e:
-            # エラーハンドリング
-            error_msg = str(e)
-            print(f"MCPツール '{self.mcp_tool_name}' エラー詳細: {error_msg}")
-            import traceback
-            print(f"詳細なエラー情報: {traceback.format_exc()}")
-            
-            # エラーメッセージの返却
-            return f"ツール '{self.mcp_tool_name}' の実行中にエラーが発生しました: {error_msg}"
+            return self._format_error(e)
 
 class MCPToolManager:
     """
@@ -205,14 +330,44 @@ class MCPToolManager:
         
         Attributes:
             gateway_url (str): MCPゲートウェイのURL
-            access_token (str): 認証用アクセストークン
+            token_manager (TokenManager): 認証用アクセストークンの管理
             tools (list): 利用可能なツール一覧
             initialized (bool): 初期化完了フラグ
+            tool_catalog (ToolCatalogCache): ツール定義一覧のキャッシュ
+            pool (MCPSessionPool): ツール呼び出しで共有するMCPセッションプール
+            max_concurrency (int): ツール呼び出しの同時実行数の上限
+            tool_timeouts (Dict[str, float]): ツールごとのタイムアウト（秒）
+            preselect_enabled (bool): ツール事前選択を行うか
+            preselect_top_k (int): 事前選択でスコア上位から選ぶツール数
+            preselect_min_score (float): 事前選択の確信度のしきい値
+            preselect_pinned (List[str]): 事前選択で常に含めるツール名
         """
         self.gateway_url = None
-        self.access_token = None
+        self.token_manager = None
+        self.pool = None
         self.tools = []
         self.initialized = False
+        self.tool_catalog = ToolCatalogCache(
+            os.getenv(
+                "MCP_TOOL_CATALOG_SNAPSHOT",
+                os.path.join(tempfile.gettempdir(), "demo_tool_catalog.json")
+            ),
+            ttl=int(os.getenv("MCP_TOOL_CATALOG_TTL", "600"))
+        )
+        self._catalog_listeners: List[Callable[[CatalogDiff], None]] = []
+        # ツール呼び出しの同時実行数とツールごとのタイムアウト（秒）
+        self.max_concurrency = int(os.getenv("MCP_TOOL_CONCURRENCY", "4"))
+        self.tool_timeouts: Dict[str, float] = json.loads(os.getenv("MCP_TOOL_TIMEOUTS", "{}"))
+        # ツール事前選択（プロンプトに関連する上位のツールのみをモデルに渡す）
+        self.preselect_enabled = os.getenv("TOOL_PRESELECT_ENABLED", "true").lower() == "true"
+        self.preselect_top_k = int(os.getenv("TOOL_PRESELECT_TOP_K", "5"))
+        self.preselect_min_score = float(os.getenv("TOOL_PRESELECT_MIN_SCORE", "0.5"))
+        self.preselect_pinned: List[str] = json.loads(os.getenv("TOOL_PRESELECT_PINNED", "[]"))
+        self._tool_index: Optional[ToolIndex] = None
+        self._tool_index_key = None
+        # inputSchemaから生成した引数モデル（カタログのバージョンごとに作り直す）
+        self._args_schemas: Dict[str, Optional[Type[BaseModel]]] = {}
+        self._args_schemas_key = None
     
     def initialize(self) -> bool:
         """MCPゲートウェイに接続してツール一覧を取得"""
@@ -232,19 +387,45 @@ class MCPToolManager:
             
             print("MCPゲートウェイに接続中...")
             
+            # 再試行の場合は前回作成したトークンマネージャー・セッションプールを終了する
+            self.close()
+            
             # アクセストークンを取得
             client_id = os.getenv("MCP_CLIENT_ID")
             client_secret = os.getenv("MCP_CLIENT_SECRET")
             token_url = os.getenv("MCP_TOKEN_URL")
             
             print(f"トークン取得中: {token_url}")
-            self.access_token = fetch_access_token(client_id, client_secret, token_url)
+            self.token_manager = TokenManager(
+                client_id,
+                client_secret,
+                token_url,
+                refresh_margin=int(os.getenv("MCP_TOKEN_REFRESH_MARGIN", "300"))
+            )
+            self.token_manager.get_token()
             self.gateway_url = os.getenv("MCP_GATEWAY_URL")
             print(f"アクセストークン取得完了: {self.gateway_url}")
             
+            # 全ツールで共有するMCPセッションプール
+            # セッション数がツールの同時実行数の上限になる
+            self.pool = MCPSessionPool(
+                self.gateway_url,
+                self.token_manager,
+                size=self.max_concurrency,
+                call_timeout=float(os.getenv("MCP_TOOL_TIMEOUT", "30")),
+                resilience=GatewayResilience.from_env()
+            )
+            
             # ツール一覧を取得
-            print("ツール一覧を取得中...")
-            self.tools = asyncio.run(self._get_tools_list())
+            # スナップショットがあれば即座に使い、バックグラウンドで再検証する
+            if self.tool_catalog.load_snapshot():
+                self.tools = [Tool.model_validate(d) for d in self.tool_catalog.definitions]
+                self.refresh_tool_catalog()
+            else:
+                print("ツール一覧を取得中...")
+                self.tools = asyncio.run(self._get_tools_list())
+                if self.tools:
+                    self.tool_catalog.update(self._to_definitions(self.tools))
             self.initialized = True
             
             print(f"MCPゲートウェイに接続しました。利用可能なツール: {len(self.tools)}個")
@@ -258,40 +439,66 @@ class MCPToolManager:
             traceback.print_exc()
             return False
     
-    async def _get_tools_list(self) -> List[Dict[str, Any]]:
-        """利用可能なツール一覧を取得"""
-        headers = {
-            "Authorization": f"Bearer {self.access_token}"
-        }
+    def close(self):
+        """セッションプールとトークンのバックグラウンド更新を終了"""
+        self.initialized = False
+        if self.pool is not None:
+            self.pool.close()
+            self.pool = None
+        if self.token_manager is not None:
+            self.token_manager.close()
+            self.token_manager = None
+    
+    @staticmethod
+    def _to_definitions(tools: List[Tool]) -> List[Dict[str, Any]]:
+        """MCPツールをJSONに保存可能な定義に変換"""
+        return [tool.model_dump(mode="json", exclude_none=True) for tool in tools]
+    
+    def _fetch_tool_definitions(self) -> List[Dict[str, Any]]:
+        """ゲートウェイからツール定義一覧を取得（失敗時は例外）"""
+        return self._to_definitions(asyncio.run(self._get_tools_list(raise_errors=True)))
+    
+    def refresh_tool_catalog(self) -> bool:
+        """
+        ツールカタログをバックグラウンドで再検証
         
+        Returns:
+            bool: 再検証を開始した場合True
+        """
+        return self.tool_catalog.revalidate_in_background(
+            self._fetch_tool_definitions,
+            self._apply_catalog_diff
+        )
+    
+    def add_catalog_listener(self, listener: Callable[[CatalogDiff], None]):
+        """
+        ツールカタログの変更通知を登録
+        
+        Args:
+            listener: カタログの内容が変わった場合のみ差分を受け取る関数
+        """
+        self._catalog_listeners.append(listener)
+    
+    def _apply_catalog_diff(self, diff: CatalogDiff):
+        """カタログの差分をツール一覧に反映し、登録済みのリスナーに通知"""
+        self.tools = [Tool.model_validate(d) for d in self.tool_catalog.definitions]
+        for listener in self._catalog_listeners:
+            try:
+                listener(diff)
+            except Exception as e:
+                print(f"ツールカタログ変更通知エラー: {str(e)}")
+    
+    async def _get_tools_list(self, raise_errors: bool = False) -> List[Tool]:
+        """利用可能なツール一覧を取得"""
         try:
-            async with streamablehttp_client(
-                url=self.gateway_url,
-                headers=headers,
-            ) as (read_stream, write_stream, callA):
-                async with ClientSession(read_stream, write_stream) as session:
-                    # 初期化
-                    print("MCPセッション初期化中...")
-                    await session.initialize()
-                    print("MCPセッション初期化完了")
-                    
-                    # 利用可能なツールをリスト
-                    cursor = True
-                    tools = []
-                    while cursor:
-                        next_cursor = cursor
-                        if type(cursor) == bool:
-                            next_cursor = None
-                        print(f"ツール一覧取得中... (cursor: {cursor})")
-                        list_tools_response = await session.list_tools(next_cursor)
-                        tools.extend(list_tools_response.tools)
-                        cursor = list_tools_response.nextCursor
-                        print(f"取得したツール数: {len(list_tools_response.tools)}")
-                    
-                    print(f"全ツール取得完了: {len(tools)}個")
-                    return tools
+            # 共有プールの初期化済みセッションで全ページ取得
+            tools = await self.pool.list_tools()
+            print(f"全ツール取得完了: {len(tools)}個")
+            return tools
         except Exception as e:
             print(f"ツール一覧取得エラー: {str(e)}")
+            if raise_errors:
+                raise
             import traceback
             traceback.print_exc()
             return []
@@ -306,6 +513,10 @@ class MCPToolManager:
             print("利用可能なMCPツールがありません")
             return []
         
+        # TTLが切れていればバックグラウンドで再検証（今回は手元のカタログを使用）
+        if not self.tool_catalog.is_fresh():
+            self.refresh_tool_catalog()
+        
         print(f"MCPツールをLangChainツールに変換中... ({len(self.tools)}個)")
         langchain_tools = []
         for tool in self.tools:
@@ -314,8 +525,9 @@ class MCPToolManager:
                 wrapped_tool = MCPToolWrapper(
                     mcp_tool_name=tool.name,
                     description=tool.description or f"MCP tool: {tool.name}",
-                    gateway_url=self.gateway_url,
-                    access_token=self.access_token
+                    pool=self.pool,
+                    timeout=self.get_tool_timeout(tool.name),
+                    args_schema=self.get_args_schema(tool)
                 )
                 langchain_tools.append(wrapped_tool)
                 print(f"  ✅ {tool.name}: 変換成功")
@@ -326,6 +538,37 @@ class MCPToolManager:
         print(f"LangChainツール変換完了: {len(langchain_tools)}個")
         return langchain_tools
     
+    def get_args_schema(self, tool: Tool) -> Optional[Type[BaseModel]]:
+        """
+        ツールの引数モデルを取得（カタログのバージョンごとにキャッシュ）
+        
+        Args:
+            tool (Tool): MCPツール定義
+            
+        Returns:
+            Optional[Type[BaseModel]]: inputSchemaから生成した引数モデル。生成できない場合はNone
+        """
+        key = self.tool_catalog.version or tuple(t.name for t in self.tools)
+        if self._args_schemas_key != key:
+            self._args_schemas = {}
+            self._args_schemas_key = key
+        if tool.name not in self._args_schemas:
+            self._args_schemas[tool.name] = args_model_for_tool(tool.name, tool.inputSchema)
+        return self._args_schemas[tool.name]
+    
+    def get_tool_timeout(self, tool_name: str) -> Optional[float]:
+        """
+        ツールのタイムアウトを取得
+        
+        Args:
+            tool_name (str): MCPツール名（ターゲット接頭辞xxx___を除いた名前でも設定可能）
+            
+        Returns:
+            Optional[float]: 設定されていない場合はNone（プールの既定値を使用）
+        """
+        timeout = self.tool_timeouts.get(tool_name, self.tool_timeouts.get(tool_name.split("___", 1)[-1]))
+        return float(timeout) if timeout is not None else None
+    
     def get_tool_names(self) -> List[str]:
         """利用可能なツール名一覧を取得"""
         if not self.initialized:
@@ -336,6 +579,45 @@ class MCPToolManager:
         """利用可能なツールがあるかどうかを判定"""
         return self.initialized and self.tools and len(self.tools) > 0
     
+    def get_tool_index(self) -> Optional[ToolIndex]:
+        """
+        ツール事前選択インデックスを取得（カタログが変わった場合のみ作り直す）
+        
+        Returns:
+            Optional[ToolIndex]: 事前選択が無効、またはツールがない場合はNone
+        """
+        if not self.preselect_enabled or not self.tools:
+            return None
+        key = self.tool_catalog.version or tuple(tool.name for tool in self.tools)
+        if self._tool_index is None or self._tool_index_key != key:
+            self._tool_index = ToolIndex(self._to_definitions(self.tools))
+            unknown = self._tool_index.unknown_names(self.preselect_pinned)
+            if unknown:
+                print(f"⚠️ TOOL_PRESELECT_PINNEDに一致するツールがありません: {unknown}")
+            self._tool_index_key = key
+        return self._tool_index
+    
+    def select_tools(self, query: str, extra_tools: List[str] = ()) -> Optional[ToolSelection]:
+        """
+        プロンプトに関連するツールを選ぶ
+        
+        Args:
+            query (str): ユーザーのプロンプト
+            extra_tools (List[str]): 固定ツールに加えて含めるツール名（直前に使ったツールなど）
+            
+        Returns:
+            Optional[ToolSelection]: 選択結果。事前選択が無効な場合はNone（全ツールを使う）
+        """
+        index = self.get_tool_index()
+        if index is None:
+            return None
+        return index.select(
+            query,
+            top_k=self.preselect_top_k,
+            pinned=list(self.preselect_pinned) + list(extra_tools),
+            min_score=self.preselect_min_score
+        )
+    
     def get_available_tools(self) -> List[BaseTool]:
         """利用可能なツールのみを返す（動的取得）"""
         if self.has_available_tools():
@@ -357,5 +639,7 @@ class MCPToolManager:
             "status": "接続済み",
             "tools_count": len(self.tools),
             "tools": [{"name": tool.name, "description": tool.description} for tool in self.tools],
-            "gateway_url": self.gateway_url
+            "gateway_url": self.gateway_url,
+            "catalog_version": self.tool_catalog.version,
+            "pool": self.pool.get_stats() if self.pool else None
         }        
\ No newline at end of file
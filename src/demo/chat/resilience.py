@@ -0,0 +1,269 @@
+"""
+ゲートウェイ呼び出しの耐障害性モジュール
+
+このモジュールは、MCPツール呼び出しに対する以下の仕組みを提供します。
+- 冪等なツールに限ったジッター付きの再試行
+- ゲートウェイごとのトークンバケットによるクライアント側のレート制限
+- ターゲットごとのサーキットブレーカー（異常なターゲットへの呼び出しを即座に失敗させる）
+いずれもMCPセッションプールのイベントループ上で使うため、ロックは持ちません。
+"""
+
+import asyncio
+import json
+import os
+import random
+import time
+from typing import Any, Dict, Iterable
+
+
+class RateLimitExceeded(Exception):
+    """レート制限の待ち時間が上限を超えた"""
+
+
+class CircuitOpenError(Exception):
+    """サーキットブレーカーが開いているため呼び出さなかった"""
+
+
+def target_name(tool_name: str) -> str:
+    """
+    ツール名からゲートウェイのターゲット名を取得
+
+    Args:
+        tool_name (str): MCPツール名（例: "lambda___get_bigquery"）
+
+    Returns:
+        str: ターゲット名（接頭辞xxx___がないツールはツール名そのもの）
+    """
+    return tool_name.split("___", 1)[0]
+
+
+class TokenBucket:
+    """
+    トークンバケットによるレート制限
+
+    rate件/秒で補充され、最大burst件まで連続して呼び出せます。
+    空きを待つ時間がmax_waitを超える場合は待たずに失敗させ、
+    負荷の急増時にリクエストが積み上がらないようにします。
+    """
+
+    def __init__(self, rate: float, burst: int, max_wait: float = 5.0):
+        """
+        トークンバケットを初期化
+
+        Args:
+            rate (float): 1秒あたりの補充数（0以下なら制限しない）
+            burst (int): バケットの容量
+            max_wait (float): 空きを待つ最大秒数
+        """
+        self.rate = rate
+        self.burst = burst
+        self.max_wait = max_wait
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self.stats = {"acquired": 0, "throttled": 0, "rejected": 0}
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self):
+        """
+        呼び出し枠を1つ取得（必要なら補充まで待つ）
+
+        Raises:
+            RateLimitExceeded: 待ち時間がmax_waitを超える場合
+        """
+        if self.rate <= 0:
+            self.stats["acquired"] += 1
+            return
+
+        self._refill()
+        # 待ち時間は先に予約した分も含めて計算する（同時に待つ呼び出しの順序を保つ）
+        wait = (1 - self._tokens) / self.rate if self._tokens < 1 else 0.0
+        if wait > self.max_wait:
+            self.stats["rejected"] += 1
+            raise RateLimitExceeded(
+                f"ゲートウェイへの呼び出しが集中しています（待ち時間 {wait:.1f}秒）。しばらくしてから再度お試しください。"
+            )
+        self._tokens -= 1
+        if wait > 0:
+            self.stats["throttled"] += 1
+            await asyncio.sleep(wait)
+        self.stats["acquired"] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """レート制限の状況を取得"""
+        self._refill()
+        return dict(self.stats, tokens=round(self._tokens, 2), rate=self.rate, burst=self.burst)
+
+
+class CircuitBreaker:
+    """
+    ターゲットごとのサーキットブレーカー
+
+    連続してfailure_threshold回失敗すると開き（open）、reset_timeout秒の間は
+    呼び出さずに失敗させます。経過後は1件だけ試行し（half_open）、
+    成功すれば閉じ（closed）、失敗すれば再び開きます。
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        """
+        サーキットブレーカーを初期化
+
+        Args:
+            name (str): ターゲット名
+            failure_threshold (int): 開くまでの連続失敗回数
+            reset_timeout (float): 開いてから試行を再開するまでの秒数
+        """
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self.stats = {"opened": 0, "rejected": 0}
+
+    def before_call(self):
+        """
+        呼び出し可否を確認
+
+        Raises:
+            CircuitOpenError: 開いている場合、または試行中の呼び出しがある場合
+        """
+        if self.state == "open":
+            remaining = self.reset_timeout - (time.monotonic() - self._opened_at)
+            if remaining > 0:
+                self.stats["rejected"] += 1
+                raise CircuitOpenError(
+                    f"ターゲット '{self.name}' は一時的に利用できません（約{remaining:.0f}秒後に再試行します）"
+                )
+            self.state = "half_open"
+        if self.state == "half_open":
+            if self._trial_in_flight:
+                self.stats["rejected"] += 1
+                raise CircuitOpenError(f"ターゲット '{self.name}' は復旧確認中です。しばらくしてから再度お試しください。")
+            self._trial_in_flight = True
+
+    def record_success(self):
+        """成功を記録（閉じる）"""
+        if self.state != "closed":
+            print(f"✅ ターゲット '{self.name}' が復旧しました")
+        self.state = "closed"
+        self.failures = 0
+        self._trial_in_flight = False
+
+    def record_failure(self):
+        """失敗を記録（しきい値に達するか試行に失敗したら開く）"""
+        self.failures += 1
+        self._trial_in_flight = False
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            if self.state != "open":
+                self.stats["opened"] += 1
+                print(f"⚠️ ターゲット '{self.name}' への呼び出しを一時停止します（連続失敗: {self.failures}回）")
+            self.state = "open"
+            self._opened_at = time.monotonic()
+
+    def release(self):
+        """成功・失敗のどちらにも数えずに試行を終える（復旧確認中なら次の試行を許可）"""
+        self._trial_in_flight = False
+
+    def get_stats(self) -> Dict[str, Any]:
+        """サーキットブレーカーの状態を取得"""
+        return dict(self.stats, state=self.state, failures=self.failures)
+
+
+class GatewayResilience:
+    """
+    ゲートウェイ1つ分の再試行・レート制限・サーキットブレーカーをまとめるクラス
+
+    MCPSessionPoolがツール呼び出しのたびに使います。
+    """
+
+    def __init__(
+        self,
+        rate: float = 10.0,
+        burst: int = 20,
+        max_wait: float = 5.0,
+        max_attempts: int = 3,
+        base_delay: float = 0.2,
+        max_delay: float = 2.0,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30.0,
+        idempotent_tools: Iterable[str] = ()
+    ):
+        """
+        耐障害性の設定を初期化
+
+        Args:
+            rate (float): 1秒あたりの呼び出し数の上限（0以下なら制限しない）
+            burst (int): 連続して呼び出せる数
+            max_wait (float): レート制限の空きを待つ最大秒数
+            max_attempts (int): 冪等なツールの最大試行回数
+            base_delay (float): 再試行の待ち時間の基準（秒）
+            max_delay (float): 再試行の待ち時間の上限（秒）
+            failure_threshold (int): サーキットブレーカーが開くまでの連続失敗回数
+            reset_timeout (float): サーキットブレーカーが試行を再開するまでの秒数
+            idempotent_tools (Iterable[str]): 再試行してよいツール名（接頭辞xxx___を除いた名前でも可）
+        """
+        self.rate_limiter = TokenBucket(rate, burst, max_wait)
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.idempotent_tools = set(idempotent_tools)
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        self.stats = {"retries": 0}
+
+    @classmethod
+    def from_env(cls) -> "GatewayResilience":
+        """環境変数の設定で作成"""
+        return cls(
+            rate=float(os.getenv("MCP_RATE_LIMIT_PER_SEC", "10")),
+            burst=int(os.getenv("MCP_RATE_LIMIT_BURST", "20")),
+            max_wait=float(os.getenv("MCP_RATE_LIMIT_MAX_WAIT", "5")),
+            max_attempts=int(os.getenv("MCP_RETRY_MAX_ATTEMPTS", "3")),
+            base_delay=float(os.getenv("MCP_RETRY_BASE_DELAY", "0.2")),
+            max_delay=float(os.getenv("MCP_RETRY_MAX_DELAY", "2")),
+            failure_threshold=int(os.getenv("MCP_BREAKER_FAILURE_THRESHOLD", "5")),
+            reset_timeout=float(os.getenv("MCP_BREAKER_RESET_TIMEOUT", "30")),
+            idempotent_tools=json.loads(os.getenv(
+                "MCP_IDEMPOTENT_TOOLS",
+                '["x_amz_bedrock_agentcore_search", "get_bigquery", "get_table_schemas", "execute_sql", "get_googledrive"]'
+            ))
+        )
+
+    def breaker_for(self, tool_name: str) -> CircuitBreaker:
+        """ツールが属するターゲットのサーキットブレーカーを取得"""
+        name = target_name(tool_name)
+        if name not in self.breakers:
+            self.breakers[name] = CircuitBreaker(name, self.failure_threshold, self.reset_timeout)
+        return self.breakers[name]
+
+    def attempts_for(self, tool_name: str) -> int:
+        """ツールの最大試行回数（冪等でないツールは再試行しない）"""
+        if tool_name in self.idempotent_tools or tool_name.split("___", 1)[-1] in self.idempotent_tools:
+            return self.max_attempts
+        return 1
+
+    def backoff(self, attempt: int) -> float:
+        """
+        再試行までの待ち時間（full jitter）
+
+        Args:
+            attempt (int): 失敗した試行の番号（0始まり）
+
+        Returns:
+            float: 0〜min(max_delay, base_delay * 2^attempt)の一様乱数
+        """
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    def get_stats(self) -> Dict[str, Any]:
+        """再試行・レート制限・サーキットブレーカーの状況を取得"""
+        return {
+            "retries": self.stats["retries"],
+            "rate_limiter": self.rate_limiter.get_stats(),
+            "breakers": {name: breaker.get_stats() for name, breaker in self.breakers.items()}
+        }
@@ -6,9 +6,32 @@
 エラーハンドリングとフォールバック機能を含みます。
 """
 
+import asyncio
+import concurrent.futures
+import os
+import queue
+import threading
+import uuid
+from typing import AsyncIterator, Callable, Iterator, Optional, Tuple
+
 from .context import Context
 from .agent import ResponseFormat
 
+# エージェントを非同期に実行する共有のイベントループ
+# モデルの非同期HTTPクライアントはループをまたいで使えないため、呼び出しごとにループを作らない
+_agent_loop: Optional[asyncio.AbstractEventLoop] = None
+_agent_loop_lock = threading.Lock()
+
+
+def _run_in_agent_loop(coro) -> concurrent.futures.Future:
+    """共有のイベントループ（専用スレッドで実行）でコルーチンを実行する"""
+    global _agent_loop
+    with _agent_loop_lock:
+        if _agent_loop is None:
+            _agent_loop = asyncio.new_event_loop()
+            threading.Thread(target=_agent_loop.run_forever, name="chat-agent-loop", daemon=True).start()
+    return asyncio.run_coroutine_threadsafe(coro, _agent_loop)
+
 class ChatSession:
     """
     LangChainベストプラクティスに従ったチャットセッション管理クラス
@@ -17,15 +40,21 @@ class ChatSession:
     エラーハンドリングとフォールバック機能を提供します。
     """
     
-    def __init__(self, agent, user_id: str = "1"):
+    def __init__(self, agent, user_id: Optional[str] = None, streaming_agent=None):
         """
         チャットセッションを初期化
         
         Args:
             agent: LangChainエージェントインスタンス
-            user_id (str): ユーザーID（デフォルト: "1"）
+            user_id (Optional[str]): ユーザーID。会話スレッドの識別に使う。
+                省略時はセッションごとに一意なIDを生成する
+            streaming_agent: ストリーミング用のエージェント（response_formatなし）。
+                同じチェックポイントを使うことで会話履歴を共有する
         """
+        if user_id is None:
+            user_id = uuid.uuid4().hex
         self.agent = agent
+        self.streaming_agent = streaming_agent
         self.user_id = user_id
         # セッション設定（スレッドIDで会話を区別）
         self.config = {"configurable": {"thread_id": f"user_{user_id}"}}
@@ -33,6 +62,21 @@ class ChatSession:
         self.context = Context(user_id=user_id)
         
     def send_message(self, message: str) -> ResponseFormat:
+        """
+        ユーザーメッセージをエージェントに送信し、レスポンスを返す（同期版）
+        
+        非同期版のasend_messageを共有のイベントループ上で実行し、
+        1ステップ内の複数ツール呼び出しを並行して実行させます。
+        
+        Args:
+            message (str): ユーザーからのメッセージ
+            
+        Returns:
+            ResponseFormat: エージェントからの応答
+        """
+        return _run_in_agent_loop(self.asend_message(message)).result()
+    
+    async def asend_message(self, message: str) -> ResponseFormat:
         """
         ユーザーメッセージをエージェントに送信し、レスポンスを返す
         
@@ -45,18 +89,21 @@ class ChatSession:
         Note:
             - 再帰制限エラーが発生した場合はフォールバック応答を実行
             - ツール呼び出しエラーなどの適切なエラーハンドリングを提供
+            - 非同期実行のため、並列のツール呼び出しは同時に実行され、
+              結果は呼び出し順に返される
         """
         print(f"📤 send_message開始: {message[:50]}...")
         try:
             # 再帰制限を設定してツール呼び出しの無限ループを防止
             config_with_limit = {
                 **self.config,
-                "recursion_limit": 5
+                "recursion_limit": 5,
+                "max_concurrency": int(os.getenv("MCP_TOOL_CONCURRENCY", "4"))
             }
             
             # エージェントを呼び出し
             messages = [{"role": "user", "content": message}]
-            response = self.agent.invoke(
+            response = await self.agent.ainvoke(
                 {"messages": messages},
                 config=config_with_limit,
                 context=self.context
@@ -86,6 +133,107 @@ class ChatSession:
                 response=f"申し訳ございませんが、エラーが発生しました: {error_msg}"
             )
     
+    def stream_message(
+        self,
+        message: str,
+        on_tool_event: Optional[Callable[[str, str], None]] = None
+    ) -> Iterator[str]:
+        """
+        ユーザーメッセージをエージェントに送信し、応答をトークン単位で返す
+        
+        st.write_streamにそのまま渡せるよう、テキストの断片だけをyieldします。
+        ツールの開始・完了はon_tool_eventで通知します。
+        エージェントは共有のイベントループ上で非同期に実行するため、
+        1ステップ内の複数ツール呼び出しはasend_messageと同様に並行して実行されます。
+        
+        Args:
+            message (str): ユーザーからのメッセージ
+            on_tool_event (Optional[Callable[[str, str], None]]):
+                ツールイベントのコールバック。("tool_start" | "tool_end", ツール名)で呼ばれる
+            
+        Yields:
+            str: 応答テキストの断片
+            
+        Note:
+            - streaming_agentがない場合はsend_messageの結果をまとめて返す
+            - エラー時はsend_messageと同じフォールバック応答を返す
+            - on_tool_eventは呼び出し元のスレッドで呼ばれる（Streamlitの描画に使えるように）
+        """
+        if self.streaming_agent is None:
+            yield self.send_message(message).response
+            return
+        
+        print(f"📤 stream_message開始: {message[:50]}...")
+        events: queue.Queue = queue.Queue()
+        
+        async def produce():
+            try:
+                async for event in self._astream_events(message):
+                    events.put(event)
+            except Exception as e:
+                events.put(("error", e))
+            finally:
+                events.put(None)
+        
+        _run_in_agent_loop(produce())
+        while True:
+            event = events.get()
+            if event is None:
+                break
+            kind, value = event
+            if kind == "text":
+                yield value
+            elif kind == "error":
+                error_msg = str(value)
+                print(f"❌ stream_messageエラー: {error_msg}")
+                if "Recursion limit" in error_msg or "GraphRecursionError" in str(type(value)):
+                    yield "申し訳ございませんが、処理が複雑すぎるようです。もう少しシンプルな質問にしていただけますか？"
+                else:
+                    yield f"申し訳ございませんが、エラーが発生しました: {error_msg}"
+                return
+            elif on_tool_event:
+                on_tool_event(kind, value)
+        print("✅ stream_message成功")
+    
+    async def _astream_events(self, message: str) -> AsyncIterator[Tuple[str, str]]:
+        """
+        ストリーミング用エージェントを非同期に実行し、("text" | "tool_start" | "tool_end", 値)を返す
+        
+        Args:
+            message (str): ユーザーからのメッセージ
+            
+        Yields:
+            Tuple[str, str]: イベントの種類と、テキストの断片またはツール名
+        """
+        config_with_limit = {
+            **self.config,
+            "recursion_limit": 5,
+            "max_concurrency": int(os.getenv("MCP_TOOL_CONCURRENCY", "4"))
+        }
+        tool_names = {}
+        async for mode, chunk in self.streaming_agent.astream(
+            {"messages": [{"role": "user", "content": message}]},
+            config=config_with_limit,
+            context=self.context,
+            stream_mode=["messages", "updates"]
+        ):
+            if mode == "messages":
+                # モデルノードが生成したテキストのみを流す（ツール結果は除く）
+                token, metadata = chunk
+                if metadata.get("langgraph_node") == "model" and isinstance(token.content, str) and token.content:
+                    yield "text", token.content
+                continue
+            
+            # ノード単位の更新からツールの開始・完了を通知
+            for node, update in chunk.items():
+                for msg in (update or {}).get("messages", []):
+                    if node == "model":
+                        for tool_call in getattr(msg, "tool_calls", None) or []:
+                            tool_names[tool_call["id"]] = tool_call["name"]
+                            yield "tool_start", tool_call["name"]
+                    elif node == "tools":
+                        yield "tool_end", tool_names.get(getattr(msg, "tool_call_id", None), getattr(msg, "name", ""))
+    
     def _process_response(self, response) -> ResponseFormat:
         """
         エージェントからの応答を処理する共通メソッド
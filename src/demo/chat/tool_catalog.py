@@ -0,0 +1,162 @@
+"""
+ツールカタログキャッシュモジュール
+
+このモジュールは、MCPゲートウェイから取得したツール定義一覧を
+TTLと内容ハッシュで管理し、ローカルのスナップショットとして保存します。
+起動直後はスナップショットを使い、バックグラウンドで再検証します。
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+
+@dataclass
+class CatalogDiff:
+    """カタログの差分"""
+    version: str
+    added: List[str] = field(default_factory=list)
+    removed: List[str] = field(default_factory=list)
+    changed: List[str] = field(default_factory=list)
+
+
+def compute_catalog_version(definitions: List[Dict[str, Any]]) -> str:
+    """
+    ツール定義一覧の内容ハッシュを計算
+    
+    Args:
+        definitions (List[Dict[str, Any]]): MCPツール定義の一覧
+        
+    Returns:
+        str: カタログのバージョン（ツールの並び順に依存しない）
+    """
+    canonical = json.dumps(
+        sorted(definitions, key=lambda d: d.get("name", "")),
+        sort_keys=True,
+        ensure_ascii=False,
+        separators=(",", ":")
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:16]
+
+
+class ToolCatalogCache:
+    """
+    TTLと内容ハッシュでツール定義一覧を管理するクラス
+    
+    取得結果はローカルにスナップショットとして保存し、
+    内容が変わった場合のみ差分を通知します。
+    """
+
+    def __init__(self, snapshot_path: Optional[str], ttl: int = 600):
+        """
+        ツールカタログキャッシュを初期化
+        
+        Args:
+            snapshot_path (Optional[str]): スナップショットの保存先（Noneなら保存しない）
+            ttl (int): 再検証までの秒数
+        """
+        self.snapshot_path = snapshot_path
+        self.ttl = ttl
+        self.definitions: List[Dict[str, Any]] = []
+        self.version: Optional[str] = None
+        self.fetched_at = 0.0
+        self._lock = threading.Lock()
+        self._revalidating = False
+
+    def load_snapshot(self) -> bool:
+        """スナップショットを読み込む（存在しない・壊れている場合はFalse）"""
+        if not self.snapshot_path or not os.path.exists(self.snapshot_path):
+            return False
+        try:
+            with open(self.snapshot_path, encoding="utf-8") as f:
+                snapshot = json.load(f)
+            definitions = snapshot["tools"]
+            with self._lock:
+                self.definitions = definitions
+                self.version = compute_catalog_version(definitions)
+                self.fetched_at = float(snapshot.get("fetched_at", 0))
+            print(f"ツールカタログのスナップショットを読み込みました: {len(definitions)}個 (version={self.version})")
+            return True
+        except Exception as e:
+            print(f"ツールカタログのスナップショット読み込みエラー: {str(e)}")
+            return False
+
+    def is_fresh(self) -> bool:
+        return self.version is not None and time.time() - self.fetched_at < self.ttl
+
+    def update(self, definitions: List[Dict[str, Any]]) -> Optional[CatalogDiff]:
+        """
+        取得したツール定義でキャッシュを更新
+        
+        Args:
+            definitions (List[Dict[str, Any]]): 取得したMCPツール定義の一覧
+            
+        Returns:
+            Optional[CatalogDiff]: 内容が変わった場合のみ差分
+        """
+        version = compute_catalog_version(definitions)
+        with self._lock:
+            previous = {d.get("name"): d for d in self.definitions}
+            unchanged = version == self.version
+            self.definitions = definitions
+            self.version = version
+            self.fetched_at = time.time()
+        self._save_snapshot(definitions)
+        if unchanged:
+            return None
+
+        current = {d.get("name"): d for d in definitions}
+        return CatalogDiff(
+            version=version,
+            added=[name for name in current if name not in previous],
+            removed=[name for name in previous if name not in current],
+            changed=[name for name in current if name in previous and current[name] != previous[name]],
+        )
+
+    def revalidate_in_background(self, fetch: Callable[[], List[Dict[str, Any]]],
+                                 on_change: Callable[[CatalogDiff], None]) -> bool:
+        """
+        バックグラウンドでツール定義を再取得する
+        
+        Args:
+            fetch: ツール定義一覧を返す関数
+            on_change: 内容が変わった場合に差分を受け取る関数
+            
+        Returns:
+            bool: 再検証を開始した場合True（実行中の場合はFalse）
+        """
+        with self._lock:
+            if self._revalidating:
+                return False
+            self._revalidating = True
+
+        def worker():
+            try:
+                diff = self.update(fetch())
+                if diff is None:
+                    print(f"ツールカタログに変更はありません (version={self.version})")
+                    return
+                print(f"ツールカタログが更新されました: 追加{len(diff.added)} 削除{len(diff.removed)} 変更{len(diff.changed)}")
+                on_change(diff)
+            except Exception as e:
+                print(f"ツールカタログの再検証エラー: {str(e)}")
+            finally:
+                self._revalidating = False
+
+        threading.Thread(target=worker, name="tool-catalog-revalidate", daemon=True).start()
+        return True
+
+    def _save_snapshot(self, definitions: List[Dict[str, Any]]):
+        """スナップショットを書き出す（失敗しても処理は継続）"""
+        if not self.snapshot_path:
+            return
+        try:
+            tmp_path = f"{self.snapshot_path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"fetched_at": self.fetched_at, "tools": definitions}, f, ensure_ascii=False)
+            os.replace(tmp_path, self.snapshot_path)
+        except Exception as e:
+            print(f"ツールカタログのスナップショット保存エラー: {str(e)}")
@@ -0,0 +1,136 @@
+"""
+ツール引数スキーマ生成モジュール
+
+このモジュールは、MCPツールのinputSchema（JSON Schema）から
+Pydanticの引数モデルを生成します。
+モデルに正確なツールの引数定義を渡し、呼び出し前にローカルで引数を検証することで、
+不正な引数によるゲートウェイ往復とLLMの再試行を減らします。
+"""
+import keyword
+import re
+from typing import Any, Dict, List, Literal, Optional, Tuple, Type
+
+from pydantic import BaseModel, ConfigDict, Field, ValidationError, create_model
+
+# JSON Schemaの型とPythonの型の対応
+_SCALAR_TYPES = {
+    "string": str,
+    "integer": int,
+    "number": float,
+    "boolean": bool,
+}
+
+_IDENTIFIER = re.compile(r"^[A-Za-z][A-Za-z0-9_]*$")
+
+
+def _model_name(tool_name: str) -> str:
+    """ツール名からモデルのクラス名を作成"""
+    return "".join(part.capitalize() for part in re.split(r"[^A-Za-z0-9]+", tool_name) if part) + "Args"
+
+
+def _is_field_name(name: str) -> bool:
+    """Pydanticのフィールド名として使える名前か（BaseModelの属性と衝突しないこと）"""
+    return bool(_IDENTIFIER.match(name)) and not keyword.iskeyword(name) and not hasattr(BaseModel, name)
+
+
+def _python_type(schema: Dict[str, Any], model_name: str) -> Any:
+    """
+    JSON Schemaの1項目をPythonの型に変換
+
+    Args:
+        schema (Dict[str, Any]): プロパティのスキーマ
+        model_name (str): ネストしたオブジェクト用のモデル名
+
+    Returns:
+        Any: 対応する型（判別できない場合はAny）
+    """
+    if "enum" in schema and schema["enum"]:
+        return Literal[tuple(schema["enum"])]
+
+    schema_type = schema.get("type")
+    if isinstance(schema_type, list):
+        # ["string", "null"] のような型指定
+        types = [t for t in schema_type if t != "null"]
+        inner = _python_type({**schema, "type": types[0]}, model_name) if len(types) == 1 else Any
+        return Optional[inner] if "null" in schema_type else inner
+    if schema_type in _SCALAR_TYPES:
+        return _SCALAR_TYPES[schema_type]
+    if schema_type == "array":
+        return List[_python_type(schema.get("items") or {}, model_name + "Item")]
+    if schema_type == "object":
+        if schema.get("properties"):
+            return build_args_model(model_name, schema) or Dict[str, Any]
+        return Dict[str, Any]
+    return Any
+
+
+def build_args_model(model_name: str, input_schema: Optional[Dict[str, Any]]) -> Optional[Type[BaseModel]]:
+    """
+    inputSchemaから引数モデルを生成
+
+    Args:
+        model_name (str): 生成するモデルのクラス名
+        input_schema (Optional[Dict[str, Any]]): MCPツールのinputSchema
+
+    Returns:
+        Optional[Type[BaseModel]]: 引数モデル。フィールド名に使えないプロパティがある場合などはNone
+
+    Note:
+        - requiredにないプロパティは省略可能（既定値はスキーマのdefault、なければNone）
+        - additionalPropertiesがfalseの場合のみ、定義外の引数をエラーにする
+    """
+    if not input_schema or input_schema.get("type", "object") != "object":
+        return None
+
+    properties = input_schema.get("properties") or {}
+    if not all(_is_field_name(name) for name in properties):
+        return None
+
+    required = set(input_schema.get("required") or [])
+    fields: Dict[str, Tuple[Any, Any]] = {}
+    for name, prop in properties.items():
+        prop = prop if isinstance(prop, dict) else {}
+        field_type = _python_type(prop, f"{model_name}{name.capitalize()}")
+        description = prop.get("description")
+        if name in required:
+            fields[name] = (field_type, Field(..., description=description))
+        else:
+            fields[name] = (Optional[field_type], Field(prop.get("default"), description=description))
+
+    extra = "forbid" if input_schema.get("additionalProperties") is False else "allow"
+    return create_model(model_name, __config__=ConfigDict(extra=extra), **fields)
+
+
+def args_model_for_tool(tool_name: str, input_schema: Optional[Dict[str, Any]]) -> Optional[Type[BaseModel]]:
+    """
+    MCPツールの引数モデルを生成（生成に失敗した場合はNone）
+
+    Args:
+        tool_name (str): MCPツール名
+        input_schema (Optional[Dict[str, Any]]): MCPツールのinputSchema
+
+    Returns:
+        Optional[Type[BaseModel]]: 引数モデル。Noneの場合は検証をゲートウェイに任せる
+    """
+    try:
+        return build_args_model(_model_name(tool_name), input_schema)
+    except Exception as e:
+        print(f"引数スキーマ生成エラー ({tool_name}): {str(e)}")
+        return None
+
+
+def format_validation_error(error: ValidationError) -> str:
+    """
+    引数の検証エラーをモデルに返すメッセージに変換
+
+    Args:
+        error (ValidationError): Pydanticの検証エラー
+
+    Returns:
+        str: 修正すべき引数を列挙したメッセージ（モデルが引数を直して再試行できるようにする）
+    """
+    problems = []
+    for item in error.errors():
+        location = ".".join(str(part) for part in item.get("loc", ())) or "(引数全体)"
+        problems.append(f"- {location}: {item.get('msg')}")
+    return "ツールの引数が不正なため実行しませんでした。以下を修正して再度呼び出してください。\n" + "\n".join(problems)
@@ -0,0 +1,428 @@
+"""
+lambda_function のベンチマーク（クラウド環境不要）
+
+記録したゲートウェイのイベント（benchmark_events.json）をサブプロセスで再生し、以下を計測します。
+- モジュールのimport時間（-X importtimeによる内訳と、初回呼び出し時に遅延importされるモジュール）
+- コールド呼び出しとウォーム呼び出しの時間（イベントごとのp50/p99）
+  コールドはイベントごとにlambda_function・BigQuery SDK・クライアントのキャッシュを破棄してから計測します
+- 1回の呼び出しでのメモリ割り当て（tracemalloc）
+
+google.cloud.bigquery はAPIの遅延（--latency-ms）とimport時間（--import-delay-ms）を
+設定できる偽物に置き換えるため、GCPのアカウントや認証情報は不要です。
+
+使い方:
+    python benchmark.py                          # 計測して結果を表示
+    python benchmark.py --output before.json     # 結果をJSONで保存
+    python benchmark.py --compare before.json    # 保存した結果と比較（変更前後の確認）
+"""
+import argparse
+import datetime
+import importlib.abc
+import importlib.util
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import types
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_EVENTS = os.path.join(HERE, 'benchmark_events.json')
+
+# 偽のBigQueryが返すデータセット（src/bigquery/ddl のテーブルに合わせる）
+_FAKE_TABLES = {
+    'CUSTOMER_DATA': ['USERID STRING', 'NAME STRING', 'AGE INT64', 'GENDER STRING', 'LOCATION STRING'],
+    'TRANSACTION_DATA': ['USERID STRING', 'DATE DATE', 'CATEGORY STRING', 'UNIT FLOAT64',
+                         'QUANTITY INT64', 'AMOUNT FLOAT64', 'PAYMENT STRING', 'LOCATION STRING'],
+    'OVERDUE_TABLE': ['USERID STRING', 'DUE_DATE DATE', 'AMOUNT FLOAT64', 'STATUS STRING'],
+}
+
+
+class _FakeGoogleFinder(importlib.abc.MetaPathFinder, importlib.abc.Loader):
+    """
+    偽のgoogle.*モジュールをimport時に提供するファインダー。
+    google.cloud.bigquery の読み込みにimport_delay秒かかるようにし、
+    実際のSDKと同じく「初回のimportが遅い」状態を再現する。
+    """
+
+    def __init__(self, modules: dict, packages: set, import_delay: float):
+        self.modules = modules
+        self.packages = packages
+        self.import_delay = import_delay
+
+    def find_spec(self, fullname, path, target=None):
+        if fullname not in self.modules:
+            return None
+        return importlib.util.spec_from_loader(fullname, self, is_package=fullname in self.packages)
+
+    def create_module(self, spec):
+        return None
+
+    def exec_module(self, module):
+        if module.__name__ == 'google.cloud.bigquery' and self.import_delay > 0:
+            time.sleep(self.import_delay)
+        module.__dict__.update(self.modules[module.__name__])
+
+
+def _install_fake_bigquery(latency: float, result_rows: int, import_delay: float = 0.0):
+    """
+    google.cloud.bigquery 等の偽モジュールをimportできるようにする。
+    APIを呼ぶメソッドはlatency秒、google.cloud.bigqueryのimportはimport_delay秒待つ。
+    既に読み込み済みの（偽の）モジュールは破棄し、次のimportから遅延がかかるようにする。
+    """
+    _uninstall_fake_bigquery()
+
+    def api_call():
+        if latency > 0:
+            time.sleep(latency)
+
+    class GoogleAuthError(Exception):
+        pass
+
+    class Credentials:
+        @classmethod
+        def from_service_account_info(cls, info):
+            return cls()
+
+    class QueryJobConfig:
+        def __init__(self, **kwargs):
+            self.__dict__.update(kwargs)
+
+    class Row(dict):
+        pass
+
+    class RowIterator(list):
+        total_rows = 0
+
+    class QueryJob:
+        statement_type = 'SELECT'
+        cache_hit = False
+
+        def __init__(self, sql, project):
+            self.sql = sql
+            self.total_bytes_processed = 1024 * result_rows
+            self.destination = types.SimpleNamespace(project=project, dataset_id='_anon', table_id='bench_result')
+
+        def result(self, max_results=None):
+            api_call()
+            if 'INFORMATION_SCHEMA' in self.sql:
+                rows = RowIterator(
+                    Row(table_name=table, column_name=column.split()[0], data_type=column.split()[1],
+                        is_nullable='YES', is_partitioning_column='NO', clustering_ordinal_position=None,
+                        column_description=None, table_description=f'"{table}"')
+                    for table, columns in _FAKE_TABLES.items() for column in columns
+                )
+            else:
+                rows = RowIterator()
+            rows.total_rows = len(rows) or result_rows
+            return rows
+
+    class Client:
+        def __init__(self, project=None, credentials=None):
+            api_call()
+            self.project = project
+
+        def get_dataset(self, dataset_ref):
+            api_call()
+            return types.SimpleNamespace(modified=datetime.datetime(2025, 1, 1, tzinfo=datetime.timezone.utc))
+
+        def list_tables(self, dataset_ref, max_results=None):
+            api_call()
+            return [types.SimpleNamespace(table_id=table) for table in _FAKE_TABLES]
+
+        def query(self, sql, location=None, job_config=None):
+            if not getattr(job_config, 'dry_run', False):
+                api_call()
+            return QueryJob(sql, self.project)
+
+        def list_rows(self, table, start_index=0, max_results=None):
+            api_call()
+            end = min(result_rows, start_index + (max_results or result_rows))
+            return [
+                Row(USERID=f'U{i:06d}', DATE=datetime.date(2025, 1, 1) + datetime.timedelta(days=i % 365),
+                    CATEGORY='FOOD', AMOUNT=i * 1.5)
+                for i in range(start_index, end)
+            ]
+
+    finder = _FakeGoogleFinder(
+        modules={
+            'google': {},
+            'google.cloud': {},
+            'google.cloud.bigquery': {'Client': Client, 'QueryJobConfig': QueryJobConfig},
+            'google.auth': {},
+            'google.auth.exceptions': {'GoogleAuthError': GoogleAuthError},
+            'google.oauth2': {},
+            'google.oauth2.service_account': {'Credentials': Credentials},
+        },
+        packages={'google', 'google.cloud', 'google.auth', 'google.oauth2'},
+        import_delay=import_delay
+    )
+    sys.meta_path.insert(0, finder)
+    # Storage Read APIは使えない扱いにし、list_rowsで読む経路を計測する
+    sys.modules['google.cloud.bigquery_storage'] = None
+    return finder
+
+
+def _uninstall_fake_bigquery():
+    """偽モジュールのファインダーと、読み込み済みのgoogle.*モジュールを取り除く"""
+    sys.meta_path[:] = [f for f in sys.meta_path if not isinstance(f, _FakeGoogleFinder)]
+    for name in [n for n in sys.modules if n == 'google' or n.startswith('google.')]:
+        del sys.modules[name]
+
+
+class _ClientContext:
+    """ゲートウェイと同じく、client_context.customでツール名を渡す"""
+
+    def __init__(self, tool_name):
+        self.client_context = types.SimpleNamespace(custom={'bedrockAgentCoreToolName': tool_name})
+
+
+def _fresh_lambda_module(args):
+    """
+    コールド起動と同じ状態でlambda_functionを読み込み直す。
+    モジュール・偽のgoogle.*モジュール・クライアントのキャッシュ・/tmpのメタデータキャッシュをすべて破棄する。
+    戻り値は(モジュール, import時間[ms])。
+    """
+    _install_fake_bigquery(args.latency_ms / 1000, args.result_rows, args.import_delay_ms / 1000)
+    os.environ['BQ_METADATA_CACHE_DIR'] = tempfile.mkdtemp(prefix='bq_bench_')
+    sys.modules.pop('lambda_function', None)
+    start = time.perf_counter()
+    # importlib.import_moduleは-X importtimeに記録されないため__import__を使う
+    module = __import__('lambda_function')
+    return module, (time.perf_counter() - start) * 1000
+
+
+def _event_key(index: int, tool_name: str) -> str:
+    """結果のキー（同じツールのイベントが複数あっても上書きしないよう、イベントの番号を付ける）"""
+    return f"{index}:{tool_name.split('___', 1)[-1]}"
+
+
+def _cold_error(response):
+    """
+    コールド呼び出しの失敗内容（成功ならNone）。
+    batchは操作を並行して実行するため、初回のSDK読み込みやクライアント作成が競合すると一部の操作だけが失敗する。
+    そのため応答全体だけでなく、操作ごとの結果も確認する。
+    """
+    body = json.loads(response['body'])
+    if response['statusCode'] != 200:
+        return body.get('error', response['statusCode']) if isinstance(body, dict) else response['statusCode']
+    if isinstance(body, dict) and body.get('failed'):
+        return [r.get('error') for r in body['results'] if r['statusCode'] != 200]
+    return None
+
+
+def _run_worker(args):
+    """
+    サブプロセス側の計測。イベントごとにlambda_functionをコールド起動の状態から読み込み直し、
+    最初の呼び出し（コールド）と続く呼び出し（ウォーム）を計測して結果をJSONで出力する。
+    """
+    with open(args.events, encoding='utf-8') as f:
+        events = json.load(f)
+    sys.path.insert(0, HERE)
+
+    result = {'import_ms': [], 'cold_ms': {}, 'warm_ms': {}, 'alloc_kib': {}, 'cold_errors': {}}
+    for index, recorded in enumerate(events):
+        tool_name, event = recorded['tool_name'], recorded.get('event', {})
+        key = _event_key(index, tool_name)
+        context = _ClientContext(tool_name)
+
+        lambda_function, import_ms = _fresh_lambda_module(args)
+        result['import_ms'].append(import_ms)
+
+        # コールド: BigQuery SDKの遅延import・クライアント作成・メタデータ取得を含む
+        start = time.perf_counter()
+        response = lambda_function.lambda_handler(dict(event), context)
+        result['cold_ms'][key] = (time.perf_counter() - start) * 1000
+        error = _cold_error(response)
+        if error:
+            result['cold_errors'][key] = error
+
+        durations = []
+        for _ in range(args.iterations):
+            start = time.perf_counter()
+            lambda_function.lambda_handler(dict(event), context)
+            durations.append((time.perf_counter() - start) * 1000)
+        result['warm_ms'][key] = durations
+
+        # 計測時間に影響しないよう、割り当ては時間計測の後に別途測る
+        tracemalloc.start()
+        lambda_function.lambda_handler(dict(event), context)
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        result['alloc_kib'][key] = {'retained': current / 1024, 'peak': peak / 1024}
+
+    print(json.dumps(result))
+
+
+def _worker_command(args, *extra):
+    return [
+        sys.executable, *extra, os.path.abspath(__file__), '--worker',
+        '--events', args.events,
+        '--iterations', str(args.iterations),
+        '--latency-ms', str(args.latency_ms),
+        '--result-rows', str(args.result_rows),
+        '--import-delay-ms', str(args.import_delay_ms),
+    ]
+
+
+def _import_breakdown(args, top: int = 10):
+    """-X importtimeで lambda_function のimport内訳を取得（累積時間の大きい順）"""
+    proc = subprocess.run(
+        _worker_command(args, '-X', 'importtime'),
+        capture_output=True, text=True, check=True, cwd=HERE
+    )
+    modules = []
+    for line in proc.stderr.splitlines():
+        match = re.match(r'import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)', line)
+        if match:
+            modules.append({
+                'module': match.group(4),
+                'self_us': int(match.group(1)),
+                'cumulative_us': int(match.group(2)),
+                'depth': len(match.group(3)) // 2,
+            })
+    # importtimeは子→親の順に出力されるため、lambda_functionの直前にある、より深いモジュールが内訳
+    # （イベントごとに読み込み直すため、最初のimportを使う）
+    indexes = [i for i, m in enumerate(modules) if m['module'] == 'lambda_function']
+    if not indexes:
+        return []
+    own = modules[indexes[0]]
+    nested = []
+    for m in reversed(modules[:indexes[0]]):
+        if m['depth'] <= own['depth']:
+            break
+        nested.append(m)
+    nested.sort(key=lambda m: m['cumulative_us'], reverse=True)
+    # ツールの初回呼び出しで遅延importされるモジュール（lambda_functionのimportには含まれない）
+    lazy = []
+    for m in modules[indexes[0] + 1:]:
+        if m['module'].startswith('google') and m['module'] not in {l['module'] for l in lazy}:
+            lazy.append(dict(m, lazy=True))
+    lazy.sort(key=lambda m: m['cumulative_us'], reverse=True)
+    return [own] + nested[:top] + lazy[:top]
+
+
+def _percentile(values, pct: float) -> float:
+    """最近順位法によるパーセンタイル"""
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    rank = max(1, int(round(pct / 100 * len(ordered) + 0.5)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def _summarize(runs):
+    """サブプロセスごとの結果をイベントごとのp50/p99にまとめる"""
+    tools = list(runs[0]['warm_ms'])
+    imports = [ms for r in runs for ms in r['import_ms']]
+    summary = {
+        'import_ms': {
+            'p50': _percentile(imports, 50),
+            'p99': _percentile(imports, 99),
+        },
+        'tools': {},
+    }
+    for name in tools:
+        cold = [r['cold_ms'][name] for r in runs]
+        warm = [d for r in runs for d in r['warm_ms'][name]]
+        summary['tools'][name] = {
+            'cold_p50_ms': _percentile(cold, 50),
+            'cold_p99_ms': _percentile(cold, 99),
+            'warm_p50_ms': _percentile(warm, 50),
+            'warm_p99_ms': _percentile(warm, 99),
+            'warm_mean_ms': statistics.fmean(warm) if warm else 0.0,
+            'alloc_peak_kib': max(r['alloc_kib'][name]['peak'] for r in runs),
+            'alloc_retained_kib': max(r['alloc_kib'][name]['retained'] for r in runs),
+        }
+    return summary
+
+
+def _print_report(summary, breakdown, baseline=None):
+    def delta(value, key, tool=None):
+        if baseline is None:
+            return ''
+        base = baseline['import_ms'] if tool is None else baseline['tools'].get(tool)
+        if not base or not base.get(key):
+            return ''
+        return f" ({(value - base[key]) / base[key] * 100:+.0f}%)"
+
+    print(f"import lambda_function: p50 {summary['import_ms']['p50']:.1f}ms{delta(summary['import_ms']['p50'], 'p50')}"
+          f" / p99 {summary['import_ms']['p99']:.1f}ms{delta(summary['import_ms']['p99'], 'p99')}")
+    if breakdown:
+        print('\nimport内訳（-X importtime, 累積の大きい順）:')
+        for m in breakdown:
+            label = f"{m['module']}（初回呼び出し時に遅延import）" if m.get('lazy') else m['module']
+            print(f"  {m['cumulative_us'] / 1000:8.1f}ms  (self {m['self_us'] / 1000:6.1f}ms)  {label}")
+
+    print('\nイベントごとの呼び出し時間とメモリ割り当て（コールドはイベントごとにプロセスの状態を初期化して計測）:')
+    print(f"  {'event':<22} {'cold p50':>12} {'cold p99':>12} {'warm p50':>12} {'warm p99':>12} {'alloc peak':>12}")
+    for name, s in summary['tools'].items():
+        print(
+            f"  {name:<22}"
+            f" {s['cold_p50_ms']:10.2f}ms{delta(s['cold_p50_ms'], 'cold_p50_ms', name)}"
+            f" {s['cold_p99_ms']:10.2f}ms{delta(s['cold_p99_ms'], 'cold_p99_ms', name)}"
+            f" {s['warm_p50_ms']:10.3f}ms{delta(s['warm_p50_ms'], 'warm_p50_ms', name)}"
+            f" {s['warm_p99_ms']:10.3f}ms{delta(s['warm_p99_ms'], 'warm_p99_ms', name)}"
+            f" {s['alloc_peak_kib']:9.1f}KiB{delta(s['alloc_peak_kib'], 'alloc_peak_kib', name)}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description='lambda_functionのコールド/ウォーム呼び出しのベンチマーク')
+    parser.add_argument('--events', default=DEFAULT_EVENTS, help='再生するイベントのJSONファイル')
+    parser.add_argument('--runs', type=int, default=10, help='コールド起動の回数（サブプロセス数）')
+    parser.add_argument('--iterations', type=int, default=50, help='1プロセスあたりのウォーム呼び出し回数（ツールごと）')
+    parser.add_argument('--latency-ms', type=float, default=0.0, help='偽のBigQuery APIの1呼び出しあたりの遅延')
+    parser.add_argument('--import-delay-ms', type=float, default=300.0,
+                        help='偽のgoogle.cloud.bigqueryのimportにかかる時間（実際のSDKはおよそ数百ms）')
+    parser.add_argument('--result-rows', type=int, default=10000, help='execute_sqlの結果の行数')
+    parser.add_argument('--output', help='結果をJSONで保存するファイル')
+    parser.add_argument('--compare', help='比較する以前の結果（--outputで保存したJSON）')
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    args.events = os.path.abspath(args.events)
+
+    if args.worker:
+        _run_worker(args)
+        return
+
+    runs = []
+    for _ in range(args.runs):
+        proc = subprocess.run(_worker_command(args), capture_output=True, text=True, check=True, cwd=HERE)
+        # lambda_functionのprint出力に混ざらないよう、最後の行を結果とする
+        runs.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+    cold_errors = [(key, error) for r in runs for key, error in r['cold_errors'].items()]
+    summary = _summarize(runs)
+    summary['settings'] = {
+        'runs': args.runs,
+        'iterations': args.iterations,
+        'latency_ms': args.latency_ms,
+        'import_delay_ms': args.import_delay_ms,
+        'result_rows': args.result_rows,
+    }
+    breakdown = _import_breakdown(args)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+    _print_report(summary, breakdown, baseline)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(dict(summary, import_breakdown=breakdown), f, ensure_ascii=False, indent=2)
+
+    if cold_errors:
+        # 記録したイベントはすべて成功する前提のため、失敗はハンドラーの不具合（競合など）として扱う
+        print(f"\n⚠️ コールド呼び出しの失敗: {len(cold_errors)}件")
+        for key, error in cold_errors:
+            print(f"  {key}: {error}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,45 +1,764 @@
+import base64
+import hashlib
+import hmac
 import json
 import os
+import re
+import threading
+import time
 
-try:
-    # 依存はデプロイ時に同梱してください（google-cloud-bigquery）
-    from google.cloud import bigquery
-    from google.oauth2 import service_account
-except Exception:
-    bigquery = None
-    service_account = None
+# BigQuery SDKはimportに時間がかかるため、BigQueryのツールが初めて呼ばれたときに読み込む
+# （get_googledriveなど他のツールのコールドスタートを遅くしない）
+auth_exceptions = None
+bigquery = None
+service_account = None
+_bigquery_import_attempted = False
+# batchでは複数スレッドが同時に初回呼び出しを行うため、importは1スレッドだけが行い他は完了を待つ
+_bigquery_import_lock = threading.Lock()
 
-def _create_bq_client(project_id: str):
+def _import_bigquery() -> bool:
     """
-    BigQueryクライアントを作成する。
-    環境変数`GCP_SERVICE_ACCOUNT_JSON`があればそれを使用、なければデフォルト認証情報。
+    BigQuery SDKを読み込む（初回のみ）。使えればTrue。
+    依存はデプロイ時に同梱してください（google-cloud-bigquery）。
+    """
+    global auth_exceptions, bigquery, service_account, _bigquery_import_attempted
+    if _bigquery_import_attempted:
+        return bigquery is not None
+    with _bigquery_import_lock:
+        if not _bigquery_import_attempted:
+            try:
+                from google.auth import exceptions as _auth_exceptions
+                from google.cloud import bigquery as _bigquery
+                from google.oauth2 import service_account as _service_account
+            except Exception:
+                pass
+            else:
+                auth_exceptions = _auth_exceptions
+                bigquery = _bigquery
+                service_account = _service_account
+            # 成功・失敗が確定してから立てる（途中で他のスレッドに未完了の状態を見せない）
+            _bigquery_import_attempted = True
+    return bigquery is not None
+
+# ウォーム起動間で使い回すキャッシュ（モジュールスコープ）
+# 認証情報はサービスアカウントJSONのハッシュ単位、クライアントはプロジェクト単位で保持する
+_credentials_cache = {}
+_client_cache = {}
+_client_stats = {'created': 0, 'reused': 0}
+_client_lock = threading.Lock()
+
+def _load_credentials():
+    """
+    認証情報を取得する（同じサービスアカウントJSONなら再パースしない）。
+    戻り値は(キャッシュキー, 認証情報)。認証情報がNoneの場合はデフォルト認証を使う。
     """
     # base64ではなくプレーンJSON文字列を想定（必要なら外側でbase64デコードして格納）
     sa_json = os.getenv('GCP_SERVICE_ACCOUNT_JSON')
-    if service_account and sa_json:
+    if not (service_account and sa_json):
+        return 'default', None
+
+    key = hashlib.sha256(sa_json.encode('utf-8')).hexdigest()[:16]
+    if key not in _credentials_cache:
         try:
             info = json.loads(sa_json)
-            creds = service_account.Credentials.from_service_account_info(info)
-            return bigquery.Client(project=project_id, credentials=creds)
+            _credentials_cache[key] = service_account.Credentials.from_service_account_info(info)
         except Exception:
             # 万一壊れたJSONでも、デフォルト認証にフォールバック
-            pass
-    # フォールバック: ランタイムのデフォルト認証
-    return bigquery.Client(project=project_id) if bigquery else None
+            _credentials_cache[key] = None
+    creds = _credentials_cache[key]
+    return (key, creds) if creds is not None else ('default', None)
+
+def _create_bq_client(project_id: str):
+    """
+    BigQueryクライアントを取得する（ウォーム起動ではキャッシュ済みのクライアントを再利用）。
+    環境変数`GCP_SERVICE_ACCOUNT_JSON`があればそれを使用、なければデフォルト認証情報。
+    アクセストークンの期限切れはクライアント内で自動更新されるため、
+    作り直すのはサービスアカウントが変わった場合のみ。
+    """
+    if not _import_bigquery():
+        return None
+
+    with _client_lock:
+        creds_key, creds = _load_credentials()
+        cache_key = (project_id, creds_key)
+        client = _client_cache.get(cache_key)
+        if client is not None:
+            _client_stats['reused'] += 1
+            return client
+
+        if creds is not None:
+            client = bigquery.Client(project=project_id, credentials=creds)
+        else:
+            # フォールバック: ランタイムのデフォルト認証
+            client = bigquery.Client(project=project_id)
+        _client_cache[cache_key] = client
+        _client_stats['created'] += 1
+        # 作成したとき（コールドスタート・認証エラー後の作り直し）だけ記録する。再利用は毎回出さない
+        print(json.dumps({'bq_client': dict(_client_stats, project=project_id)}))
+        return client
+
+def _discard_bq_client(project_id: str):
+    """
+    キャッシュ済みのクライアント（Storage Read APIのクライアントを含む）と認証情報を破棄する。
+    認証情報が無効になった（更新に失敗した）場合に呼び、次回の呼び出しで作り直す。
+    """
+    with _client_lock:
+        for cache_key in [k for k in _client_cache if k[0] == project_id]:
+            del _client_cache[cache_key]
+            _credentials_cache.pop(cache_key[1], None)
+            _read_client_cache.pop(cache_key[1], None)
+
+def _is_auth_error(error: Exception) -> bool:
+    """認証情報の更新失敗など、クライアントを作り直すべきエラーか"""
+    return auth_exceptions is not None and isinstance(error, auth_exceptions.GoogleAuthError)
+
+# BigQueryのIDの形式（SQLのバッククォート内やキャッシュファイルのパスに使う前に検証する）
+# プロジェクトID: 小文字・数字・ハイフンで6〜30文字（ドメイン付きの"example.com:project"も可）
+_PROJECT_ID_PATTERN = re.compile(r'^(?:[a-z][a-z0-9.-]{0,61}[a-z0-9]:)?[a-z][a-z0-9-]{4,28}[a-z0-9]$')
+# データセットID: 英数字とアンダースコアで1〜1024文字
+_DATASET_ID_PATTERN = re.compile(r'^[A-Za-z0-9_]{1,1024}$')
+
+def _validate_ids(project_id: str | None, dataset_id: str | None = None):
+    """project_id/dataset_idがBigQueryのIDの形式か確認する（不正ならValueError）。"""
+    if project_id is not None and not _PROJECT_ID_PATTERN.match(str(project_id)):
+        raise ValueError(f"project_idの形式が不正です: {project_id}")
+    if dataset_id is not None and not _DATASET_ID_PATTERN.match(str(dataset_id)):
+        raise ValueError(f"dataset_idの形式が不正です: {dataset_id}")
+
+# データセットのメタデータキャッシュ
+# ウォーム起動ではメモリ上、同じ実行環境の再起動後は/tmpのファイルから読む
+_METADATA_CACHE_DIR = os.getenv('BQ_METADATA_CACHE_DIR', '/tmp/bq_metadata_cache')
+# データセットの更新日時が変わらなくても、この秒数を過ぎたら取得し直す（テーブル追加は更新日時に反映されない場合がある）
+_METADATA_CACHE_MAX_AGE = int(os.getenv('BQ_METADATA_CACHE_MAX_AGE', '3600'))
+_metadata_cache = {}
+
+def _metadata_cache_path(kind: str, project_id: str, dataset_id: str) -> str:
+    _validate_ids(project_id, dataset_id)
+    return os.path.join(_METADATA_CACHE_DIR, f"{kind}.{project_id}.{dataset_id}.json")
+
+def _get_cached_metadata(kind: str, project_id: str, dataset_id: str, modified: str | None):
+    """
+    キャッシュ済みのメタデータを返す。
+    データセットの更新日時が一致し、保存から_METADATA_CACHE_MAX_AGE秒以内の場合のみ有効（それ以外はNone）。
+    """
+    key = (kind, project_id, dataset_id)
+    entry = _metadata_cache.get(key)
+    if entry is None:
+        try:
+            with open(_metadata_cache_path(kind, project_id, dataset_id), encoding='utf-8') as f:
+                entry = json.load(f)
+            _metadata_cache[key] = entry
+        except (OSError, ValueError):
+            return None
+    if entry.get('modified') != modified or time.time() - entry.get('cached_at', 0) > _METADATA_CACHE_MAX_AGE:
+        return None
+    return entry.get('data')
+
+def _put_cached_metadata(kind: str, project_id: str, dataset_id: str, modified: str | None, data):
+    """メタデータをメモリと/tmpに保存する（書き込みは一時ファイル経由で置き換え）。"""
+    entry = {'modified': modified, 'cached_at': time.time(), 'data': data}
+    _metadata_cache[(kind, project_id, dataset_id)] = entry
+    try:
+        os.makedirs(_METADATA_CACHE_DIR, exist_ok=True)
+        path = _metadata_cache_path(kind, project_id, dataset_id)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(entry, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+    except OSError:
+        # /tmpに書けなくてもメモリ上のキャッシュは使える
+        pass
+
+def _dataset_modified(client, project_id: str, dataset_id: str) -> str | None:
+    """データセットの更新日時（変更検知用）。"""
+    dataset = client.get_dataset(f"{project_id}.{dataset_id}")
+    return dataset.modified.isoformat() if dataset.modified else None
 
 def _list_bigquery_tables(project_id: str, dataset_id: str | None = None):
-    """指定データセットのテーブルID一覧を返す。"""
+    """
+    指定データセットのテーブルID一覧を返す。戻り値は(テーブルID一覧, キャッシュから返したか)。
+    データセットの更新日時が前回と変わっていなければ、list_tablesを呼ばずにキャッシュを返す。
+    """
     client = _create_bq_client(project_id)
     if client is None:
         raise RuntimeError('BigQueryクライアントが利用できません。依存関係(google-cloud-bigquery)を同梱してください。')
 
+    modified = _dataset_modified(client, project_id, dataset_id)
+    cached = _get_cached_metadata('tables', project_id, dataset_id, modified)
+    if cached is not None:
+        return cached, True
+
     dataset_ref = f"{project_id}.{dataset_id}"
     tables_iter = client.list_tables(dataset_ref, max_results=None)
     table_ids = [t.table_id for t in tables_iter]
-    return table_ids
+    _put_cached_metadata('tables', project_id, dataset_id, modified, table_ids)
+    return table_ids, False
 
-def lambda_handler(event, context):
-    # tool_nameを安全に取得（context → event の順でフォールバック）
+# get_table_schemasで1回に返すテーブル数の上限（LLMに渡す応答を小さく保つ）
+_SCHEMA_MAX_TABLES = int(os.getenv('BQ_SCHEMA_MAX_TABLES', '50'))
+
+# 列・型・説明・パーティション・クラスタリングを1回のクエリで取得する
+# （テーブルごとにget_tableを呼ぶとテーブル数分の往復が発生するため）
+_TABLE_SCHEMAS_SQL = """
+SELECT
+  c.table_name,
+  c.column_name,
+  c.data_type,
+  c.is_nullable,
+  c.is_partitioning_column,
+  c.clustering_ordinal_position,
+  f.description AS column_description,
+  o.option_value AS table_description
+FROM `{dataset}.INFORMATION_SCHEMA.COLUMNS` AS c
+LEFT JOIN `{dataset}.INFORMATION_SCHEMA.COLUMN_FIELD_PATHS` AS f
+  ON f.table_name = c.table_name AND f.column_name = c.column_name AND f.field_path = c.column_name
+LEFT JOIN `{dataset}.INFORMATION_SCHEMA.TABLE_OPTIONS` AS o
+  ON o.table_name = c.table_name AND o.option_name = 'description'
+ORDER BY c.table_name, c.ordinal_position
+"""
+
+def _parse_option_value(value: str | None) -> str | None:
+    """TABLE_OPTIONSのoption_value（"..."形式の文字列リテラル）を文字列に戻す。"""
+    if not value:
+        return None
+    try:
+        return json.loads(value)
+    except ValueError:
+        return value.strip('"')
+
+def _query_table_schemas(client, project_id: str, dataset_id: str, location: str | None = None):
+    """データセット内の全テーブルのスキーマを取得し、LLM向けのコンパクトな形式にまとめる。"""
+    _validate_ids(project_id, dataset_id)
+    sql = _TABLE_SCHEMAS_SQL.format(dataset=f"{project_id}.{dataset_id}")
+    schemas = {}
+    for row in client.query(sql, location=location).result():
+        table = schemas.setdefault(row['table_name'], {
+            'description': _parse_option_value(row['table_description']),
+            'columns': [],
+        })
+        # "列名 型 [NOT NULL] [-- 説明]" の1行にまとめてトークン数を抑える
+        column = f"{row['column_name']} {row['data_type']}"
+        if row['is_nullable'] == 'NO':
+            column += ' NOT NULL'
+        if row['column_description']:
+            column += f" -- {row['column_description']}"
+        table['columns'].append(column)
+        if row['is_partitioning_column'] == 'YES':
+            table['partitioned_by'] = row['column_name']
+        if row['clustering_ordinal_position'] is not None:
+            table.setdefault('clustered_by', []).append((row['clustering_ordinal_position'], row['column_name']))
+
+    for table in schemas.values():
+        if 'clustered_by' in table:
+            table['clustered_by'] = [name for _, name in sorted(table['clustered_by'])]
+        if table['description'] is None:
+            del table['description']
+    return schemas
+
+def _get_table_schemas(project_id: str, dataset_id: str, table_names=None, location: str | None = None):
+    """
+    テーブルのスキーマを返す。戻り値は(テーブル名 -> スキーマ, キャッシュから返したか)。
+    データセット全体を1回のクエリで取得してキャッシュし、table_namesで絞り込む。
+    """
+    client = _create_bq_client(project_id)
+    if client is None:
+        raise RuntimeError('BigQueryクライアントが利用できません。依存関係(google-cloud-bigquery)を同梱してください。')
+
+    modified = _dataset_modified(client, project_id, dataset_id)
+    schemas = _get_cached_metadata('schemas', project_id, dataset_id, modified)
+    cached = schemas is not None
+    if not cached:
+        schemas = _query_table_schemas(client, project_id, dataset_id, location)
+        _put_cached_metadata('schemas', project_id, dataset_id, modified, schemas)
+
+    if table_names:
+        # 大文字小文字を区別せずに指定テーブルのみ返す
+        wanted = {name.lower() for name in table_names}
+        schemas = {name: schema for name, schema in schemas.items() if name.lower() in wanted}
+    return schemas, cached
+
+def _resolve_dataset(event):
+    """
+    eventからproject_id/dataset_idを取得する（無ければ環境変数のデフォルトを使用）。
+    戻り値は(project_id, dataset_id, エラー応答)。いずれも未設定の場合のみエラー応答を返す。
+    """
+    project_id = event.get('project_id') or os.getenv('BQ_DEFAULT_PROJECT_ID')
+    dataset_id = event.get('dataset_id') or os.getenv('BQ_DEFAULT_DATASET_ID')
+    if project_id and dataset_id:
+        try:
+            _validate_ids(project_id, dataset_id)
+        except ValueError as e:
+            return project_id, dataset_id, _response(400, {'error': str(e)})
+        return project_id, dataset_id, None
+
+    missing = []
+    if not project_id:
+        missing.append('project_id')
+    if not dataset_id:
+        missing.append('dataset_id')
+    return project_id, dataset_id, _response(400, {
+        'error': f"{', '.join(missing)} を指定するか、環境変数(BQ_DEFAULT_PROJECT_ID/BQ_DEFAULT_DATASET_ID)を設定してください"
+    })
+
+# execute_sqlの上限
+# 1回に課金を許可する最大バイト数（これを超えるクエリはBigQuery側で失敗させる）
+_SQL_MAX_BYTES_BILLED = int(os.getenv('BQ_SQL_MAX_BYTES_BILLED', str(10 * 1024 ** 3)))
+# 1ページの行数（max_rowsで小さくできるが、これを超えることはない）
+_SQL_MAX_ROWS = int(os.getenv('BQ_SQL_MAX_ROWS', '1000'))
+_SQL_DEFAULT_ROWS = int(os.getenv('BQ_SQL_DEFAULT_ROWS', '100'))
+# 1ページの結果のJSONサイズ上限（Lambdaの応答上限6MBより十分小さく、LLMに渡せる量に抑える）
+_SQL_MAX_RESPONSE_BYTES = int(os.getenv('BQ_SQL_MAX_RESPONSE_BYTES', str(1024 ** 2)))
+
+# SELECT/WITHで始まる1文のみ許可（最終判定はドライランのstatement_typeで行う）
+_READ_ONLY_SQL = re.compile(r'^\s*(SELECT|WITH)\b', re.IGNORECASE)
+
+# Storage Read APIのクライアント（認証情報単位でウォーム起動間で再利用）
+_read_client_cache = {}
+
+def _create_read_client():
+    """
+    Storage Read APIのクライアントを取得する。依存(google-cloud-bigquery-storage, pyarrow)が無ければNone。
+    使うのはexecute_sqlのみのため、コールドスタートを遅くしないよう初回呼び出し時にimportする。
+    """
+    try:
+        from google.cloud import bigquery_storage
+        import pyarrow  # noqa: F401  結果をArrow形式で読むために必要
+    except Exception:
+        return None
+
+    with _client_lock:
+        creds_key, creds = _load_credentials()
+        client = _read_client_cache.get(creds_key)
+        if client is None:
+            client = bigquery_storage.BigQueryReadClient(credentials=creds)
+            _read_client_cache[creds_key] = client
+            _client_stats['created'] += 1
+            print(json.dumps({'bq_read_client': _client_stats}))
+        else:
+            _client_stats['reused'] += 1
+        return client
+
+def _check_read_only(client, sql: str, location: str | None, job_config_kwargs: dict):
+    """
+    読み取り専用のクエリか確認する（ドライランで構文と文の種類を検証）。
+    戻り値はスキャン予定のバイト数。読み取り専用でなければValueError。
+    """
+    if not _READ_ONLY_SQL.match(sql):
+        raise ValueError('実行できるのはSELECT文（WITH句を含む）のみです')
+    # 複数文（スクリプト）はstatement_typeがSCRIPTになるため、ここで弾かれる
+    dry_run = client.query(sql, location=location, job_config=bigquery.QueryJobConfig(
+        dry_run=True, use_query_cache=False, **job_config_kwargs
+    ))
+    if dry_run.statement_type != 'SELECT':
+        raise ValueError(f"実行できるのはSELECT文のみです（{dry_run.statement_type}）")
+    return dry_run.total_bytes_processed
+
+# cursorの署名鍵（全インスタンスで同じ値を設定する）
+# 未設定ならサービスアカウントJSONから導出し、それも無ければこの実行環境限りの乱数を使う
+# （乱数の場合、別のインスタンスに振り分けられた続きの呼び出しはcursorの再発行が必要）
+_CURSOR_SECRET = os.getenv('BQ_SQL_CURSOR_SECRET')
+# 結果の一時テーブルの保持期間（24時間）より短くする
+# （Storage Read APIの読み取りセッションはより早く期限切れになるため、cursorにその期限も保存する）
+_CURSOR_MAX_AGE = int(os.getenv('BQ_SQL_CURSOR_MAX_AGE', str(12 * 3600)))
+# 読み取りセッションの期限より何秒手前でcursorを期限切れにするか
+_STREAM_EXPIRY_MARGIN = 300
+_CURSOR_EXPIRED_MESSAGE = 'cursorの有効期限が切れています。クエリを再実行してください'
+_cursor_key = None
+
+def _get_cursor_key() -> bytes:
+    global _cursor_key
+    if _cursor_key is None:
+        if _CURSOR_SECRET:
+            _cursor_key = _CURSOR_SECRET.encode('utf-8')
+        elif os.getenv('GCP_SERVICE_ACCOUNT_JSON'):
+            _cursor_key = hashlib.sha256(b'execute_sql cursor:' + os.getenv('GCP_SERVICE_ACCOUNT_JSON').encode('utf-8')).digest()
+        else:
+            _cursor_key = os.urandom(32)
+    return _cursor_key
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).decode('ascii').rstrip('=')
+
+def _b64decode(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text.encode('ascii') + b'=' * (-len(text) % 4))
+
+def _encode_cursor(state: dict) -> str:
+    """
+    cursorを作成する（「ペイロード.署名」の形式）。
+    cursorは結果テーブルを直接指すため、HMACで署名し、このツールが発行したものだけを受け付ける
+    （任意のテーブルを指すcursorで読み取り専用チェックや課金上限を迂回させない）。
+    """
+    # 発行時刻は最初のページのものを引き継ぐ（結果テーブルの作成時刻からの期限にする）
+    payload = json.dumps({'issued_at': int(time.time()), **state}, separators=(',', ':')).encode('utf-8')
+    signature = hmac.new(_get_cursor_key(), payload, hashlib.sha256).digest()
+    return f"{_b64encode(payload)}.{_b64encode(signature)}"
+
+def _decode_cursor(cursor: str) -> dict:
+    """cursorの署名と有効期限を検証して状態を返す。不正・期限切れならValueError。"""
+    try:
+        payload_text, signature_text = cursor.split('.')
+        payload, signature = _b64decode(payload_text), _b64decode(signature_text)
+    except ValueError:
+        raise ValueError('cursorが不正です') from None
+    expected = hmac.new(_get_cursor_key(), payload, hashlib.sha256).digest()
+    if not hmac.compare_digest(signature, expected):
+        raise ValueError('cursorが不正です（このツールが発行したcursorではありません）。クエリを再実行してください')
+    state = json.loads(payload)
+    if time.time() - state.get('issued_at', 0) > _CURSOR_MAX_AGE:
+        raise ValueError(_CURSOR_EXPIRED_MESSAGE)
+    return state
+
+def _take_rows(rows, page: list, size: int, max_rows: int):
+    """
+    rowsを上限に達するまでpageへ追加する。戻り値は(追加後のJSONサイズ, 上限に達したか)。
+    """
+    for row in rows:
+        # 上限はバイト数で判定する（日本語は1文字3バイトのため文字数では大きく超える）
+        row_size = len(json.dumps(row, ensure_ascii=False, default=str).encode('utf-8')) + 1
+        # 1行目は上限を超えても返す（次のページに進めなくなるのを防ぐ）
+        if len(page) >= max_rows or (page and size + row_size > _SQL_MAX_RESPONSE_BYTES):
+            return size, True
+        page.append(row)
+        size += row_size
+    return size, False
+
+def _read_page_storage(read_client, stream: str, offset: int, max_rows: int):
+    """
+    Storage Read API（Arrow形式）で結果をoffset行目から読む。戻り値は(行, 続きがあるか)。
+    Arrowのレコードバッチ単位で読み、上限に達したらストリームの読み込みを打ち切る。
+    """
+    page, size = [], 0
+    reader = read_client.read_rows(stream, offset=offset)
+    for arrow_page in reader.rows().pages:
+        size, full = _take_rows(arrow_page.to_arrow().to_pylist(), page, size, max_rows)
+        if full:
+            return page, True
+    return page, False
+
+def _read_page_rest(client, table: str, offset: int, max_rows: int):
+    """Storage Read APIが使えない場合の読み込み（tabledata.listで必要な範囲だけ取得）。"""
+    page = []
+    rows = client.list_rows(table, start_index=offset, max_results=max_rows + 1)
+    _, full = _take_rows((dict(row.items()) for row in rows), page, 0, max_rows)
+    return page, full
+
+def _read_result_page(client, state: dict, max_rows: int):
+    """
+    結果テーブルからstateの位置のページを読む。戻り値は(行, 次ページのstate)。
+    最初のページでStorage Read APIの読み取りセッション（ストリーム1本）を作成し、
+    以降はcursorに保存したストリームをoffsetから読み進める。
+    読み取りセッションの期限が切れたcursorは、期限切れのcursorとして扱う（ValueError）。
+    """
+    read_client = _create_read_client()
+    offset = state['offset']
+    if read_client is not None:
+        if state.get('stream') and time.time() >= state.get('stream_expires_at', float('inf')):
+            raise ValueError(_CURSOR_EXPIRED_MESSAGE)
+        if not state.get('stream'):
+            from google.cloud import bigquery_storage
+            project, dataset, table = state['table'].split('.')
+            session = read_client.create_read_session(
+                parent=f"projects/{state['project']}",
+                read_session=bigquery_storage.types.ReadSession(
+                    table=f"projects/{project}/datasets/{dataset}/tables/{table}",
+                    data_format=bigquery_storage.types.DataFormat.ARROW
+                ),
+                # 行の順序を保ち、offsetで続きから読めるようにストリームは1本にする
+                max_stream_count=1
+            )
+            if not session.streams:
+                return [], None
+            state = dict(state, stream=session.streams[0].name)
+            if session.expire_time:
+                # 期限の直前に読み始めて途中で切れないよう、少し手前を期限にする
+                state['stream_expires_at'] = int(session.expire_time.timestamp()) - _STREAM_EXPIRY_MARGIN
+        from google.api_core import exceptions as api_exceptions
+        try:
+            rows, has_more = _read_page_storage(read_client, state['stream'], offset, max_rows)
+        except (api_exceptions.NotFound, api_exceptions.FailedPrecondition) as e:
+            # 期限切れ・削除済みのストリームはcursorの期限切れとして返す
+            raise ValueError(_CURSOR_EXPIRED_MESSAGE) from e
+    else:
+        rows, has_more = _read_page_rest(client, state['table'], offset, max_rows)
+
+    next_state = dict(state, offset=offset + len(rows)) if has_more else None
+    return rows, next_state
+
+def _execute_sql(project_id: str, sql: str | None = None, dataset_id: str | None = None,
+                 location: str | None = None, max_rows: int | None = None, cursor: str | None = None):
+    """
+    読み取り専用のSQLを実行し、結果の1ページ目と続きを読むためのcursorを返す。
+    cursorを指定した場合はクエリを再実行せず、前回の結果テーブルの続きを返す。
+    """
+    client = _create_bq_client(project_id)
+    if client is None:
+        raise RuntimeError('BigQueryクライアントが利用できません。依存関係(google-cloud-bigquery)を同梱してください。')
+    max_rows = max(1, min(int(max_rows or _SQL_DEFAULT_ROWS), _SQL_MAX_ROWS))
+
+    if cursor:
+        state = _decode_cursor(cursor)
+        result = {'total_rows': state.get('total_rows')}
+    else:
+        if not sql:
+            raise ValueError('sqlまたはcursorを指定してください')
+        job_config_kwargs = {}
+        if dataset_id:
+            # テーブル名をデータセット無しで書けるようにする
+            job_config_kwargs['default_dataset'] = f"{project_id}.{dataset_id}"
+        bytes_estimated = _check_read_only(client, sql, location, job_config_kwargs)
+        job = client.query(sql, location=location, job_config=bigquery.QueryJobConfig(
+            maximum_bytes_billed=_SQL_MAX_BYTES_BILLED, **job_config_kwargs
+        ))
+        # 結果は一時テーブルに書かれる。行はここでは取得せず、下でStorage Read APIから読む
+        total_rows = job.result(max_results=0).total_rows
+        destination = job.destination
+        state = {
+            'project': project_id,
+            'table': f"{destination.project}.{destination.dataset_id}.{destination.table_id}",
+            'offset': 0,
+            'total_rows': total_rows,
+        }
+        result = {
+            'total_rows': state['total_rows'],
+            'bytes_processed': job.total_bytes_processed or bytes_estimated,
+            'cache_hit': bool(job.cache_hit),
+        }
+
+    rows, next_state = _read_result_page(client, state, max_rows)
+    result.update({
+        'offset': state['offset'],
+        'rows': rows,
+        'next_cursor': _encode_cursor(next_state) if next_state else None,
+    })
+    return result
+
+# ツールの登録
+# ゲートウェイのツール名（ターゲットの接頭辞xxx___を除いた名前）→ 処理関数・説明・入力スキーマ
+_TOOLS = {}
+
+def tool(name: str, description: str, properties: dict | None = None, required: list | None = None):
+    """ツールを登録するデコレータ。処理関数はeventを受け取り、Lambdaの応答を返す。"""
+    def register(handler):
+        _TOOLS[name] = {
+            'handler': handler,
+            'description': description,
+            'inputSchema': {
+                'type': 'object',
+                'properties': properties or {},
+                'required': required or []
+            }
+        }
+        return handler
+    return register
+
+def get_tool_schemas():
+    """ゲートウェイに登録するツールスキーマ（inlineschema.jsonの形式）"""
+    return [
+        {'description': spec['description'], 'inputSchema': spec['inputSchema'], 'name': name}
+        for name, spec in _TOOLS.items()
+    ]
+
+def _response(status_code: int, body) -> dict:
+    return {
+        'statusCode': status_code,
+        'body': json.dumps(body, ensure_ascii=False, default=str)
+    }
+
+def _run_bigquery(project_id: str, func):
+    """BigQueryのツールを実行し、結果を応答に変換する（不正な入力は400、それ以外の失敗は500）。"""
+    try:
+        return _response(200, func())
+    except ValueError as e:
+        return _response(400, {'error': str(e)})
+    except Exception as e:
+        if _is_auth_error(e):
+            _discard_bq_client(project_id)
+        return _response(500, {'error': str(e)})
+
+_PROJECT_ID_PROPERTY = {'type': 'string', 'description': 'GCPのプロジェクトID（未指定時はBQ_DEFAULT_PROJECT_IDを使用）'}
+_DATASET_ID_PROPERTY = {'type': 'string', 'description': '対象のデータセットID（未指定時はBQ_DEFAULT_DATASET_IDを使用）'}
+_LOCATION_PROPERTY = {'type': 'string', 'description': 'ロケーション(例: US, asia-northeast1)。省略可'}
+
+@tool(
+    'get_bigquery',
+    'BigQueryのデータセット内のテーブル一覧を取得します。',
+    {
+        'project_id': _PROJECT_ID_PROPERTY,
+        'dataset_id': _DATASET_ID_PROPERTY,
+        'location': _LOCATION_PROPERTY
+    }
+)
+def _handle_get_bigquery(event):
+    # 入力はeventから受け取る。無ければ環境変数のデフォルトを使用。
+    project_id, dataset_id, error_response = _resolve_dataset(event)
+    if error_response:
+        return error_response
+
+    def run():
+        tables, cached = _list_bigquery_tables(project_id=project_id, dataset_id=dataset_id)
+        return {
+            'project_id': project_id,
+            'dataset_id': dataset_id,
+            'tables': tables,
+            'cached': cached
+        }
+    return _run_bigquery(project_id, run)
+
+@tool(
+    'get_table_schemas',
+    'BigQueryのテーブルのスキーマ（列名・型・説明、テーブルの説明、パーティション列、クラスタリング列）をまとめて取得します。SQLを書く前に使用してください。',
+    {
+        'project_id': _PROJECT_ID_PROPERTY,
+        'dataset_id': _DATASET_ID_PROPERTY,
+        'table_names': {'type': 'array', 'items': {'type': 'string'}, 'description': '取得するテーブル名の一覧。省略時はデータセット内の全テーブル'},
+        'location': _LOCATION_PROPERTY
+    }
+)
+def _handle_get_table_schemas(event):
+    project_id, dataset_id, error_response = _resolve_dataset(event)
+    if error_response:
+        return error_response
+
+    table_names = event.get('table_names') or []
+    if isinstance(table_names, str):
+        table_names = [name.strip() for name in table_names.split(',') if name.strip()]
+
+    def run():
+        schemas, cached = _get_table_schemas(
+            project_id=project_id,
+            dataset_id=dataset_id,
+            table_names=table_names,
+            location=event.get('location')
+        )
+        # テーブル数が多い場合は上限までに切り詰め、残りはテーブル名のみ返す
+        names = sorted(schemas)
+        body = {
+            'project_id': project_id,
+            'dataset_id': dataset_id,
+            'tables': {name: schemas[name] for name in names[:_SCHEMA_MAX_TABLES]},
+            'cached': cached
+        }
+        if len(names) > _SCHEMA_MAX_TABLES:
+            body['truncated'] = True
+            body['remaining_tables'] = names[_SCHEMA_MAX_TABLES:]
+        if table_names and not schemas:
+            body['message'] = '指定されたテーブルが見つかりませんでした'
+        return body
+    return _run_bigquery(project_id, run)
+
+@tool(
+    'execute_sql',
+    'BigQueryで読み取り専用のSQL（SELECT文）を実行し、結果を1ページ分返します。続きがある場合はnext_cursorをcursorに指定して再度呼び出してください。',
+    {
+        'sql': {'type': 'string', 'description': '実行するSELECT文（cursor指定時は不要）'},
+        'project_id': _PROJECT_ID_PROPERTY,
+        'dataset_id': {'type': 'string', 'description': 'テーブル名の既定のデータセット（未指定時はBQ_DEFAULT_DATASET_IDを使用）'},
+        'location': _LOCATION_PROPERTY,
+        'max_rows': {'type': 'integer', 'description': f"1ページの最大行数（既定{_SQL_DEFAULT_ROWS}、上限{_SQL_MAX_ROWS}）"},
+        'cursor': {'type': 'string', 'description': '前回の応答のnext_cursor。指定するとクエリを再実行せずに続きを返す'}
+    }
+)
+def _handle_execute_sql(event):
+    project_id = event.get('project_id') or os.getenv('BQ_DEFAULT_PROJECT_ID')
+    if not project_id:
+        return _response(400, {'error': 'project_id を指定するか、環境変数(BQ_DEFAULT_PROJECT_ID)を設定してください'})
+    dataset_id = event.get('dataset_id') or os.getenv('BQ_DEFAULT_DATASET_ID')
+    try:
+        _validate_ids(project_id, dataset_id)
+    except ValueError as e:
+        return _response(400, {'error': str(e)})
+
+    return _run_bigquery(project_id, lambda: _execute_sql(
+        project_id=project_id,
+        sql=event.get('sql'),
+        dataset_id=dataset_id,
+        location=event.get('location'),
+        max_rows=event.get('max_rows'),
+        cursor=event.get('cursor')
+    ))
+
+@tool(
+    'get_googledrive',
+    'Google Driveの情報を取得（モック）',
+    {'timezone': {'type': 'string'}}
+)
+def _handle_get_googledrive(event):
+    return _response(200, {
+        'message': 'これはGoogle DriveのMCPツールです.Google Driveには100万件のドキュメントが入っています。'
+    })
+
+# batchの上限（1回の呼び出しで実行する操作数と同時実行数）
+_BATCH_MAX_OPERATIONS = int(os.getenv('BATCH_MAX_OPERATIONS', '20'))
+_BATCH_MAX_WORKERS = int(os.getenv('BATCH_MAX_WORKERS', '8'))
+
+def _run_operation(operation):
+    """batchの1操作を実行し、ツールの応答を操作ごとの結果に変換する。"""
+    if not isinstance(operation, dict):
+        return {'tool': None, 'statusCode': 400, 'error': '操作は{"tool": ..., "arguments": {...}}の形式で指定してください'}
+    name = str(operation.get('tool') or '').split('___', 1)[-1]
+    arguments = operation.get('arguments') or {}
+    result = {'tool': name}
+    if name == 'batch':
+        return dict(result, statusCode=400, error='batchの中でbatchは呼び出せません')
+    spec = _TOOLS.get(name)
+    if spec is None:
+        return dict(result, statusCode=400, error=f"不明なツールです: {name or '(未指定)'}")
+    if not isinstance(arguments, dict):
+        return dict(result, statusCode=400, error='argumentsはオブジェクトで指定してください')
+
+    try:
+        response = spec['handler'](arguments)
+    except Exception as e:
+        return dict(result, statusCode=500, error=str(e))
+    body = json.loads(response['body'])
+    if response['statusCode'] != 200 and isinstance(body, dict) and 'error' in body:
+        return dict(result, statusCode=response['statusCode'], error=body['error'])
+    return dict(result, statusCode=response['statusCode'], result=body)
+
+@tool(
+    'batch',
+    '複数のツール呼び出しを1回でまとめて実行します（例: 複数データセットのテーブル一覧）。各操作は並行して実行され、操作ごとの結果またはエラーを同じ順序で返します。batchの中でbatchは呼び出せません。',
+    {
+        'operations': {
+            'type': 'array',
+            'description': f"実行する操作の一覧（最大{_BATCH_MAX_OPERATIONS}件）",
+            'items': {
+                'type': 'object',
+                'properties': {
+                    'tool': {'type': 'string', 'description': 'ツール名（例: get_bigquery, get_table_schemas, execute_sql）'},
+                    'arguments': {'type': 'object', 'description': 'ツールの引数'}
+                },
+                'required': ['tool']
+            }
+        }
+    },
+    required=['operations']
+)
+def _handle_batch(event):
+    operations = event.get('operations')
+    if not isinstance(operations, list) or not operations:
+        return _response(400, {'error': 'operationsに1件以上の操作を指定してください'})
+    if len(operations) > _BATCH_MAX_OPERATIONS:
+        return _response(400, {'error': f"operationsは最大{_BATCH_MAX_OPERATIONS}件です（{len(operations)}件）"})
+
+    # batchを使うときだけ読み込む
+    from concurrent.futures import ThreadPoolExecutor
+
+    # BigQueryクライアントはプロジェクト単位でキャッシュ済みのものを全操作で共有する
+    # （初回の作成は_client_lockで直列化されるため、同時に作られることはない）
+    with ThreadPoolExecutor(max_workers=max(1, min(_BATCH_MAX_WORKERS, len(operations)))) as executor:
+        results = list(executor.map(_run_operation, operations))
+    return _response(200, {
+        'results': results,
+        'succeeded': sum(1 for r in results if r['statusCode'] == 200),
+        'failed': sum(1 for r in results if r['statusCode'] != 200)
+    })
+
+def _resolve_tool_name(event, context) -> str:
+    """
+    呼び出されたツール名を取得（context → event の順でフォールバック）。
+    ゲートウェイはターゲット名の接頭辞（xxx___）を付けて渡すため、除いた名前を返す。
+    """
     tool_name = 'unknown'
     try:
         client_context = getattr(context, 'client_context', None)
@@ -50,48 +769,17 @@ def lambda_handler(event, context):
         pass
     if isinstance(event, dict):
         tool_name = event.get('tool_name', tool_name) or tool_name
+    return str(tool_name).split('___', 1)[-1]
 
-    if 'get_bigquery' in tool_name:
-        # 入力はeventから受け取る。無ければ環境変数のデフォルトを使用。
-        project_id = event.get('project_id') or os.getenv('BQ_DEFAULT_PROJECT_ID')
-        dataset_id = event.get('dataset_id') or os.getenv('BQ_DEFAULT_DATASET_ID')
-
-        # いずれも未設定の場合のみエラー（環境変数があれば必須ではない）
-        if not project_id or not dataset_id:
-            missing = []
-            if not project_id:
-                missing.append('project_id')
-            if not dataset_id:
-                missing.append('dataset_id')
-            return {
-                'statusCode': 400,
-                'body': json.dumps({'error': f"{', '.join(missing)} を指定するか、環境変数(BQ_DEFAULT_PROJECT_ID/BQ_DEFAULT_DATASET_ID)を設定してください"})
-            }
-
-        try:
-            tables = _list_bigquery_tables(project_id=project_id, dataset_id=dataset_id)
-            return {
-                'statusCode': 200,
-                'body': json.dumps({
-                    'project_id': project_id,
-                    'dataset_id': dataset_id,
-                    'tables': tables
-                })
-            }
-        except Exception as e:
-            return {
-                'statusCode': 500,
-                'body': json.dumps({'error': str(e)})
-            }
-    elif 'get_googledrive' in tool_name:
-        return {
-            'statusCode': 200,
-            'body': json.dumps({
-                'message': 'これはGoogle DriveのMCPツールです.Google Driveには100万件のドキュメントが入っています。'
-            })
-        }
-    else:
+def lambda_handler(event, context):
+    spec = _TOOLS.get(_resolve_tool_name(event, context))
+    if spec is None:
         return {
             'statusCode': 200,
             'body': json.dumps({'message': 'Unknown tool'})
-        }
\ No newline at end of file
+        }
+    return spec['handler'](event if isinstance(event, dict) else {})
+
+if __name__ == '__main__':
+    # ゲートウェイ用のツールスキーマを出力（src/gateway_schema/inlineschema.jsonの更新に使う）
+    print(json.dumps(get_tool_schemas(), ensure_ascii=False, indent=2))
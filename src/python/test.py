@@ -1,11 +1,18 @@
 import requests
 import json
+import time
 
 import os
 CLIENT_ID = os.environ.get("MCP_CLIENT_ID")
 CLIENT_SECRET = os.environ.get("MCP_CLIENT_SECRET")
 TOKEN_URL = os.environ.get("MCP_TOKEN_URL")
 
+# トークン取得・ゲートウェイ呼び出しでコネクションを使い回す
+_session = requests.Session()
+# (client_id, token_url) -> (access_token, 更新期限)
+_token_cache = {}
+TOKEN_REFRESH_MARGIN = 300
+
 def fetch_access_token(client_id, client_secret, token_url):
   if not token_url:
     raise ValueError("MCP_TOKEN_URL が設定されていません")
@@ -14,10 +21,15 @@ def fetch_access_token(client_id, client_secret, token_url):
   if not client_secret:
     raise ValueError("MCP_CLIENT_SECRET が設定されていません")
   
-  response = requests.post(
+  cached = _token_cache.get((client_id, token_url))
+  if cached and time.monotonic() < cached[1]:
+    return cached[0]
+  
+  response = _session.post(
     token_url,
     data="grant_type=client_credentials&client_id={client_id}&client_secret={client_secret}".format(client_id=client_id, client_secret=client_secret),
-    headers={'Content-Type': 'application/x-www-form-urlencoded'}
+    headers={'Content-Type': 'application/x-www-form-urlencoded'},
+    timeout=30
   )
   if response.status_code != 200:
     raise RuntimeError("トークン取得に失敗しました: {status} {text}".format(status=response.status_code, text=response.text))
@@ -25,6 +37,9 @@ def fetch_access_token(client_id, client_secret, token_url):
   body = response.json()
   if 'access_token' not in body:
     raise RuntimeError("レスポンスに access_token が含まれていません: {body}".format(body=body))
+  expires_in = int(body.get('expires_in', 3600))
+  refresh_at = time.monotonic() + max(expires_in - TOKEN_REFRESH_MARGIN, expires_in / 2)
+  _token_cache[(client_id, token_url)] = (body['access_token'], refresh_at)
   return body['access_token']
 
 def call_openapi_tool(gateway_url, access_token, tool_name, arguments):
@@ -43,7 +58,7 @@ def call_openapi_tool(gateway_url, access_token, tool_name, arguments):
       }
   }
 
-  response = requests.post(gateway_url, headers=headers, json=payload)
+  response = _session.post(gateway_url, headers=headers, json=payload)
   return response.json()
 
 def list_tools_names(gateway_url, access_token):
@@ -56,7 +71,7 @@ def list_tools_names(gateway_url, access_token):
       "id": "list-tools-request",
       "method": "tools/list"
   }
-  response = requests.post(gateway_url, headers=headers, json=payload)
+  response = _session.post(gateway_url, headers=headers, json=payload)
   data = response.json()
   tools = data.get('result', {}).get('tools', [])
   names = []
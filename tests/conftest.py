@@ -0,0 +1,15 @@
+"""
+テストの共通設定
+
+各デプロイ単位（src/lambda, src/compass, src/demo, src/compass_ui）は
+それぞれのディレクトリを作業ディレクトリとして実行されるため、同じように読み込めるようパスを通す。
+"""
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+for path in ("src/lambda", "src/compass", "src/demo", "src/compass_ui"):
+    path = os.path.join(ROOT, path)
+    if path not in sys.path:
+        sys.path.insert(0, path)
@@ -0,0 +1,86 @@
+"""
+会話チェックポイント（demo/chat/checkpoint.py）のテスト
+"""
+import sqlite3
+import time
+
+import pytest
+
+pytest.importorskip("langgraph.checkpoint.sqlite")
+
+from langgraph.checkpoint.base import empty_checkpoint
+
+from chat.checkpoint import BoundedSqliteSaver
+
+
+def put(saver, thread_id):
+    config = {"configurable": {"thread_id": thread_id, "checkpoint_ns": ""}}
+    return saver.put(config, empty_checkpoint(), {}, {})
+
+
+def count(path, sql, *params):
+    # 別の接続から読む（コミット済みの行のみ見える）
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute(sql, params).fetchone()[0]
+    finally:
+        conn.close()
+
+
+@pytest.fixture
+def make_saver(tmp_path):
+    savers = []
+
+    def make(**kwargs):
+        saver = BoundedSqliteSaver(str(tmp_path / "checkpoints.sqlite"), **kwargs)
+        savers.append(saver)
+        return saver
+
+    yield make
+    for saver in savers:
+        saver.close()
+
+
+def test_prune_keeps_latest_checkpoints_per_thread(make_saver):
+    saver = make_saver(max_checkpoints=3)
+    for _ in range(5):
+        put(saver, "a")
+    put(saver, "b")
+    saver.flush()
+
+    assert count(saver.path, "SELECT COUNT(*) FROM checkpoints WHERE thread_id = ?", "a") == 3
+    assert count(saver.path, "SELECT COUNT(*) FROM checkpoints WHERE thread_id = ?", "b") == 1
+
+
+def test_evicts_oldest_threads_over_the_cap(make_saver):
+    saver = make_saver(max_threads=2, evict_interval=0)
+    for thread_id in ("a", "b", "c"):
+        put(saver, thread_id)
+        time.sleep(0.01)
+    saver.flush()
+
+    assert saver.get_stats()["threads"] == 2
+    assert count(saver.path, "SELECT COUNT(*) FROM checkpoints WHERE thread_id = ?", "a") == 0
+
+
+def test_evicts_expired_threads(make_saver):
+    saver = make_saver(thread_ttl=0.05, evict_interval=3600)
+    put(saver, "a")
+    time.sleep(0.1)
+    put(saver, "b")
+
+    assert saver.evict_threads() == 1
+    saver.flush()
+    assert count(saver.path, "SELECT COUNT(*) FROM checkpoints WHERE thread_id = ?", "a") == 0
+    assert count(saver.path, "SELECT COUNT(*) FROM checkpoints WHERE thread_id = ?", "b") == 1
+
+
+def test_pending_writes_are_committed_by_timer(make_saver):
+    saver = make_saver(commit_every=1000, commit_interval=0.1)
+    put(saver, "a")
+
+    deadline = time.monotonic() + 5
+    while saver.get_stats()["pending_writes"] and time.monotonic() < deadline:
+        time.sleep(0.05)
+
+    assert count(saver.path, "SELECT COUNT(*) FROM checkpoints") == 1
@@ -0,0 +1,62 @@
+"""
+チャット履歴モジュールのテスト
+
+compass_uiとdemoは単体でデプロイするため同じ実装をそれぞれに置いている。
+docstring以外が一致していることを確認する（一致の確認ではstreamlitは読み込まない）。
+"""
+import ast
+import gc
+import os
+import time
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _code_without_docstrings(path):
+    with open(os.path.join(ROOT, path), encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.Module, ast.ClassDef, ast.FunctionDef, ast.AsyncFunctionDef)):
+            body = node.body
+            if body and isinstance(body[0], ast.Expr) and isinstance(body[0].value, ast.Constant) \
+                    and isinstance(body[0].value.value, str):
+                node.body = body[1:] or [ast.Pass()]
+    return ast.dump(tree)
+
+
+def test_history_modules_are_identical():
+    assert _code_without_docstrings("src/compass_ui/history.py") == \
+        _code_without_docstrings("src/demo/chat/history.py")
+
+
+def test_spill_file_is_removed_with_the_history(tmp_path):
+    pytest.importorskip("streamlit")
+    from chat import history as history_module
+
+    history = history_module.ChatHistory(max_in_memory=0, spill_dir=str(tmp_path))
+    for i in range(history_module.HISTORY_WINDOW * 2):
+        history.append("user", f"message {i}")
+    path = history.path
+    assert os.path.exists(path)
+
+    del history
+    gc.collect()
+
+    assert not os.path.exists(path)
+
+
+def test_old_spill_files_are_swept(tmp_path, monkeypatch):
+    pytest.importorskip("streamlit")
+    from chat import history as history_module
+
+    stale = tmp_path / "chat_history_stale.jsonl"
+    stale.write_text("{}\n", encoding="utf-8")
+    old = time.time() - history_module.HISTORY_SPILL_TTL - 60
+    os.utime(stale, (old, old))
+    monkeypatch.setattr(history_module, "_last_sweep", 0.0)
+
+    history_module.ChatHistory(spill_dir=str(tmp_path))
+
+    assert not stale.exists()
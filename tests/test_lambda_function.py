@@ -0,0 +1,289 @@
+"""
+lambda_function のテスト
+
+BigQuery SDKはベンチマークと同じ偽モジュール（benchmark._install_fake_bigquery）に置き換える。
+"""
+import json
+import sys
+import threading
+import types
+
+import pytest
+
+import benchmark
+
+
+@pytest.fixture
+def load_lambda(monkeypatch, tmp_path):
+    """コールド起動と同じ状態でlambda_functionを読み込む（import_delayで偽SDKのimport時間を指定）"""
+    def load(import_delay=0.0, latency=0.0, result_rows=250):
+        benchmark._install_fake_bigquery(latency, result_rows, import_delay)
+        monkeypatch.setenv("BQ_METADATA_CACHE_DIR", str(tmp_path / "metadata"))
+        sys.modules.pop("lambda_function", None)
+        return __import__("lambda_function")
+
+    yield load
+    benchmark._uninstall_fake_bigquery()
+    sys.modules.pop("lambda_function", None)
+
+
+def call(lambda_function, tool_name, event):
+    context = types.SimpleNamespace(
+        client_context=types.SimpleNamespace(custom={"bedrockAgentCoreToolName": f"lambda___{tool_name}"})
+    )
+    response = lambda_function.lambda_handler(event, context)
+    return response["statusCode"], json.loads(response["body"])
+
+
+def test_lightweight_tool_does_not_import_bigquery(load_lambda):
+    lambda_function = load_lambda()
+
+    status, _ = call(lambda_function, "get_googledrive", {})
+
+    assert status == 200
+    assert "google.cloud.bigquery" not in sys.modules
+    assert lambda_function.bigquery is None
+
+
+def test_unknown_and_substring_tool_names_are_not_dispatched(load_lambda):
+    lambda_function = load_lambda()
+
+    assert call(lambda_function, "get_bigquery_tables", {})[1] == {"message": "Unknown tool"}
+    assert call(lambda_function, "unknown", {})[1] == {"message": "Unknown tool"}
+
+
+def test_concurrent_first_calls_wait_for_slow_import(load_lambda):
+    lambda_function = load_lambda(import_delay=0.3)
+    results = []
+
+    def first_call():
+        results.append(lambda_function._create_bq_client("bench-project"))
+
+    threads = [threading.Thread(target=first_call) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(results) == 5
+    assert all(client is results[0] for client in results)
+    assert lambda_function._client_stats["created"] == 1
+
+
+def test_cold_batch_succeeds_for_every_operation(load_lambda):
+    lambda_function = load_lambda(import_delay=0.3)
+    operations = [
+        {"tool": "get_bigquery", "arguments": {"project_id": "bench-project", "dataset_id": dataset}}
+        for dataset in ("mydataset", "staging", "archive")
+    ]
+
+    status, body = call(lambda_function, "batch", {"operations": operations})
+
+    assert status == 200
+    assert body["failed"] == 0, body["results"]
+    assert [r["result"]["dataset_id"] for r in body["results"]] == ["mydataset", "staging", "archive"]
+    # 3操作で同じクライアントを共有する
+    assert lambda_function._client_stats["created"] == 1
+
+
+def test_batch_reports_errors_per_operation(load_lambda):
+    lambda_function = load_lambda()
+    operations = [
+        {"tool": "get_googledrive"},
+        {"tool": "batch", "arguments": {"operations": []}},
+        {"tool": "no_such_tool"},
+        "not an operation",
+    ]
+
+    status, body = call(lambda_function, "batch", {"operations": operations})
+
+    assert status == 200
+    assert [r["statusCode"] for r in body["results"]] == [200, 400, 400, 400]
+    assert body["succeeded"] == 1 and body["failed"] == 3
+
+
+def test_batch_rejects_empty_and_oversized_requests(load_lambda):
+    lambda_function = load_lambda()
+
+    assert call(lambda_function, "batch", {"operations": []})[0] == 400
+    too_many = [{"tool": "get_googledrive"}] * (lambda_function._BATCH_MAX_OPERATIONS + 1)
+    assert call(lambda_function, "batch", {"operations": too_many})[0] == 400
+
+
+def test_execute_sql_pages_through_results_with_cursor(load_lambda):
+    lambda_function = load_lambda(result_rows=250)
+    event = {"project_id": "bench-project", "sql": "SELECT * FROM TRANSACTION_DATA", "max_rows": 100}
+
+    offsets = []
+    while True:
+        status, body = call(lambda_function, "execute_sql", event)
+        assert status == 200, body
+        offsets.append((body["offset"], len(body["rows"])))
+        if not body["next_cursor"]:
+            break
+        event = {"project_id": "bench-project", "cursor": body["next_cursor"], "max_rows": 100}
+
+    assert offsets == [(0, 100), (100, 100), (200, 50)]
+
+
+def test_execute_sql_rejects_non_select(load_lambda):
+    lambda_function = load_lambda()
+
+    status, _ = call(lambda_function, "execute_sql", {"project_id": "bench-project", "sql": "DELETE FROM t WHERE 1=1"})
+
+    assert status == 400
+
+
+def test_execute_sql_rejects_forged_and_tampered_cursors(load_lambda):
+    lambda_function = load_lambda(result_rows=250)
+    _, body = call(lambda_function, "execute_sql", {"project_id": "bench-project", "sql": "SELECT 1", "max_rows": 10})
+    payload, signature = body["next_cursor"].split(".")
+
+    # 任意のテーブルを指すcursor（署名なし・改ざん）は読み取り専用チェックを迂回できない
+    state = json.loads(lambda_function._b64decode(payload))
+    state["table"] = "other-project.private.salaries"
+    tampered = f"{lambda_function._b64encode(json.dumps(state).encode())}.{signature}"
+    unsigned = lambda_function._b64encode(json.dumps(state).encode())
+
+    for cursor in (tampered, unsigned, "not-a-cursor"):
+        status, body = call(lambda_function, "execute_sql", {"project_id": "bench-project", "cursor": cursor})
+        assert status == 400, body
+
+
+def test_execute_sql_rejects_expired_cursor(load_lambda, monkeypatch):
+    lambda_function = load_lambda(result_rows=250)
+    _, body = call(lambda_function, "execute_sql", {"project_id": "bench-project", "sql": "SELECT 1", "max_rows": 10})
+    monkeypatch.setattr(lambda_function, "_CURSOR_MAX_AGE", -1)
+
+    status, body = call(lambda_function, "execute_sql", {"project_id": "bench-project", "cursor": body["next_cursor"]})
+
+    assert status == 400
+    assert "期限" in body["error"]
+
+
+def test_take_rows_caps_utf8_bytes_not_characters(load_lambda, monkeypatch):
+    lambda_function = load_lambda()
+    monkeypatch.setattr(lambda_function, "_SQL_MAX_RESPONSE_BYTES", 1000)
+    rows = [{"v": "あ" * 100} for _ in range(20)]
+
+    page = []
+    size, full = lambda_function._take_rows(rows, page, 0, max_rows=100)
+
+    assert full
+    assert len(page) == 3
+    assert sum(len(json.dumps(row, ensure_ascii=False).encode("utf-8")) + 1 for row in page) == size <= 1000
+
+
+@pytest.mark.parametrize("tool_name", ["get_bigquery", "get_table_schemas", "execute_sql"])
+@pytest.mark.parametrize("ids", [
+    {"project_id": "bench-project", "dataset_id": "x` UNION ALL SELECT * FROM `secret.t"},
+    {"project_id": "bench-project", "dataset_id": "../../etc/passwd"},
+    {"project_id": "Bench Project", "dataset_id": "mydataset"},
+    {"project_id": "bench-project`; --", "dataset_id": "mydataset"},
+])
+def test_invalid_ids_are_rejected_before_use(load_lambda, tool_name, ids):
+    lambda_function = load_lambda()
+
+    status, body = call(lambda_function, tool_name, dict(ids, sql="SELECT 1"))
+
+    assert status == 400, body
+    assert "形式が不正" in body["error"]
+
+
+def test_valid_ids_are_accepted(load_lambda):
+    lambda_function = load_lambda()
+
+    lambda_function._validate_ids("bench-project", "my_dataset_01")
+    lambda_function._validate_ids("example.com:bench-project", "DATASET")
+
+
+class NotFound(Exception):
+    pass
+
+
+class FailedPrecondition(Exception):
+    pass
+
+
+@pytest.fixture
+def fake_storage(monkeypatch):
+    """Storage Read API（google-cloud-bigquery-storage, pyarrow）の偽モジュールを追加する関数"""
+    import datetime
+    import time
+
+    storage = types.SimpleNamespace(clients=[], expires_in=6 * 3600, read_error=None)
+
+    class Page:
+        def __init__(self, rows):
+            self.rows = rows
+
+        def to_arrow(self):
+            return types.SimpleNamespace(to_pylist=lambda: self.rows)
+
+    class BigQueryReadClient:
+        def __init__(self, credentials=None):
+            storage.clients.append(self)
+
+        def create_read_session(self, parent, read_session, max_stream_count):
+            expire_time = datetime.datetime.fromtimestamp(time.time() + storage.expires_in, datetime.timezone.utc)
+            return types.SimpleNamespace(streams=[types.SimpleNamespace(name="streams/0")], expire_time=expire_time)
+
+        def read_rows(self, stream, offset=0):
+            if storage.read_error is not None:
+                raise storage.read_error
+            rows = [{"i": i} for i in range(offset, 250)]
+            pages = [Page(rows[start:start + 50]) for start in range(0, len(rows), 50)]
+            return types.SimpleNamespace(rows=lambda: types.SimpleNamespace(pages=pages))
+
+    bigquery_storage = types.ModuleType("google.cloud.bigquery_storage")
+    bigquery_storage.BigQueryReadClient = BigQueryReadClient
+    bigquery_storage.types = types.SimpleNamespace(
+        ReadSession=lambda **kwargs: kwargs,
+        DataFormat=types.SimpleNamespace(ARROW="ARROW")
+    )
+    api_core = types.ModuleType("google.api_core")
+    api_core.exceptions = types.SimpleNamespace(NotFound=NotFound, FailedPrecondition=FailedPrecondition)
+
+    def install():
+        # load_lambdaがgoogle.*を入れ替えるため、読み込んだ後に追加する
+        monkeypatch.setitem(sys.modules, "pyarrow", types.ModuleType("pyarrow"))
+        monkeypatch.setitem(sys.modules, "google.api_core", api_core)
+        monkeypatch.setitem(sys.modules, "google.cloud.bigquery_storage", bigquery_storage)
+        return storage
+
+    return install
+
+
+def test_discarding_client_also_recreates_read_client(load_lambda, fake_storage):
+    lambda_function = load_lambda()
+    storage = fake_storage()
+    lambda_function._create_bq_client("bench-project")
+    first = lambda_function._create_read_client()
+    assert lambda_function._create_read_client() is first
+
+    lambda_function._discard_bq_client("bench-project")
+
+    assert lambda_function._create_read_client() is not first
+    assert len(storage.clients) == 2
+
+
+@pytest.mark.parametrize("expires_in, read_error", [
+    # 読み取りセッションの期限が（余裕を見た期限も含めて）切れている
+    (60, None),
+    # 期限前でもストリームが読めなくなっている
+    (6 * 3600, NotFound("stream not found")),
+    (6 * 3600, FailedPrecondition("session expired")),
+])
+def test_execute_sql_rejects_cursor_whose_read_session_expired(load_lambda, fake_storage, expires_in, read_error):
+    lambda_function = load_lambda(result_rows=250)
+    storage = fake_storage()
+    storage.expires_in = expires_in
+    status, body = call(lambda_function, "execute_sql", {"project_id": "bench-project", "sql": "SELECT 1", "max_rows": 100})
+    assert status == 200, body
+    assert len(body["rows"]) == 100
+
+    storage.read_error = read_error
+    status, body = call(lambda_function, "execute_sql", {"project_id": "bench-project", "cursor": body["next_cursor"]})
+
+    assert status == 400, body
+    assert "期限" in body["error"]
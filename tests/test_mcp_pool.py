@@ -0,0 +1,51 @@
+"""
+MCPセッションプール（demo/chat/mcp_pool.py）のテスト
+"""
+import asyncio
+import time
+
+import pytest
+
+pytest.importorskip("mcp")
+
+from chat.mcp_pool import MCPSessionPool
+
+
+def test_call_tool_sync_times_out_while_waiting_for_a_session(monkeypatch):
+    pool = MCPSessionPool("https://gateway.invalid/mcp", token_manager=None, size=1)
+
+    async def stuck_call(name, arguments, timeout):
+        # セッションの空き待ちで止まっている呼び出し
+        await asyncio.sleep(60)
+
+    monkeypatch.setattr(pool, "_call_tool", stuck_call)
+    started = time.monotonic()
+    try:
+        with pytest.raises(asyncio.TimeoutError):
+            pool.call_tool_sync("lambda___get_bigquery", {}, timeout=0.2)
+    finally:
+        pool.close()
+
+    assert time.monotonic() - started < 5
+
+
+@pytest.mark.parametrize("delay, retries", [(0.0, 2), (10.0, 0)])
+def test_retries_count_only_attempts_that_are_made(monkeypatch, delay, retries):
+    from chat.resilience import GatewayResilience
+
+    resilience = GatewayResilience(max_attempts=3, idempotent_tools=["get_bigquery"])
+    monkeypatch.setattr(resilience, "backoff", lambda attempt: delay)
+    pool = MCPSessionPool("https://gateway.invalid/mcp", token_manager=None, resilience=resilience)
+
+    async def failing_call(name, arguments, timeout):
+        raise ConnectionError("reset by peer")
+
+    monkeypatch.setattr(pool, "_call_tool_once", failing_call)
+    try:
+        with pytest.raises(ConnectionError):
+            # 待ち時間が期限を超える場合は再試行せずに失敗する
+            pool.call_tool_sync("lambda___get_bigquery", {}, timeout=1)
+    finally:
+        pool.close()
+
+    assert resilience.stats["retries"] == retries
@@ -0,0 +1,146 @@
+"""
+ゲートウェイ呼び出しの耐障害性（demo/chat/resilience.py）のテスト
+
+時刻と待ち時間は偽の時計に置き換える。
+"""
+import asyncio
+import types
+
+import pytest
+
+from chat import resilience
+from chat.resilience import CircuitBreaker, CircuitOpenError, GatewayResilience, RateLimitExceeded, TokenBucket
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    async def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(resilience, "time", types.SimpleNamespace(monotonic=clock.monotonic))
+    monkeypatch.setattr(resilience, "asyncio", types.SimpleNamespace(sleep=clock.sleep))
+    return clock
+
+
+def test_token_bucket_allows_burst_then_throttles(clock):
+    bucket = TokenBucket(rate=2, burst=3, max_wait=5)
+
+    async def acquire(count):
+        for _ in range(count):
+            await bucket.acquire()
+
+    asyncio.run(acquire(4))
+
+    assert clock.sleeps == [0.5]
+    assert bucket.stats == {"acquired": 4, "throttled": 1, "rejected": 0}
+
+
+def test_token_bucket_rejects_when_wait_exceeds_max_wait(clock):
+    bucket = TokenBucket(rate=1, burst=1, max_wait=0.5)
+    asyncio.run(bucket.acquire())
+
+    with pytest.raises(RateLimitExceeded):
+        asyncio.run(bucket.acquire())
+
+    assert bucket.stats["rejected"] == 1
+    clock.now += 1
+    asyncio.run(bucket.acquire())
+    assert clock.sleeps == []
+
+
+def test_token_bucket_without_rate_does_not_limit(clock):
+    bucket = TokenBucket(rate=0, burst=1)
+
+    for _ in range(10):
+        asyncio.run(bucket.acquire())
+
+    assert bucket.stats["acquired"] == 10
+    assert clock.sleeps == []
+
+
+def test_circuit_breaker_opens_after_consecutive_failures(clock):
+    breaker = CircuitBreaker("lambda", failure_threshold=2, reset_timeout=30)
+    for _ in range(2):
+        breaker.before_call()
+        breaker.record_failure()
+
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_circuit_breaker_success_resets_failure_count(clock):
+    breaker = CircuitBreaker("lambda", failure_threshold=2)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+
+    assert breaker.state == "closed"
+
+
+def test_circuit_breaker_allows_one_trial_after_reset_timeout(clock):
+    breaker = CircuitBreaker("lambda", failure_threshold=1, reset_timeout=30)
+    breaker.record_failure()
+    clock.now += 30
+
+    breaker.before_call()
+    assert breaker.state == "half_open"
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+    breaker.record_success()
+    assert breaker.state == "closed"
+    breaker.before_call()
+
+
+def test_circuit_breaker_reopens_when_trial_fails(clock):
+    breaker = CircuitBreaker("lambda", failure_threshold=1, reset_timeout=30)
+    breaker.record_failure()
+    clock.now += 30
+    breaker.before_call()
+
+    breaker.record_failure()
+
+    assert breaker.state == "open"
+    assert breaker.stats["opened"] == 2
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_released_trial_lets_the_next_call_try(clock):
+    breaker = CircuitBreaker("lambda", failure_threshold=1, reset_timeout=30)
+    breaker.record_failure()
+    clock.now += 30
+    breaker.before_call()
+
+    breaker.release()
+
+    breaker.before_call()
+    assert breaker.state == "half_open"
+
+
+def test_gateway_resilience_retries_only_idempotent_tools():
+    gateway = GatewayResilience(max_attempts=3, idempotent_tools=["get_bigquery"])
+
+    assert gateway.attempts_for("lambda___get_bigquery") == 3
+    assert gateway.attempts_for("lambda___update_table") == 1
+    assert gateway.breaker_for("lambda___get_bigquery") is gateway.breaker_for("lambda___execute_sql")
+
+
+def test_backoff_is_capped():
+    gateway = GatewayResilience(base_delay=0.2, max_delay=1.0)
+
+    assert all(0 <= gateway.backoff(attempt) <= 1.0 for attempt in range(10))
+    # 待ち時間の計算だけでは再試行に数えない（実際に再試行する呼び出し側で数える）
+    assert gateway.stats["retries"] == 0
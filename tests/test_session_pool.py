@@ -0,0 +1,93 @@
+"""
+セッションごとの会話状態プール（compass/session_pool.py）のテスト
+"""
+import asyncio
+import threading
+import types
+
+from session_pool import SessionPool
+
+
+def make_agent(session_id):
+    return types.SimpleNamespace(session_id=session_id, messages=[])
+
+
+def test_pinned_session_is_not_evicted_while_waiting_for_its_lock():
+    pool = SessionPool(make_agent, idle_ttl=0)
+    state = pool._get_or_create("a")
+
+    # 他のセッションの解放でアイドル・件数上限の破棄が走っても、取得済みのセッションは残る
+    pool.max_sessions = 1
+    with pool.session("b"):
+        pass
+
+    with pool.session("a") as again:
+        assert again is state
+    assert pool._sessions["a"].in_use == 1
+    pool._unpin(state)
+
+
+def test_idle_sessions_are_evicted_after_release():
+    pool = SessionPool(make_agent, idle_ttl=0)
+    with pool.session("a"):
+        pass
+    with pool.session("b"):
+        pass
+
+    assert list(pool._sessions) == ["b"]
+    assert pool.get_status()["evictions"] == 1
+
+
+def test_factory_runs_outside_the_pool_lock():
+    pool = SessionPool(lambda session_id: (pool.get_status(), make_agent(session_id))[1])
+
+    with pool.session("a") as state:
+        assert state.agent.session_id == "a"
+
+
+def test_concurrent_requests_share_one_agent():
+    started = threading.Barrier(2)
+
+    def slow_factory(session_id):
+        started.wait(timeout=5)
+        return make_agent(session_id)
+
+    pool = SessionPool(slow_factory)
+    agents = []
+
+    def use():
+        with pool.session("a") as state:
+            agents.append(state.agent)
+
+    threads = [threading.Thread(target=use) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=5)
+
+    assert len(agents) == 2 and agents[0] is agents[1]
+    assert pool._sessions["a"].in_use == 0
+
+
+def test_asession_releases_lock_when_cancelled_while_waiting():
+    pool = SessionPool(make_agent)
+
+    async def scenario():
+        with pool.session("a") as state:
+            async def wait_for_session():
+                async with pool.asession("a"):
+                    pass
+            task = asyncio.create_task(wait_for_session())
+            await asyncio.sleep(0.05)
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+        # 取得待ちだったスレッドがロックを取得した後に解放されるのを待つ
+        for _ in range(100):
+            if not state.lock.locked() and state.in_use == 0:
+                break
+            await asyncio.sleep(0.01)
+        return state
+
+    state = asyncio.run(scenario())
+    assert not state.lock.locked()
+    assert state.in_use == 0
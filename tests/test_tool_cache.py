@@ -0,0 +1,37 @@
+"""
+ツール結果キャッシュ（compass.tool_cache）のテスト
+"""
+import json
+
+import pytest
+
+pytest.importorskip("strands")
+
+from tool_cache import ToolResultCache
+
+
+def result(text, status="success"):
+    return {"toolUseId": "t1", "status": status, "content": [{"text": text}]}
+
+
+def lambda_result(status_code, body):
+    return result(json.dumps({"statusCode": status_code, "body": json.dumps(body)}))
+
+
+@pytest.mark.parametrize("value, cached", [
+    (lambda_result(200, {"datasets": []}), True),
+    (result("晴れ"), True),
+    (lambda_result(500, {"error": "boom"}), False),
+    (lambda_result(400, {"error": "invalid project_id"}), False),
+    (lambda_result(200, {"error": "unknown tool"}), False),
+    (result(json.dumps({"error": "boom"})), False),
+    (result("boom", status="error"), False),
+])
+def test_finish_caches_only_successful_payloads(value, cached):
+    cache = ToolResultCache({"get_bigquery": 60})
+    key = ToolResultCache.make_key("lambda___get_bigquery", {})
+    cache.begin(key)
+
+    cache.finish(key, value, 60)
+
+    assert (cache.lookup(key)[0] is not None) == cached
@@ -0,0 +1,90 @@
+"""
+ツール事前選択インデックス（BM25）のテスト
+
+strandsに依存しないdemo側（chat.tool_index）で検証する。
+"""
+from chat.tool_index import SEARCH_TOOL_NAME, ToolIndex, tokenize
+
+
+def definition(name, description, **properties):
+    return {
+        "name": name,
+        "description": description,
+        "inputSchema": {"properties": {key: {"description": value} for key, value in properties.items()}}
+    }
+
+
+DEFINITIONS = [
+    definition("lambda___get_bigquery", "BigQueryのデータセットとテーブル一覧を取得", dataset_id="データセットID"),
+    definition("lambda___execute_sql", "BigQueryでSELECT文を実行して結果を返す", sql="実行するSQL"),
+    definition("lambda___get_googledrive", "Google Driveのファイル一覧を取得"),
+    definition("weather___get_forecast", "指定した都市の天気予報を取得", city="都市名"),
+    definition("weather___get_alerts", "気象警報を取得", region="地域"),
+    definition("calendar___list_events", "カレンダーの予定一覧を取得"),
+    definition(SEARCH_TOOL_NAME, "ゲートウェイのツールをセマンティック検索", query="検索クエリ"),
+]
+
+
+def test_tokenize_splits_snake_case_and_japanese_bigrams():
+    assert tokenize("execute_sql 天気予報") == ["execute", "sql", "天気", "気予", "予報"]
+
+
+def test_select_ranks_relevant_tools():
+    index = ToolIndex(DEFINITIONS)
+
+    selection = index.select("東京の天気予報を教えて", top_k=2)
+
+    assert selection.confident
+    assert "weather___get_forecast" in selection.names
+    assert "lambda___get_googledrive" not in selection.names
+    assert SEARCH_TOOL_NAME not in selection.names
+    # カタログの順序を保つ
+    assert selection.names == [name for name in index.names if name in selection.names]
+
+
+def test_select_falls_back_to_search_tool_when_not_confident():
+    index = ToolIndex(DEFINITIONS)
+
+    selection = index.select("hello", top_k=2)
+
+    assert not selection.confident
+    assert SEARCH_TOOL_NAME in selection.names
+
+
+def test_select_returns_all_tools_without_search_tool():
+    definitions = [d for d in DEFINITIONS if d["name"] != SEARCH_TOOL_NAME]
+    index = ToolIndex(definitions)
+
+    selection = index.select("hello", top_k=2)
+
+    assert not selection.confident
+    assert selection.names == index.names
+
+
+def test_select_returns_all_tools_when_catalog_is_small():
+    index = ToolIndex(DEFINITIONS[:3])
+
+    assert index.select("天気", top_k=5).names == index.names
+
+
+def test_pinned_tools_match_full_and_unprefixed_names():
+    index = ToolIndex(DEFINITIONS)
+
+    selection = index.select("天気予報", top_k=1, pinned=["lambda___execute_sql", "list_events"])
+
+    assert {"lambda___execute_sql", "calendar___list_events", "weather___get_forecast"} <= set(selection.names)
+
+
+def test_unknown_names_reports_pins_that_match_nothing():
+    index = ToolIndex(DEFINITIONS)
+
+    assert index.unknown_names(["execute_sql", "weather___get_alerts", "missing_tool"]) == ["missing_tool"]
+    assert index.resolve_names(["missing_tool"]) == []
+
+
+def test_find_mentioned_ignores_search_tool():
+    index = ToolIndex(DEFINITIONS)
+
+    text = f"{SEARCH_TOOL_NAME}: weather___get_alerts が該当します"
+
+    assert index.find_mentioned(text) == ["weather___get_alerts"]